@@ -1,16 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List
+from typing import List, Optional
 from app.db.database import get_db
 from app.api.models.schemas import (
     AdminUserListResponse,
     AdminUserUpdate,
     MessageResponse,
+    RateLimitConfig,
     UserResponse
 )
 from app.services.auth_service import AuthService, security
 from app.db.models import User, ChatSession
+from app.core.config import settings
+from app.core.serialization import FastJSONResponse
+from app.core.diagnostics import loop_lag_monitor, slow_request_log, sampling_profiler
+from app.core.tracing import tracer
+from app.services.concurrency_service import concurrency_limiter
+from app.services.inference_service import inference_service
+from app.services.degrade_service import degrade_controller
+from app.services.metrics_service import MetricsService
+from app.services.usage_service import UsageService
+from app.services.rate_limit_service import rate_limiter, default_limits
+from app.services.persistence_service import write_behind
+from app.services.push_service import push_hub
+from app.services.archive_service import ArchiveService
+from app.services.semantic_service import SemanticService
+from app.services.deletion_service import DeletionService, account_purger
+import os
+import threading
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -35,20 +55,22 @@ async def get_all_users(
     users = db.query(
         User,
         func.count(ChatSession.id).label('session_count')
-    ).outerjoin(ChatSession).group_by(User.id).limit(limit).offset(offset).all()
-
-    return [
-        AdminUserListResponse(
-            id=user.id,
-            username=user.username,
-            email=user.email,
-            is_active=user.is_active,
-            is_admin=user.is_admin,
-            created_at=user.created_at,
-            session_count=session_count
-        )
+    ).outerjoin(
+        ChatSession, ChatSession.user_id == User.id
+    ).filter(User.deleted_at.is_(None)).group_by(User.id).order_by(User.id).limit(limit).offset(offset).all()
+
+    return FastJSONResponse(content=[
+        {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "is_active": user.is_active,
+            "is_admin": user.is_admin,
+            "created_at": user.created_at,
+            "session_count": session_count
+        }
         for user, session_count in users
-    ]
+    ])
 
 @router.get("/users/{user_id}", response_model=UserResponse)
 async def get_user_by_id(
@@ -57,7 +79,7 @@ async def get_user_by_id(
     current_user: User = Depends(get_current_admin_user)
 ):
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -73,7 +95,7 @@ async def update_user_by_id(
     current_user: User = Depends(get_current_admin_user)
 ):
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -92,11 +114,13 @@ async def update_user_by_id(
             detail="Cannot deactivate your own account"
         )
 
-    if update_data.is_active is not None:
+    if update_data.is_active is not None and update_data.is_active != user.is_active:
         user.is_active = update_data.is_active
+        UsageService.bump_counters(db, active_users=1 if user.is_active else -1)
 
-    if update_data.is_admin is not None:
+    if update_data.is_admin is not None and update_data.is_admin != user.is_admin:
         user.is_admin = update_data.is_admin
+        UsageService.bump_counters(db, admin_users=1 if user.is_admin else -1)
 
     db.commit()
     db.refresh(user)
@@ -115,15 +139,16 @@ async def delete_user(
             detail="Cannot delete your own account"
         )
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    db.delete(user)
-    db.commit()
+    # Returns at once; the account's chats are deleted in chunks in the background.
+    DeletionService.tombstone_user(db, user)
+    account_purger.wake()
     return MessageResponse(message="User deleted successfully")
 
 @router.get("/stats")
@@ -132,15 +157,215 @@ async def get_system_stats(
     current_user: User = Depends(get_current_admin_user)
 ):
 
-    total_users = db.query(func.count(User.id)).scalar()
-    active_users = db.query(func.count(User.id)).filter(User.is_active == True).scalar()
-    total_sessions = db.query(func.count(ChatSession.id)).scalar()
-    admin_count = db.query(func.count(User.id)).filter(User.is_admin == True).scalar()
+    # Maintained on write (and reconciled periodically), so this reads a handful
+    # of rows instead of scanning the users and sessions tables.
+    counters = UsageService.get_counters(db)
+
+    return {
+        "total_users": counters["users"],
+        "active_users": counters["active_users"],
+        "inactive_users": counters["users"] - counters["active_users"],
+        "admin_users": counters["admin_users"],
+        "total_chat_sessions": counters["sessions"],
+        "total_messages": counters["messages"]
+    }
+
+@router.get("/archive")
+async def get_archive_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    return ArchiveService.stats(db)
+
+@router.get("/embeddings")
+async def get_embedding_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    return SemanticService.stats(db)
+
+@router.get("/stats/timeseries")
+async def get_stats_timeseries(
+    period: str = "hour",
+    buckets: int = 24,
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    if period not in ("hour", "day") or not 1 <= buckets <= 1000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="period must be 'hour' or 'day' and buckets between 1 and 1000"
+        )
+
+    return FastJSONResponse(content={
+        "period": period,
+        "user_id": user_id,
+        "series": UsageService.get_timeseries(db, period, buckets, user_id or 0)
+    })
+
+@router.get("/rate-limits")
+async def get_rate_limits(
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    return {
+        "enabled": settings.RATE_LIMIT_ENABLED,
+        "defaults": default_limits(),
+        "config": rate_limiter.get_config()
+    }
+
+@router.put("/rate-limits")
+async def update_rate_limits(
+    config: RateLimitConfig,
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    unknown_roles = set(config.roles) - {"user", "admin"}
+    if unknown_roles:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown roles: {', '.join(sorted(unknown_roles))}"
+        )
+
+    # Unset fields fall back to the role defaults; 0 disables that bucket.
+    stored = {
+        "roles": {role: rule.model_dump(exclude_none=True) for role, rule in config.roles.items()},
+        "users": {str(user_id): rule.model_dump(exclude_none=True) for user_id, rule in config.users.items()}
+    }
+    rate_limiter.set_config(stored)
+    return {"enabled": settings.RATE_LIMIT_ENABLED, "config": stored}
+
+@router.delete("/rate-limits", response_model=MessageResponse)
+async def reset_rate_limits(
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    rate_limiter.reset_config()
+    return MessageResponse(message="Rate limits reset to defaults")
+
+@router.get("/diagnostics")
+async def get_diagnostics(
+    current_user: User = Depends(get_current_admin_user)
+):
 
     return {
-        "total_users": total_users,
-        "active_users": active_users,
-        "inactive_users": total_users - active_users,
-        "admin_users": admin_count,
-        "total_chat_sessions": total_sessions
+        "enabled": settings.DIAGNOSTICS_ENABLED,
+        "slow_request_ms": settings.SLOW_REQUEST_MS,
+        "loop_lag_warn_ms": settings.LOOP_LAG_WARN_MS,
+        "event_loop_lag": loop_lag_monitor.stats(),
+        "loop_stalls": list(loop_lag_monitor.stalls),
+        "slow_requests": list(slow_request_log.entries)
     }
+
+@router.get("/traces")
+async def get_traces(
+    limit: int = 50,
+    min_ms: float = 0.0,
+    name: Optional[str] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    # Per worker process: the most recent finished traces of this worker, newest first.
+    if limit < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit must be >= 1"
+        )
+    return FastJSONResponse(content={
+        "enabled": settings.TRACING_ENABLED,
+        "sample_rate": settings.TRACE_SAMPLE_RATE,
+        "exported": tracer.exported,
+        "worker_pid": os.getpid(),
+        "traces": tracer.recent(limit, min_ms, name)
+    })
+
+@router.get("/traces/{trace_id}")
+async def get_trace(
+    trace_id: str,
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    trace = tracer.find(trace_id)
+    if trace is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trace not found in this worker's buffer"
+        )
+    return FastJSONResponse(content=trace)
+
+@router.get("/metrics/inference")
+async def get_inference_metrics(
+    group_by: str = "hour",
+    hours: int = 24,
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    if group_by not in ("hour", "user", "route") or hours < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="group_by must be 'hour', 'user' or 'route' and hours >= 1"
+        )
+
+    return FastJSONResponse(content={
+        "group_by": group_by,
+        "hours": hours,
+        "buckets": MetricsService.aggregate_inference(db, group_by, hours, user_id)
+    })
+
+@router.get("/concurrency")
+async def get_concurrency(
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    # Per worker process; with WEB_CONCURRENCY > 1 each worker tunes its own limit.
+    return dict(
+        concurrency_limiter.stats(),
+        coalescing=inference_service.coalescing_stats(),
+        routing=inference_service.routing_stats(),
+        write_behind=write_behind.stats(),
+        websockets=push_hub.stats(),
+        worker_pid=os.getpid()
+    )
+
+@router.get("/degrade")
+async def get_degrade_mode(
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    return dict(degrade_controller.stats(), worker_pid=os.getpid())
+
+@router.get("/diagnostics/profile", response_class=PlainTextResponse)
+async def profile_event_loop(
+    seconds: float = 5.0,
+    interval_ms: float = 5.0,
+    current_user: User = Depends(get_current_admin_user)
+):
+
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiler is disabled (set PROFILER_ENABLED=true)"
+        )
+
+    if seconds <= 0 or seconds > settings.PROFILER_MAX_SECONDS or interval_ms < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"seconds must be in (0, {settings.PROFILER_MAX_SECONDS}] and interval_ms >= 1"
+        )
+
+    # Sample the event loop thread from a worker thread so blocking calls show up.
+    loop_thread_id = threading.get_ident()
+    try:
+        stacks = await run_in_threadpool(
+            sampling_profiler.profile, loop_thread_id, seconds, interval_ms / 1000.0
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    return PlainTextResponse(stacks)
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+import asyncio
+import json
+import time
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi.security import HTTPAuthorizationCredentials
+from pydantic import ValidationError
 from fastapi.responses import StreamingResponse, Response
 from sqlalchemy.orm import Session
-from typing import List
-import json
+from typing import List, Optional
 from datetime import datetime
 from app.db.database import get_db, SessionLocal
 from app.api.models.schemas import (
@@ -10,57 +14,334 @@ from app.api.models.schemas import (
     InferenceResponse,
     ChatSessionCreate,
     ChatSessionResponse,
+    ChatSessionDetailResponse,
     ChatSessionListResponse,
+    SemanticSearchResult,
     ChatSessionUpdate,
     MessageResponse,
-    ChatMessageResponse
+    ChatMessageResponse,
+    BranchSelect
 )
 from app.services.auth_service import AuthService, security
-from app.services.chat_service import ChatService
-from app.services.inference_service import inference_service
-from app.db.models import User, ChatMessage
+from app.services.chat_service import ChatService, ChatVersions, MESSAGE_FIELDS, ACTIVE_LEAF, estimate_tokens
+from app.core.serialization import FastJSONResponse, dumps, dumps_str
+from app.core.tracing import tracer
+from app.services.inference_service import inference_service, MAIN_BACKEND
+from app.services.concurrency_service import InferenceBusyError
+from app.services.degrade_service import degrade_controller
+from app.services.metrics_service import MetricsService
+from app.services.rate_limit_service import rate_limiter
+from app.services.summary_service import summary_service
+from app.services.persistence_service import write_behind
+from app.services.import_service import ImportService
+from app.services.semantic_service import SemanticService
+from app.services.push_service import PushChannel, push_hub
+from app.core.config import settings
+from app.db.models import User, ChatSession, ChatMessage
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+# Model-written titles in flight; holds references until they finish.
+_title_tasks = set()
+
 def get_current_user(db: Session = Depends(get_db), credentials = Depends(security)) -> User:
 
     return AuthService.get_current_user(credentials, db)
 
-@router.post("/inference", response_model=InferenceResponse)
-async def generate_response(
-    request: InferenceRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
+def _etag_matches(request: Request, etag: str) -> bool:
+
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+def _cache_headers(etag: str) -> dict:
+
+    # no-cache: the browser keeps the body but revalidates with If-None-Match every time.
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+def _speculative_params(request: InferenceRequest) -> dict:
+
+    return {
+        "n_max": request.draft_max,
+        "n_min": request.draft_min,
+        "p_min": request.draft_p_min
+    }
+
+def _generated_tokens(stats: dict, text: str) -> int:
+
+    timings = stats.get("timings") or {}
+    return timings.get("completion_tokens") or (estimate_tokens(text) if text else 0)
+
+def _inference_policy(request: InferenceRequest) -> tuple:
+
+    if request.model and request.model not in inference_service.backends:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown model: {request.model}. Available: {', '.join(inference_service.backends)}"
+        )
+    if request.model and not inference_service.backends[request.model].healthy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Model {request.model} is unavailable",
+            headers={"Retry-After": str(int(settings.HEALTH_POLL_SECONDS * 2) or 1)}
+        )
+    mode = degrade_controller.mode()
+    policy = degrade_controller.policy(mode)
+    if request.priority == "batch" and not policy["accept_batch"]:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Batch requests are paused while the backend is {mode}",
+            headers={"Retry-After": str(int(settings.DEGRADE_RECOVERY_SECONDS)), "X-Degrade-Mode": mode}
+        )
+    return mode, policy
+
+def _title_from_prompt(prompt: str) -> str:
+
+    words = prompt.split()[:10]
+    title = " ".join(words)
+    if len(title) > 50:
+        title = title[:47] + "..."
+    elif len(words) == 10:
+        title = title + "..."
+    return title
+
+def _inference_task(request: InferenceRequest) -> str:
+
+    return "batch" if request.priority == "batch" else "chat"
+
+def _turn_session(db: Session, request: InferenceRequest, user: User):
 
     if request.session_id:
-        session = ChatService.get_session(db, request.session_id, current_user)
+        session = ChatService.get_session(db, request.session_id, user)
         if not session:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Session not found"
             )
-    else:
-
-        session = ChatService.create_session(
-            db,
-            current_user,
-            ChatSessionCreate(title=request.prompt[:50] + "..." if len(request.prompt) > 50 else request.prompt)
-        )
+        return session
 
-    user_message = ChatService.add_message(
+    return ChatService.create_session(
         db,
-        session.id,
-        role="user",
-        content=request.prompt
+        user,
+        ChatSessionCreate(title=request.prompt[:50] + "..." if len(request.prompt) > 50 else request.prompt)
     )
 
+async def _begin_turn(db: Session, session, request: InferenceRequest, user_id: int) -> ChatMessage:
+
+    # Writes go through the group-commit queue; the message is durable when this returns.
+    # The writer loads its own copy of the session: the request's ORM object
+    # belongs to another thread and database session, and must not change if
+    # the batch is rolled back and replayed.
+    session_id = session.id
+    tracer.set_attributes(session_id=session_id)
+
+    def write(wdb: Session) -> ChatMessage:
+        return ChatService.start_turn(
+            wdb,
+            wdb.get(ChatSession, session_id),
+            request.prompt,
+            parent_message_id=request.parent_message_id,
+            regenerate=request.regenerate,
+            commit=False
+        )
+
+    with tracer.span("chat.begin_turn"):
+        user_message = await write_behind.submit(write)
+        ChatVersions.bump(user_id)
+        # The active leaf moved in another database session.
+        db.refresh(session)
+    return user_message
+
+async def _finish_turn(
+    session_id: int,
+    user_id: int,
+    user_message: ChatMessage,
+    content: str,
+    stats: dict,
+    mode: str,
+    streamed: bool,
+    title_prompt: Optional[str] = None
+) -> tuple:
+
+    # The reply, its telemetry and the first-turn title share one commit.
+    def write(wdb: Session):
+        assistant_message = ChatService.add_message(
+            wdb,
+            session_id,
+            role="assistant",
+            content=content,
+            parent_id=user_message.id,
+            commit=False
+        )
+        MetricsService.record_inference(wdb, assistant_message.id, user_id, session_id, stats, mode, streamed=streamed, commit=False)
+        title = None
+        if title_prompt is not None and ChatService.is_first_message_in_session(wdb, session_id):
+            title = _title_from_prompt(title_prompt)
+            ChatService.update_session_title(wdb, session_id, title, commit=False)
+        return assistant_message, title
+
+    with tracer.span("chat.finish_turn", streamed=streamed):
+        assistant_message, title = await write_behind.submit(write)
+        ChatVersions.bump(user_id)
+    if title:
+        push_hub.publish(user_id, "n", {"session_id": session_id, "title": title})
+        print(f"✓ Generated title for session {session_id}: {title}")
+        # Only worth a model call when a small backend takes it; titles never
+        # queue on the main model.
+        if (
+            settings.TITLE_GENERATION_ENABLED
+            and inference_service.route("title")[0].name != MAIN_BACKEND
+            and degrade_controller.allows_background()
+        ):
+            task = asyncio.create_task(_model_title(session_id, user_id, title_prompt, title))
+            _title_tasks.add(task)
+            task.add_done_callback(_title_tasks.discard)
+    return assistant_message
+
+async def _model_title(session_id: int, user_id: int, prompt: str, first_words: str):
+
+    title = await inference_service.generate_title(prompt)
+    if not title or title == first_words:
+        return
+
+    def write(wdb: Session) -> bool:
+        # Keep a name the user picked in the meantime.
+        current = wdb.query(ChatSession.title).filter(ChatSession.id == session_id).scalar()
+        if current != first_words:
+            return False
+        ChatService.update_session_title(wdb, session_id, title, commit=False)
+        return True
+
+    try:
+        if not await write_behind.submit(write):
+            return
+    except Exception as e:
+        print(f"Error saving generated title: {e}")
+        return
+    ChatVersions.bump(user_id)
+    push_hub.publish(user_id, "n", {"session_id": session_id, "title": title})
+    print(f"✓ Model title for session {session_id}: {title}")
+
+async def _until_cancelled(tokens, cancel: asyncio.Event):
+
+    # Stops a token stream as soon as cancel is set, even while llama-server
+    # is still on the prompt; cancelling the pending read closes the upstream
+    # request.
+    waiter = asyncio.ensure_future(cancel.wait())
+    try:
+        while True:
+            step = asyncio.ensure_future(tokens.__anext__())
+            await asyncio.wait({step, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                step.cancel()
+                await asyncio.gather(step, return_exceptions=True)
+                return
+            try:
+                token = step.result()
+            except StopAsyncIteration:
+                return
+            yield token
+    finally:
+        waiter.cancel()
+        await tokens.aclose()
+
+async def _turn_events(
+    db: Session,
+    session,
+    user_message: ChatMessage,
+    messages: List[dict],
+    request: InferenceRequest,
+    mode: str,
+    policy: dict,
+    user_id: int,
+    is_admin: bool,
+    cancel: Optional[asyncio.Event] = None
+):
+
+    # The start/token/done/error events of one streamed turn, shared by the SSE
+    # endpoint and the WebSocket channel. With cancel, a cancelled turn still
+    # ends with done and keeps the reply generated so far.
+    full_response = ""
+    stats = {}
+    try:
+        yield {'type': 'start', 'session_id': session.id, 'user_message_id': user_message.id, 'mode': mode}
+
+        tokens = inference_service.generate_response_stream_async(
+            messages=messages,
+            max_tokens=degrade_controller.cap_max_tokens(request.max_tokens, policy),
+            temperature=request.temperature,
+            top_p=request.top_p,
+            n_probs=request.n_probs,
+            speculative=_speculative_params(request),
+            seed=request.seed,
+            stats=stats,
+            task=_inference_task(request),
+            model=request.model
+        )
+        async for token in (tokens if cancel is None else _until_cancelled(tokens, cancel)):
+            full_response += token
+            yield {'type': 'token', 'content': token}
+
+        cancelled = cancel is not None and cancel.is_set()
+        if cancelled and not full_response:
+            yield {'type': 'done', 'assistant_message_id': None, 'full_response': '', 'timings': None, 'mode': mode, 'cancelled': True}
+            return
+
+        assistant_message = await _finish_turn(
+            session.id, user_id, user_message, full_response, stats, mode, streamed=True, title_prompt=request.prompt
+        )
+
+        if settings.SUMMARY_ENABLED and policy["background_tasks"] and not cancelled:
+            summary_service.maybe_schedule(db, session.id)
+
+        done = {'type': 'done', 'assistant_message_id': assistant_message.id, 'full_response': full_response, 'timings': stats.get('timings'), 'mode': mode}
+        if cancel is not None:
+            done['cancelled'] = cancelled
+        yield done
+
+    except Exception as e:
+        yield {'type': 'error', 'message': str(e)}
+    finally:
+        # Tokens generated before a disconnect still used the CPU.
+        rate_limiter.charge(user_id, is_admin, _generated_tokens(stats, full_response))
+
+@router.post("/inference", response_model=InferenceResponse)
+async def generate_response(
+    request: InferenceRequest,
+    http_response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+
+    quota_headers = rate_limiter.check(current_user)
+    mode, policy = _inference_policy(request)
+    http_response.headers.update(quota_headers)
+    http_response.headers["X-Degrade-Mode"] = mode
+
+    session = _turn_session(db, request, current_user)
+
+    user_message = await _begin_turn(db, session, request, current_user.id)
+
+    stats = {}
     try:
-        llm_response = inference_service.generate_response(
-            prompt=request.prompt,
-            max_tokens=request.max_tokens,
+        llm_response = await inference_service.generate_response_async(
+            prompt=user_message.content,
+            max_tokens=degrade_controller.cap_max_tokens(request.max_tokens, policy),
             temperature=request.temperature,
-            top_p=request.top_p
+            top_p=request.top_p,
+            n_probs=request.n_probs,
+            speculative=_speculative_params(request),
+            seed=request.seed,
+            stats=stats,
+            task=_inference_task(request),
+            model=request.model
+        )
+    except InferenceBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"}
         )
     except Exception as e:
         raise HTTPException(
@@ -68,18 +349,16 @@ async def generate_response(
             detail=f"Error generating response: {str(e)}"
         )
 
-    assistant_message = ChatService.add_message(
-        db,
-        session.id,
-        role="assistant",
-        content=llm_response
-    )
+    assistant_message = await _finish_turn(session.id, current_user.id, user_message, llm_response, stats, mode, streamed=False)
+    rate_limiter.charge(current_user.id, current_user.is_admin, _generated_tokens(stats, llm_response))
 
     return InferenceResponse(
         response=llm_response,
         session_id=session.id,
         user_message=ChatMessageResponse.model_validate(user_message),
-        assistant_message=ChatMessageResponse.model_validate(assistant_message)
+        assistant_message=ChatMessageResponse.model_validate(assistant_message),
+        timings=stats.get("timings"),
+        mode=mode
     )
 
 @router.post("/inference/stream")
@@ -89,84 +368,22 @@ async def generate_response_stream(
     current_user: User = Depends(get_current_user)
 ):
 
-    if request.session_id:
-        session = ChatService.get_session(db, request.session_id, current_user)
-        if not session:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Session not found"
-            )
-    else:
-
-        session = ChatService.create_session(
-            db,
-            current_user,
-            ChatSessionCreate(title=request.prompt[:50] + "..." if len(request.prompt) > 50 else request.prompt)
-        )
-
-    user_message = ChatService.add_message(
-        db,
-        session.id,
-        role="user",
-        content=request.prompt
-    )
+    quota_headers = rate_limiter.check(current_user)
+    mode, policy = _inference_policy(request)
 
-    recent_messages = ChatService.get_recent_messages(db, session.id, limit=7)
+    session = _turn_session(db, request, current_user)
 
-    messages = []
-    for msg in recent_messages:
-        messages.append({
-            "role": msg.role,
-            "content": msg.content
-        })
+    user_message = await _begin_turn(db, session, request, current_user.id)
 
-    messages.append({
-        "role": "user",
-        "content": request.prompt
-    })
+    with tracer.span("chat.context"):
+        messages = ChatService.build_context_messages(db, session, token_budget=policy["context_token_budget"])
+    user_id = current_user.id
+    is_admin = current_user.is_admin
 
     async def event_stream():
 
-        try:
-            full_response = ""
-
-            yield f"data: {json.dumps({'type': 'start', 'session_id': session.id, 'user_message_id': user_message.id})}\n\n"
-
-            async for token in inference_service.generate_response_stream_async(
-                messages=messages,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
-                top_p=request.top_p
-            ):
-                full_response += token
-                yield f"data: {json.dumps({'type': 'token', 'content': token})}\n\n"
-
-            assistant_message = ChatService.add_message(
-                db,
-                session.id,
-                role="assistant",
-                content=full_response
-            )
-
-            if ChatService.is_first_message_in_session(db, session.id):
-                try:
-
-                    words = request.prompt.split()[:10]
-                    title = " ".join(words)
-                    if len(title) > 50:
-                        title = title[:47] + "..."
-                    elif len(words) == 10:
-                        title = title + "..."
-
-                    ChatService.update_session_title(db, session.id, title)
-                    print(f"✓ Generated title for session {session.id}: {title}")
-                except Exception as e:
-                    print(f"Error generating title: {e}")
-
-            yield f"data: {json.dumps({'type': 'done', 'assistant_message_id': assistant_message.id, 'full_response': full_response})}\n\n"
-
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        async for event in _turn_events(db, session, user_message, messages, request, mode, policy, user_id, is_admin):
+            yield f"data: {dumps_str(event)}\n\n"
 
     return StreamingResponse(
         event_stream(),
@@ -174,9 +391,153 @@ async def generate_response_stream(
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
+            "X-Degrade-Mode": mode,
+            **quota_headers,
         }
     )
 
+def _socket_user(token: str) -> Optional[User]:
+
+    db = SessionLocal()
+    try:
+        return AuthService.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db)
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+
+async def _socket_turn(channel: PushChannel, user: User, stream_id, message: dict, cancel: asyncio.Event):
+
+    # One generation on a WebSocket: the same steps as /inference/stream, with
+    # errors reported as an "e" frame for this stream. Each one is its own trace.
+    with tracer.trace("WS generate", path="/api/chat/ws", user_id=user.id) as root:
+        await _socket_generation(channel, user, stream_id, message, cancel, root)
+
+async def _socket_generation(channel: PushChannel, user: User, stream_id, message: dict, cancel: asyncio.Event, root):
+
+    db = SessionLocal()
+    try:
+        request = InferenceRequest.model_validate({key: value for key, value in message.items() if key not in ("op", "id")})
+        rate_limiter.check(user)
+        mode, policy = _inference_policy(request)
+        session = _turn_session(db, request, user)
+        user_message = await _begin_turn(db, session, request, user.id)
+        with tracer.span("chat.context"):
+            messages = ChatService.build_context_messages(db, session, token_budget=policy["context_token_budget"])
+
+        async for event in _turn_events(db, session, user_message, messages, request, mode, policy, user.id, user.is_admin, cancel):
+            kind = event.pop("type")
+            if kind == "token":
+                await channel.send("t", stream_id, event["content"])
+            elif kind == "error":
+                await channel.send("e", stream_id, {"status": 500, "detail": event["message"]})
+            else:
+                # The client already has the text from the token frames.
+                event.pop("full_response", None)
+                if kind == "start" and root is not None:
+                    event["trace_id"] = root.trace.trace_id
+                await channel.send(kind[0], stream_id, event)
+    except ValidationError as e:
+        await channel.send("e", stream_id, {"status": 422, "detail": e.errors(include_url=False, include_context=False)})
+    except HTTPException as e:
+        error = {"status": e.status_code, "detail": e.detail}
+        if e.headers and "Retry-After" in e.headers:
+            error["retry_after"] = int(e.headers["Retry-After"])
+        await channel.send("e", stream_id, error)
+    except Exception as e:
+        await channel.send("e", stream_id, {"status": 500, "detail": f"Error generating response: {str(e)}"})
+    finally:
+        db.close()
+
+async def _socket_watch(channel: PushChannel, user: User, token: str):
+
+    # Catches sidebar changes made by other workers and closes the socket once
+    # its token has expired or the account is gone.
+    checked = time.monotonic()
+    while True:
+        await asyncio.sleep(settings.WS_VERSION_POLL_SECONDS)
+        channel.push("v", ChatVersions.get(user.id))
+        if time.monotonic() - checked >= settings.WS_REAUTH_SECONDS:
+            checked = time.monotonic()
+            fresh = await asyncio.to_thread(_socket_user, token)
+            if fresh is None:
+                await channel.websocket.close(code=4401)
+                return
+            user.is_admin = fresh.is_admin
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+
+    # One long-lived connection per tab: several generations at once, their
+    # cancellation, and pushed title/sidebar changes. See README for frames.
+    await websocket.accept()
+    try:
+        hello = await asyncio.wait_for(websocket.receive_json(), timeout=settings.WS_AUTH_TIMEOUT_SECONDS)
+        token = hello.get("token") if isinstance(hello, dict) and hello.get("op") == "auth" else None
+    except (asyncio.TimeoutError, ValueError, KeyError):
+        token = None
+    except WebSocketDisconnect:
+        return
+    user = await asyncio.to_thread(_socket_user, token) if isinstance(token, str) else None
+    if user is None:
+        await websocket.close(code=4401)
+        return
+
+    channel = PushChannel(websocket, user.id)
+    channel.version = ChatVersions.get(user.id)
+    push_hub.register(channel)
+    sender = asyncio.create_task(channel.run_sender())
+    watcher = asyncio.create_task(_socket_watch(channel, user, token))
+    streams = {}
+    try:
+        await channel.send("w", None, {"user_id": user.id, "version": channel.version, "max_streams": settings.WS_MAX_STREAMS})
+        while True:
+            received = await websocket.receive()
+            if received["type"] == "websocket.disconnect":
+                break
+            text = received.get("text") or (received.get("bytes") or b"").decode("utf-8", "replace")
+            if len(text) > settings.WS_MAX_MESSAGE_BYTES:
+                await websocket.close(code=1009)
+                break
+            try:
+                message = json.loads(text)
+                op = message.get("op")
+            except (ValueError, AttributeError):
+                await channel.send("e", None, {"status": 400, "detail": "Frames must be JSON objects with an op"})
+                continue
+
+            stream_id = message.get("id")
+            if not isinstance(stream_id, (int, str)):
+                stream_id = None
+            if op == "generate":
+                if stream_id is None or stream_id in streams:
+                    await channel.send("e", stream_id, {"status": 400, "detail": "Each generation needs a new id"})
+                elif len(streams) >= settings.WS_MAX_STREAMS:
+                    await channel.send("e", stream_id, {"status": 429, "detail": f"At most {settings.WS_MAX_STREAMS} generations per connection"})
+                else:
+                    cancel = asyncio.Event()
+                    task = asyncio.create_task(_socket_turn(channel, user, stream_id, message, cancel))
+                    streams[stream_id] = (task, cancel)
+                    task.add_done_callback(lambda _, key=stream_id: streams.pop(key, None))
+            elif op == "cancel":
+                if stream_id in streams:
+                    streams[stream_id][1].set()
+            elif op == "ping":
+                await channel.send("p", None, message.get("t"))
+            else:
+                await channel.send("e", stream_id, {"status": 400, "detail": f"Unknown op: {op}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        push_hub.unregister(channel)
+        channel.close()
+        watcher.cancel()
+        sender.cancel()
+        # Running generations stop at their next token and keep what they
+        # produced, as if the user had pressed stop.
+        for task, cancel in list(streams.values()):
+            cancel.set()
+
 @router.post("/inference/save-partial")
 async def save_partial_response(
     request: dict,
@@ -197,42 +558,51 @@ async def save_partial_response(
 
     user_message = None
     if user_message_id:
-        user_message = db.query(ChatMessage).filter(ChatMessage.id == user_message_id).first()
-
-    assistant_message = ChatService.add_message(db, session_id, role="assistant", content=partial_response)
-
-    if ChatService.is_first_message_in_session(db, session_id):
-        try:
-
-            if user_message:
-                user_prompt = user_message.content
-            else:
-
-                user_message = db.query(ChatMessage).filter(
+        user_message = db.query(ChatMessage).filter(
+            ChatMessage.id == user_message_id,
+            ChatMessage.session_id == session_id
+        ).first()
+    # Plain values only cross into the writer thread.
+    parent_id = user_message.id if user_message else ACTIVE_LEAF
+    prompt_id, prompt = (user_message.id, user_message.content) if user_message else (None, None)
+
+    # Goes through the group commit like a finished turn, so a burst of
+    # stopped streams does not queue synchronous commits on the writer lock.
+    def write(wdb: Session):
+        assistant_message = ChatService.add_message(
+            wdb,
+            session_id,
+            role="assistant",
+            content=partial_response,
+            parent_id=parent_id,
+            commit=False
+        )
+        message_id, text, title = prompt_id, prompt, None
+        if ChatService.is_first_message_in_session(wdb, session_id):
+            if message_id is None:
+                latest = wdb.query(ChatMessage).filter(
                     ChatMessage.session_id == session_id,
                     ChatMessage.role == "user"
                 ).order_by(ChatMessage.created_at.desc()).first()
-                user_prompt = user_message.content if user_message else "Chat"
-
-            words = user_prompt.split()[:10]
-            title = " ".join(words)
-            if len(title) > 50:
-                title = title[:47] + "..."
-            elif len(words) == 10:
-                title = title + "..."
-
-            ChatService.update_session_title(db, session_id, title)
-            print(f"✓ Generated title for session {session_id}: {title}")
-        except Exception as e:
-            print(f"Error generating title: {e}")
+                if latest is not None:
+                    message_id, text = latest.id, latest.content
+            title = _title_from_prompt(text or "Chat")
+            ChatService.update_session_title(wdb, session_id, title, commit=False)
+        return assistant_message.id, message_id, title
+
+    assistant_message_id, user_message_id, title = await write_behind.submit(write)
+    ChatVersions.bump(current_user.id)
+    if title:
+        push_hub.publish(current_user.id, "n", {"session_id": session_id, "title": title})
+        print(f"✓ Generated title for session {session_id}: {title}")
 
     return {
-        "user_message_id": user_message.id if user_message else None,
-        "assistant_message_id": assistant_message.id,
+        "user_message_id": user_message_id,
+        "assistant_message_id": assistant_message_id,
         "session_id": session_id
     }
 
-@router.post("/sessions", response_model=ChatSessionResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/sessions", response_model=ChatSessionDetailResponse, status_code=status.HTTP_201_CREATED)
 async def create_session(
     session_data: ChatSessionCreate,
     db: Session = Depends(get_db),
@@ -240,63 +610,91 @@ async def create_session(
 ):
 
     session = ChatService.create_session(db, current_user, session_data)
-    return ChatSessionResponse.model_validate(session)
+    # A new session has no messages; don't touch the relationship to find that out.
+    return ChatSessionDetailResponse(
+        id=session.id,
+        title=session.title,
+        created_at=session.created_at,
+        updated_at=session.updated_at,
+        messages=[]
+    )
 
 @router.get("/sessions", response_model=List[ChatSessionListResponse])
 async def get_sessions(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     limit: int = 100
 ):
 
-    sessions = ChatService.get_user_sessions(db, current_user, limit)
-    return sessions
+    version = ChatVersions.get(current_user.id)
+    etag = f'W/"s{current_user.id}.{version}.{limit}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+
+    sessions = ChatService.get_user_sessions(db, current_user, limit, version=version)
+    return FastJSONResponse(content=sessions, headers=_cache_headers(etag))
 
 @router.get("/search", response_model=List[ChatSessionListResponse])
 async def search_sessions(
     q: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
-    limit: int = 50
+    limit: int = 50,
+    include_archived: bool = False
 ):
 
-    from app.db.models import ChatSession
-    from sqlalchemy import or_
-
-    sessions = db.query(ChatSession).filter(
-        ChatSession.user_id == current_user.id,
-        or_(
-            ChatSession.title.ilike(f"%{q}%"),
-            ChatSession.messages.any(ChatMessage.content.ilike(f"%{q}%"))
-        )
-    ).order_by(ChatSession.updated_at.desc()).limit(limit).all()
+    # include_archived also reads the archive segments, which is slower. Both
+    # decompress in Python, so the search runs off the event loop.
+    sessions = await asyncio.to_thread(ChatService.search_sessions, db, current_user, q, limit, include_archived)
+    return FastJSONResponse(content=sessions)
 
-    result = []
-    for session in sessions:
-        result.append(ChatSessionListResponse(
-            id=session.id,
-            title=session.title,
-            created_at=session.created_at,
-            updated_at=session.updated_at,
-            message_count=len(session.messages)
-        ))
+@router.get("/search/semantic", response_model=List[SemanticSearchResult])
+async def semantic_search(
+    q: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    k: int = 10,
+    keyword_weight: float = 0.0
+):
 
-    return result
+    # Sessions ranked by their closest message; keyword_weight (0-1) mixes in
+    # the share of query words the message contains.
+    if not settings.SEMANTIC_SEARCH_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Semantic search is disabled")
+    if not 0 <= keyword_weight <= 1 or not 1 <= k <= 100:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="k must be 1-100 and keyword_weight 0-1")
+    try:
+        results = await SemanticService.search(db, current_user, q, k, keyword_weight)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return FastJSONResponse(content=results)
 
-@router.get("/sessions/{session_id}", response_model=ChatSessionResponse)
+@router.get("/sessions/{session_id}", response_model=ChatSessionDetailResponse)
 async def get_session(
     session_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
 
-    session = ChatService.get_session(db, session_id, current_user)
+    session = ChatService.get_session_detail(db, session_id, current_user)
     if not session:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found"
         )
-    return ChatSessionResponse.model_validate(session)
+    return ChatSessionDetailResponse(**session)
+
+@router.put("/sessions/{session_id}/branch", response_model=ChatSessionDetailResponse)
+async def switch_branch(
+    session_id: int,
+    branch: BranchSelect,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+
+    ChatService.switch_branch(db, session_id, branch.message_id, current_user)
+    return ChatSessionDetailResponse(**ChatService.get_session_detail(db, session_id, current_user))
 
 @router.delete("/sessions/{session_id}", response_model=MessageResponse)
 async def delete_session(
@@ -316,28 +714,30 @@ async def rename_session(
     current_user: User = Depends(get_current_user)
 ):
 
-    session = ChatService.get_session(db, session_id, current_user)
-    if not session:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Session not found"
-        )
-
-    session.title = update_data.title
-    db.commit()
-    db.refresh(session)
-
+    session = ChatService.rename_session(db, session_id, current_user, update_data.title)
     return ChatSessionResponse.model_validate(session)
 
 @router.get("/sessions/{session_id}/messages", response_model=List[ChatMessageResponse])
 async def get_session_messages(
+    request: Request,
     session_id: int,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
 
-    messages = ChatService.get_session_messages(db, session_id, current_user)
-    return [ChatMessageResponse.model_validate(msg) for msg in messages]
+    # The stamp only moves when this user writes, so a match means the history the
+    # client holds is current and the chat tables need not be read at all.
+    version = ChatVersions.get(current_user.id)
+    etag = f'W/"m{current_user.id}.{session_id}.{version}.{fields or ""}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+
+    selected = list(MESSAGE_FIELDS)
+    if fields:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+    rows = ChatService.get_session_message_fields(db, session_id, current_user, selected)
+    return FastJSONResponse(content=rows, headers=_cache_headers(etag))
 
 @router.delete("/sessions/{session_id}/messages/{message_id}", response_model=MessageResponse)
 async def delete_messages_from(
@@ -346,7 +746,6 @@ async def delete_messages_from(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Delete a message and all messages after it (for edit functionality)."""
     deleted_count = ChatService.delete_messages_from(db, session_id, message_id, current_user)
     return MessageResponse(message=f"Deleted {deleted_count} messages")
 
@@ -383,7 +782,7 @@ async def export_session(
                 for msg in messages
             ]
         }
-        content = json.dumps(export_data, indent=2)
+        content = dumps(export_data, indent=True)
         media_type = "application/json"
         filename = f"chat_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
 
@@ -427,3 +826,51 @@ async def export_session(
             "Content-Disposition": f"attachment; filename={filename}"
         }
     )
+
+@router.post("/import")
+async def import_sessions(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+
+    # Accepts the JSON export format (one session or a list), NDJSON with one
+    # session per line, or a zip of such files. The upload is already spooled
+    # to disk; it is parsed and written on a worker thread while progress is
+    # streamed back as server-sent events. Retrying after a failure skips the
+    # sessions that made it in.
+    user_id = current_user.id
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+
+    def run():
+        db = SessionLocal()
+        try:
+            user = db.get(User, user_id)
+            return ImportService.run(
+                db, user, file.file,
+                progress=lambda totals: loop.call_soon_threadsafe(updates.put_nowait, totals)
+            )
+        finally:
+            db.close()
+
+    async def event_stream():
+
+        job = asyncio.ensure_future(asyncio.to_thread(run))
+        try:
+            while not job.done():
+                waiter = asyncio.ensure_future(updates.get())
+                await asyncio.wait({job, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                if waiter.done():
+                    yield f"data: {dumps_str({'type': 'progress', **waiter.result()})}\n\n"
+                else:
+                    waiter.cancel()
+            totals = job.result()
+            yield f"data: {dumps_str({'type': 'done', **totals})}\n\n"
+        except Exception as e:
+            yield f"data: {dumps_str({'type': 'error', 'message': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -51,6 +51,9 @@ class ChatMessageResponse(BaseModel):
     role: str
     content: str
     created_at: datetime
+    parent_id: Optional[int] = None
+    # Ids of this message and its alternatives (edits/regenerations), oldest first.
+    sibling_ids: List[int] = []
 
     class Config:
         from_attributes = True
@@ -62,6 +65,32 @@ class InferenceRequest(BaseModel):
     max_tokens: Optional[int] = 512
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 0.95
+    n_probs: Optional[int] = Field(default=None, ge=0, le=20)
+    draft_max: Optional[int] = Field(default=None, ge=0)
+    draft_min: Optional[int] = Field(default=None, ge=0)
+    draft_p_min: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    seed: Optional[int] = None
+    priority: str = Field(default="interactive", pattern="^(interactive|batch)$")
+    # A backend name from MODEL_BACKENDS ("main" is LLAMA_SERVER_URL); unset lets the router pick.
+    model: Optional[str] = Field(default=None, max_length=50)
+    # Attach the new user message under this message instead of the active leaf,
+    # starting a sibling branch; 0 starts a new branch at the root.
+    parent_message_id: Optional[int] = Field(default=None, ge=0)
+    # Answer parent_message_id (a user message) again as a sibling reply; prompt is ignored.
+    regenerate: bool = False
+
+class InferenceTimings(BaseModel):
+
+    prompt_tokens: int = 0
+    prompt_ms: float = 0.0
+    prompt_tokens_per_second: Optional[float] = None
+    completion_tokens: int = 0
+    generation_ms: float = 0.0
+    tokens_per_second: Optional[float] = None
+    cached_tokens: int = 0
+    draft_tokens: int = 0
+    draft_accepted: int = 0
+    acceptance_rate: Optional[float] = None
 
 class InferenceResponse(BaseModel):
 
@@ -69,6 +98,8 @@ class InferenceResponse(BaseModel):
     session_id: int
     user_message: ChatMessageResponse
     assistant_message: ChatMessageResponse
+    timings: Optional[InferenceTimings] = None
+    mode: str = "normal"
 
 class ChatSessionCreate(BaseModel):
 
@@ -80,11 +111,14 @@ class ChatSessionResponse(BaseModel):
     title: str
     created_at: datetime
     updated_at: datetime
-    messages: List[ChatMessageResponse] = []
 
     class Config:
         from_attributes = True
 
+class ChatSessionDetailResponse(ChatSessionResponse):
+
+    messages: List[ChatMessageResponse] = []
+
 class ChatSessionListResponse(BaseModel):
 
     id: int
@@ -96,6 +130,20 @@ class ChatSessionListResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SemanticSearchResult(BaseModel):
+
+    id: int
+    title: str
+    created_at: datetime
+    updated_at: datetime
+    message_id: int
+    snippet: str
+    score: float
+
+class BranchSelect(BaseModel):
+
+    message_id: int
+
 class ChatSessionUpdate(BaseModel):
 
     title: str = Field(..., min_length=1, max_length=200)
@@ -127,3 +175,15 @@ class AdminUserUpdate(BaseModel):
 
     is_active: Optional[bool] = None
     is_admin: Optional[bool] = None
+
+class RateLimitRule(BaseModel):
+
+    requests_per_minute: Optional[float] = Field(default=None, ge=0)
+    request_burst: Optional[int] = Field(default=None, ge=0)
+    tokens_per_hour: Optional[float] = Field(default=None, ge=0)
+    token_burst: Optional[int] = Field(default=None, ge=0)
+
+class RateLimitConfig(BaseModel):
+
+    roles: Dict[str, RateLimitRule] = {}
+    users: Dict[int, RateLimitRule] = {}
@@ -0,0 +1,110 @@
+"""Maintenance commands. Run from the backend directory:
+
+    python -m app.cli compress-messages --train
+    python -m app.cli archive-sessions --days 30
+    python -m app.cli import-chats --user alice export.zip
+"""
+import argparse
+import sys
+from app.db.database import SessionLocal, init_db
+
+def compress_messages(args):
+
+    from app.services.compression_service import CompressionService
+
+    db = SessionLocal()
+    try:
+        if args.train:
+            dictionary = CompressionService.train_dictionary(db, max_samples=args.samples, size=args.dict_size)
+            print(f"✓ Trained dictionary {dictionary.id} ({len(dictionary.data)} bytes) from {dictionary.samples} messages")
+        totals = CompressionService.compress_existing(db, batch_size=args.batch_size, recompress=args.recompress)
+    finally:
+        db.close()
+
+    saved = totals["bytes_before"] - totals["bytes_after"]
+    print(
+        f"✓ Compressed {totals['compressed']} of {totals['scanned']} large messages in {totals['seconds']}s: "
+        f"{totals['bytes_before']} → {totals['bytes_after']} bytes ({saved} saved)"
+    )
+
+def archive_sessions(args):
+
+    from app.core.state import state_store, process_id
+    from app.services.archive_service import session_archiver
+
+    # Same lock as the background archiver: only one process appends to segments.
+    if not state_store.acquire_lock("session_archive", process_id(), ttl=3600):
+        raise RuntimeError("Another process is archiving sessions")
+    try:
+        totals = session_archiver.run_once(days=args.days)
+    finally:
+        state_store.release_lock("session_archive", process_id())
+    print(f"✓ Archived {totals['sessions']} sessions, {totals['messages']} messages")
+
+def import_chats(args):
+
+    from app.db.models import User
+    from app.services.import_service import ImportService
+
+    def report(totals):
+        print(
+            f"  … {totals['sessions']} sessions, {totals['messages']} messages, "
+            f"{totals['duplicates']} already imported, {totals['invalid']} invalid "
+            f"({totals['messages_per_second']:.0f} messages/s)"
+        )
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == args.user, User.deleted_at.is_(None)).first()
+        if user is None:
+            raise RuntimeError(f"User {args.user!r} not found")
+        for path in args.files:
+            print(f"Importing {path}")
+            with open(path, "rb") as handle:
+                totals = ImportService.run(db, user, handle, progress=report, enforce_limit=not args.no_limit)
+            for error in totals["errors"]:
+                print(f"  ✗ {error}")
+            print(
+                f"✓ {path}: {totals['sessions']} sessions and {totals['messages']} messages in {totals['seconds']}s "
+                f"({totals['messages_per_second']:.0f} messages/s), {totals['duplicates']} already imported, "
+                f"{totals['invalid']} invalid"
+            )
+            if totals["limit_reached"]:
+                raise RuntimeError("MAX_SESSIONS_PER_USER reached; rerun with --no-limit to import the rest")
+    finally:
+        db.close()
+
+def main():
+
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compress = commands.add_parser("compress-messages", help="compress existing large message bodies with zstd")
+    compress.add_argument("--train", action="store_true", help="train a new dictionary from recent messages first")
+    compress.add_argument("--samples", type=int, default=5000, help="messages sampled for training")
+    compress.add_argument("--dict-size", type=int, default=None, help="dictionary size in bytes")
+    compress.add_argument("--batch-size", type=int, default=500)
+    compress.add_argument("--recompress", action="store_true",
+                          help="also re-encode rows written with an older dictionary")
+    compress.set_defaults(handler=compress_messages)
+
+    archive = commands.add_parser("archive-sessions", help="move idle sessions to the archive segments now")
+    archive.add_argument("--days", type=int, default=None, help="idle days (default ARCHIVE_AFTER_DAYS)")
+    archive.set_defaults(handler=archive_sessions)
+
+    importer = commands.add_parser("import-chats", help="import exported chats (JSON, NDJSON or a zip of them)")
+    importer.add_argument("files", nargs="+")
+    importer.add_argument("--user", required=True, help="username that receives the sessions")
+    importer.add_argument("--no-limit", action="store_true", help="ignore MAX_SESSIONS_PER_USER")
+    importer.set_defaults(handler=import_chats)
+
+    args = parser.parse_args()
+    init_db()
+    try:
+        args.handler(args)
+    except RuntimeError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
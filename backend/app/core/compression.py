@@ -0,0 +1,129 @@
+import threading
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed only when it saves at least this much; short or already dense
+# bodies stay plain text.
+MIN_SAVING = 0.9
+
+class MessageCodec:
+
+    # zstd for large message bodies, with a dictionary trained on this
+    # deployment's own messages (app.cli compress-messages --train). Each row
+    # records the dictionary it was written with, so older dictionaries stay
+    # readable after a new one is trained; 0 means no dictionary. Dictionaries
+    # live in the database, so every worker and host decodes the same rows.
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.dictionaries: Dict[int, "zstandard.ZstdCompressionDict"] = {}
+        self.active_id: Optional[int] = None
+        self.loaded = False
+        # Compressor and decompressor objects must not be shared across threads.
+        self.local = threading.local()
+        self.warned = False
+
+    def available(self) -> bool:
+
+        return zstandard is not None
+
+    def enabled(self) -> bool:
+
+        if not settings.MESSAGE_COMPRESSION_ENABLED:
+            return False
+        if zstandard is None:
+            if not self.warned:
+                print("⚠ MESSAGE_COMPRESSION_ENABLED is set but zstandard is not installed; storing plain text")
+                self.warned = True
+            return False
+        return True
+
+    def load(self, force: bool = False):
+
+        # Imported here: the models module imports this one.
+        from app.db.database import SessionLocal
+        from app.db.models import CompressionDictionary
+
+        with self.lock:
+            if self.loaded and not force:
+                return
+            db = SessionLocal()
+            try:
+                rows = db.query(CompressionDictionary.id, CompressionDictionary.data).order_by(
+                    CompressionDictionary.id.asc()
+                ).all()
+            finally:
+                db.close()
+            self.dictionaries = {row_id: zstandard.ZstdCompressionDict(data) for row_id, data in rows}
+            self.active_id = rows[-1][0] if rows else None
+            self.local = threading.local()
+            self.loaded = True
+
+    def _compressor(self, dict_id: int):
+
+        compressors = self.local.__dict__.setdefault("compressors", {})
+        if dict_id not in compressors:
+            dictionary = self.dictionaries.get(dict_id) if dict_id else None
+            compressors[dict_id] = zstandard.ZstdCompressor(
+                level=settings.MESSAGE_COMPRESSION_LEVEL,
+                dict_data=dictionary
+            )
+        return compressors[dict_id]
+
+    def _decompressor(self, dict_id: int):
+
+        decompressors = self.local.__dict__.setdefault("decompressors", {})
+        if dict_id not in decompressors:
+            if dict_id and dict_id not in self.dictionaries:
+                # Trained by another process since this one loaded.
+                self.load(force=True)
+                if dict_id not in self.dictionaries:
+                    raise RuntimeError(f"Compression dictionary {dict_id} not found")
+                decompressors = self.local.__dict__.setdefault("decompressors", {})
+            dictionary = self.dictionaries.get(dict_id) if dict_id else None
+            decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return decompressors[dict_id]
+
+    def compress(self, text: str, force: bool = False) -> Optional[Tuple[bytes, int]]:
+
+        # (blob, dictionary id) when the body is worth compressing, else None.
+        if not force and not self.enabled():
+            return None
+        if force and zstandard is None:
+            return None
+        raw = text.encode("utf-8")
+        if len(raw) < settings.MESSAGE_COMPRESSION_MIN_BYTES:
+            return None
+        self.load()
+        dict_id = self.active_id or 0
+        blob = self._compressor(dict_id).compress(raw)
+        if len(blob) > len(raw) * MIN_SAVING:
+            return None
+        return blob, dict_id
+
+    def decompress(self, blob: bytes, dict_id: Optional[int]) -> str:
+
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read compressed messages")
+        self.load()
+        return self._decompressor(dict_id or 0).decompress(blob).decode("utf-8")
+
+    def train(self, samples, size: int) -> "zstandard.ZstdCompressionDict":
+
+        return zstandard.train_dictionary(size, [sample.encode("utf-8") for sample in samples])
+
+def decode_content(content: str, blob: Optional[bytes], dict_id: Optional[int]) -> str:
+
+    # For queries that select the content columns directly instead of loading
+    # ChatMessage objects.
+    if blob is None:
+        return content
+    return message_codec.decompress(blob, dict_id)
+
+message_codec = MessageCodec()
@@ -14,20 +14,134 @@ class Settings(BaseSettings):
     BACKEND_CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:5173", "http://localhost"]
 
     DATABASE_URL: str = "sqlite:///./pocketllm.db"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_WAL_ENABLED: bool = True
+
+    WEB_CONCURRENCY: int = 1
+    STATE_BACKEND: str = "auto"
+    STATE_SQLITE_PATH: str = "./pocketllm_state.db"
+    STATE_KEY_PREFIX: str = "pocketllm:"
 
     LLAMA_SERVER_URL: str = "http://localhost:8080"
     MODEL_CONTEXT_LENGTH: int = 4096
     MODEL_MAX_TOKENS: int = -1
     MODEL_TEMPERATURE: float = 0.7
     MODEL_TOP_P: float = 0.95
+    MODEL_N_PROBS: int = 0
+
+    MODEL_BACKENDS: str = ""
+    MODEL_TASK_ROUTES: str = "title=tiny,summary=tiny"
+    MODEL_SHORT_PROMPT_TOKENS: int = 0
+    MODEL_SHORT_PROMPT_BACKEND: str = "tiny"
+
+    HEALTH_POLL_SECONDS: float = 5.0
+    HEALTH_TIMEOUT_SECONDS: float = 3.0
+    READY_MAX_QUEUE_PER_SLOT: int = 2
+    WARMUP_ENABLED: bool = True
+    WARMUP_PROMPT: str = "Say hello."
+    WARMUP_MAX_TOKENS: int = 8
+
+    ADAPTIVE_CONCURRENCY_ENABLED: bool = True
+    CONCURRENCY_INITIAL_LIMIT: int = 2
+    CONCURRENCY_MIN_LIMIT: int = 1
+    CONCURRENCY_MAX_LIMIT: int = 16
+    CONCURRENCY_WINDOW_SECONDS: float = 10.0
+    CONCURRENCY_TTFT_TARGET_MS: float = 5000.0
+    CONCURRENCY_MIN_TOKENS_PER_SECOND: float = 2.0
+    CONCURRENCY_QUEUE_TIMEOUT_SECONDS: float = 120.0
+    COALESCE_ENABLED: bool = True
+
+    DEGRADE_ENABLED: bool = True
+    DEGRADE_WINDOW_SECONDS: float = 30.0
+    DEGRADE_RECOVERY_SECONDS: float = 30.0
+    DEGRADE_QUEUE_PER_SLOT: float = 2.0
+    DEGRADE_TTFT_MS: float = 10000.0
+    DEGRADED_MAX_TOKENS: int = 256
+    DEGRADED_CONTEXT_TOKEN_BUDGET: int = 1024
+    CRITICAL_QUEUE_PER_SLOT: float = 6.0
+    CRITICAL_TTFT_MS: float = 30000.0
+    CRITICAL_MAX_TOKENS: int = 128
+    CRITICAL_CONTEXT_TOKEN_BUDGET: int = 512
+
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_REQUESTS_PER_MINUTE: float = 20.0
+    RATE_LIMIT_REQUEST_BURST: int = 10
+    RATE_LIMIT_TOKENS_PER_HOUR: float = 60000.0
+    RATE_LIMIT_TOKEN_BURST: int = 20000
+    ADMIN_RATE_LIMIT_MULTIPLIER: float = 5.0
+
+    USAGE_RECONCILE_SECONDS: float = 3600.0
+
+    WRITE_BEHIND_ENABLED: bool = True
+    WRITE_BEHIND_INTERVAL_MS: float = 2.0
+    WRITE_BEHIND_MAX_BATCH: int = 256
+
+    DELETE_CHUNK_SIZE: int = 2000
+    PURGE_POLL_SECONDS: float = 60.0
+
+    MESSAGE_COMPRESSION_ENABLED: bool = False
+    MESSAGE_COMPRESSION_MIN_BYTES: int = 1024
+    MESSAGE_COMPRESSION_LEVEL: int = 3
+    MESSAGE_COMPRESSION_DICT_SIZE: int = 65536
+
+    ARCHIVE_ENABLED: bool = False
+    ARCHIVE_AFTER_DAYS: int = 14
+    ARCHIVE_DIR: str = "./archive"
+    ARCHIVE_SEGMENT_MAX_BYTES: int = 64 * 1024 * 1024
+    ARCHIVE_BATCH_SESSIONS: int = 200
+    ARCHIVE_POLL_SECONDS: float = 3600.0
+    ARCHIVE_COMPRESSION_LEVEL: int = 9
+
+    IMPORT_BATCH_MESSAGES: int = 5000
+
+    SEMANTIC_SEARCH_ENABLED: bool = False
+    EMBEDDING_SERVER_URL: Optional[str] = None
+    EMBEDDING_MODEL: Optional[str] = None
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_MAX_CHARS: int = 2000
+    EMBEDDING_POLL_SECONDS: float = 5.0
+    EMBEDDING_INDEX_DIR: str = "./vectors"
+    SEMANTIC_CANDIDATES: int = 200
+
+    WS_SEND_QUEUE_FRAMES: int = 256
+    WS_MAX_STREAMS: int = 4
+    WS_MAX_MESSAGE_BYTES: int = 65536
+    WS_AUTH_TIMEOUT_SECONDS: float = 10.0
+    WS_REAUTH_SECONDS: float = 300.0
+    WS_VERSION_POLL_SECONDS: float = 5.0
+
+    SPECULATIVE_ENABLED: bool = False
+    SPECULATIVE_DRAFT_MAX: int = 16
+    SPECULATIVE_DRAFT_MIN: int = 0
+    SPECULATIVE_DRAFT_P_MIN: float = 0.75
 
     SESSION_RETENTION_DAYS: int = 60
     MAX_SESSIONS_PER_USER: int = 100
 
     CONTEXT_MESSAGE_LIMIT: int = 7
+    CONTEXT_TOKEN_BUDGET: int = 2048
+
+    SUMMARY_ENABLED: bool = True
+    SUMMARY_TRIGGER_TOKENS: int = 1500
+    SUMMARY_KEEP_MESSAGES: int = 4
+    SUMMARY_MAX_TOKENS: int = 256
+    SUMMARY_IDLE_POLL_SECONDS: float = 1.0
     TITLE_GENERATION_ENABLED: bool = True
     TITLE_MAX_TOKENS: int = 20
 
+    DIAGNOSTICS_ENABLED: bool = True
+    LOOP_LAG_INTERVAL_MS: int = 50
+    LOOP_LAG_WARN_MS: int = 200
+    SLOW_REQUEST_MS: int = 1000
+    PROFILER_ENABLED: bool = False
+    PROFILER_MAX_SECONDS: int = 30
+
+    TRACING_ENABLED: bool = True
+    TRACE_SAMPLE_RATE: float = 1.0
+    TRACE_BUFFER_SIZE: int = 200
+    TRACE_MAX_SPANS: int = 200
+    TRACE_FILE: Optional[str] = None
+
     REDIS_URL: Optional[str] = None
     CACHE_ENABLED: bool = False
     CACHE_TTL: int = 3600
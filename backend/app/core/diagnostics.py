@@ -0,0 +1,246 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from app.core.config import settings
+from app.core.tracing import tracer
+
+_request_timings: ContextVar[Optional[Dict]] = ContextVar("request_timings", default=None)
+
+def record_time(category: str, seconds: float, count: int = 1):
+
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[f"{category}_s"] = timings.get(f"{category}_s", 0.0) + seconds
+        timings[f"{category}_count"] = timings.get(f"{category}_count", 0) + count
+
+@contextmanager
+def track(category: str):
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(category, time.perf_counter() - started)
+
+def instrument_engine(engine):
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+        conn.info.setdefault("diagnostics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+        started = conn.info["diagnostics_started"].pop()
+        finished = time.perf_counter()
+        record_time("db", finished - started)
+        tracer.record("db", started, finished, statement=statement[:200])
+
+def _format_stack(frame) -> List[str]:
+
+    return [
+        f"{entry.filename}:{entry.lineno} {entry.name}"
+        for entry in traceback.extract_stack(frame)
+    ]
+
+class LoopLagMonitor:
+
+    def __init__(self):
+
+        self.samples = deque(maxlen=1200)
+        self.stalls = deque(maxlen=50)
+        self.last_tick = None
+        self.loop_thread_id = None
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self._stop.clear()
+        self.task = asyncio.create_task(self._run())
+        self.watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self.watchdog.start()
+
+    async def stop(self):
+
+        self._stop.set()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+
+        interval = settings.LOOP_LAG_INTERVAL_MS / 1000.0
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag_ms = max(0.0, loop.time() - expected) * 1000.0
+            self.samples.append(lag_ms)
+            self.last_tick = time.monotonic()
+
+    def _watch(self):
+
+        # Runs off the loop so it can see the loop thread while it is blocked and
+        # capture the offending stack, which the loop itself never could.
+        threshold = settings.LOOP_LAG_WARN_MS / 1000.0
+        reported_tick = None
+        while not self._stop.wait(threshold / 2):
+            tick = self.last_tick
+            if tick is None or tick == reported_tick:
+                continue
+            blocked_for = time.monotonic() - tick
+            if blocked_for < threshold:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            reported_tick = tick
+            stack = _format_stack(frame)
+            self.stalls.append({
+                "at": datetime.utcnow().isoformat(),
+                "blocked_ms": round(blocked_for * 1000.0, 1),
+                "stack": stack
+            })
+            print(f"⚠ Event loop blocked for at least {blocked_for * 1000.0:.0f} ms at {stack[-1] if stack else '?'}")
+
+    def stats(self) -> Dict:
+
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"samples": 0, "p50_ms": None, "p99_ms": None, "max_ms": None}
+        return {
+            "samples": len(ordered),
+            "p50_ms": round(ordered[len(ordered) // 2], 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+            "max_ms": round(ordered[-1], 2)
+        }
+
+class SlowRequestMiddleware:
+
+    def __init__(self, app):
+
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        # Thread CPU time also counts other requests interleaved on the loop thread,
+        # so treat it as an upper bound for this handler's own CPU work.
+        cpu_started = time.thread_time()
+        response = {"status": None, "first_byte": None, "streaming": False}
+
+        async def send_wrapper(message):
+
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                headers = dict(message.get("headers") or [])
+                response["streaming"] = headers.get(b"content-type", b"").startswith(b"text/event-stream")
+            elif message["type"] == "http.response.body" and response["first_byte"] is None:
+                response["first_byte"] = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            finished = time.perf_counter()
+            wall_ms = (finished - started) * 1000.0
+            ttfb_ms = ((response["first_byte"] or finished) - started) * 1000.0
+            # Streams are long by design; judge them by how fast they start.
+            measured_ms = ttfb_ms if response["streaming"] else wall_ms
+            if measured_ms >= settings.SLOW_REQUEST_MS:
+                slow_request_log.record(scope, response, timings, wall_ms, ttfb_ms, time.thread_time() - cpu_started)
+
+class SlowRequestLog:
+
+    def __init__(self):
+
+        self.entries = deque(maxlen=100)
+
+    def record(self, scope, response: Dict, timings: Dict, wall_ms: float, ttfb_ms: float, cpu_s: float):
+
+        db_ms = timings.get("db_s", 0.0) * 1000.0
+        http_ms = timings.get("http_s", 0.0) * 1000.0
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": response["status"],
+            "streaming": response["streaming"],
+            "wall_ms": round(wall_ms, 1),
+            "ttfb_ms": round(ttfb_ms, 1),
+            "db_ms": round(db_ms, 1),
+            "db_queries": timings.get("db_count", 0),
+            "http_ms": round(http_ms, 1),
+            "http_calls": timings.get("http_count", 0),
+            "cpu_ms": round(cpu_s * 1000.0, 1),
+            "other_ms": round(max(0.0, wall_ms - db_ms - http_ms), 1)
+        }
+        self.entries.append(entry)
+        print(
+            f"⚠ Slow request {entry['method']} {entry['path']}: {entry['wall_ms']} ms "
+            f"(db {entry['db_ms']} ms/{entry['db_queries']} queries, http {entry['http_ms']} ms, cpu {entry['cpu_ms']} ms)"
+        )
+
+class SamplingProfiler:
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+
+    def profile(self, thread_id: int, seconds: float, interval: float) -> str:
+
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[self._collapse(frame)] += 1
+                time.sleep(interval)
+        finally:
+            self.lock.release()
+
+        # Brendan Gregg's collapsed format, readable by flamegraph.pl and speedscope.
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+    @staticmethod
+    def _collapse(frame) -> str:
+
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+loop_lag_monitor = LoopLagMonitor()
+slow_request_log = SlowRequestLog()
+sampling_profiler = SamplingProfiler()
@@ -0,0 +1,43 @@
+import json
+from datetime import date, datetime
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value: Any) -> Any:
+
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any, indent: bool = False) -> bytes:
+
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(content, option=option)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":")
+    ).encode("utf-8")
+
+def dumps_str(content: Any) -> str:
+
+    return dumps(content).decode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+
+    # Renders with orjson when installed. Endpoints that build plain dicts from
+    # trusted rows return this directly, which skips FastAPI's response_model
+    # validation and jsonable_encoder pass; response_model then only documents
+    # the shape.
+
+    def render(self, content: Any) -> bytes:
+
+        return dumps(content)
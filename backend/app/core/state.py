@@ -0,0 +1,331 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import settings
+
+class MemoryStateStore:
+
+    # Per-process store for single-worker deployments.
+
+    name = "memory"
+
+    def __init__(self):
+
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[tuple]:
+
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> Optional[str]:
+
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key: str):
+
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + amount if entry else amount
+            self._data[key] = (str(value), entry[1] if entry else None)
+            return value
+
+    def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+
+        with self._lock:
+            entry = self._live(f"lock:{name}")
+            if entry and entry[0] != owner:
+                return False
+            self._data[f"lock:{name}"] = (owner, time.time() + ttl)
+            return True
+
+    def release_lock(self, name: str, owner: str):
+
+        with self._lock:
+            entry = self._live(f"lock:{name}")
+            if entry and entry[0] == owner:
+                del self._data[f"lock:{name}"]
+
+    def take_tokens(self, key: str, capacity: float, rate: float, cost: float, force: bool = False) -> Tuple[bool, float]:
+
+        with self._lock:
+            entry = self._live(key)
+            now = time.time()
+            tokens, updated = entry[0] if entry else (capacity, now)
+            allowed, tokens = _take(min(capacity, tokens + (now - updated) * rate), capacity, cost, force)
+            self._data[key] = ((tokens, now), now + _bucket_ttl(capacity, rate))
+            return allowed, tokens
+
+class SQLiteStateStore:
+
+    # Shared between worker processes on one host without running Redis.
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+
+        conn = getattr(self._local, "conn", None)
+        # Connections must not cross a fork into gunicorn workers.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+
+        row = self._connect().execute(
+            "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+
+        self._connect().execute(
+            "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl if ttl else None)
+        )
+
+    def delete(self, key: str):
+
+        self._connect().execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1) -> int:
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+            value = int(row[0]) + amount if row else amount
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, str(value), row[1] if row else None)
+            )
+            conn.execute("COMMIT")
+            return value
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM state WHERE key = ? AND expires_at > ?",
+                (f"lock:{name}", now)
+            ).fetchone()
+            if row and row[0] != owner:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                (f"lock:{name}", owner, now + ttl)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release_lock(self, name: str, owner: str):
+
+        self._connect().execute(
+            "DELETE FROM state WHERE key = ? AND value = ?",
+            (f"lock:{name}", owner)
+        )
+
+    def take_tokens(self, key: str, capacity: float, rate: float, cost: float, force: bool = False) -> Tuple[bool, float]:
+
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            tokens, updated = json.loads(row[0]) if row else (capacity, now)
+            allowed, tokens = _take(min(capacity, tokens + (now - updated) * rate), capacity, cost, force)
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps([tokens, now]), now + _bucket_ttl(capacity, rate))
+            )
+            conn.execute("COMMIT")
+            return allowed, tokens
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+class RedisStateStore:
+
+    name = "redis"
+
+    def __init__(self, url: str):
+
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package (pip install redis)")
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = settings.STATE_KEY_PREFIX
+        self._take_script = None
+
+    def get(self, key: str) -> Optional[str]:
+
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+
+        self.client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str):
+
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+
+        return self.client.incrby(self.prefix + key, amount)
+
+    def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+
+        key = f"{self.prefix}lock:{name}"
+        if self.client.set(key, owner, nx=True, px=int(ttl * 1000)):
+            return True
+        # Re-entrant for the current owner, which also extends the lease.
+        if self.client.get(key) == owner:
+            self.client.pexpire(key, int(ttl * 1000))
+            return True
+        return False
+
+    def release_lock(self, name: str, owner: str):
+
+        key = f"{self.prefix}lock:{name}"
+        if self.client.get(key) == owner:
+            self.client.delete(key)
+
+    def take_tokens(self, key: str, capacity: float, rate: float, cost: float, force: bool = False) -> Tuple[bool, float]:
+
+        if self._take_script is None:
+            self._take_script = self.client.register_script(_REDIS_TAKE_TOKENS)
+        allowed, tokens = self._take_script(
+            keys=[self.prefix + key],
+            args=[capacity, rate, cost, 1 if force else 0, time.time(), int(_bucket_ttl(capacity, rate) * 1000)]
+        )
+        return bool(int(allowed)), float(tokens)
+
+def _take(tokens: float, capacity: float, cost: float, force: bool) -> Tuple[bool, float]:
+
+    # Token bucket step. cost=0 only asks whether the bucket is positive; force
+    # charges usage that already happened, allowing a bounded debt.
+    if force:
+        return True, max(-capacity, tokens - cost)
+    if (cost > 0 and tokens >= cost) or (cost == 0 and tokens > 0):
+        return True, tokens - cost
+    return False, tokens
+
+def _bucket_ttl(capacity: float, rate: float) -> float:
+
+    # After twice the time to refill from empty the bucket is full again, so
+    # the key can expire instead of lingering for idle users.
+    return max(60.0, 2 * capacity / rate)
+
+_REDIS_TAKE_TOKENS = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local force = ARGV[4] == "1"
+local now = tonumber(ARGV[5])
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if force then
+    allowed = 1
+    tokens = math.max(-capacity, tokens - cost)
+elseif (cost > 0 and tokens >= cost) or (cost == 0 and tokens > 0) then
+    allowed = 1
+    tokens = tokens - cost
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("PEXPIRE", KEYS[1], ARGV[6])
+return {allowed, tostring(tokens)}
+"""
+
+def get_json(store, key: str, default: Any = None) -> Any:
+
+    value = store.get(key)
+    return json.loads(value) if value is not None else default
+
+def set_json(store, key: str, value: Any, ttl: Optional[float] = None):
+
+    store.set(key, json.dumps(value), ttl)
+
+def create_state_store():
+
+    backend = settings.STATE_BACKEND
+    if backend == "auto":
+        if settings.REDIS_URL:
+            backend = "redis"
+        elif settings.WEB_CONCURRENCY > 1:
+            backend = "sqlite"
+        else:
+            backend = "memory"
+
+    if backend == "redis":
+        if not settings.REDIS_URL:
+            raise RuntimeError("STATE_BACKEND=redis requires REDIS_URL")
+        return RedisStateStore(settings.REDIS_URL)
+    if backend == "sqlite":
+        return SQLiteStateStore(settings.STATE_SQLITE_PATH)
+    if backend == "memory":
+        return MemoryStateStore()
+    raise RuntimeError(f"Unknown STATE_BACKEND: {backend}")
+
+_started_at = int(time.time() * 1000)
+
+def process_id() -> str:
+
+    # Identifies this worker process as a lock owner; evaluated per call so forked
+    # workers never share an identity with the gunicorn master.
+    return f"{os.getpid()}-{_started_at}"
+
+state_store = create_state_store()
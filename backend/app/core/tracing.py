@@ -0,0 +1,301 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.serialization import dumps
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+def _epoch(perf: float) -> float:
+
+    # perf_counter() readings as wall-clock time, for spans recorded after the fact.
+    return time.time() - (time.perf_counter() - perf)
+
+class Span:
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict, started: Optional[float] = None):
+
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.started = time.perf_counter() if started is None else started
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None, finished: Optional[float] = None, **attributes):
+
+        if self.duration_ms is not None:
+            return
+        self.attributes.update(attributes)
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.duration_ms = ((time.perf_counter() if finished is None else finished) - self.started) * 1000.0
+        if self is self.trace.root:
+            tracer.export(self.trace)
+
+    def traceparent(self) -> str:
+
+        # W3C Trace Context, so llama-server (or a proxy in front of it) can log
+        # the same trace id.
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def to_dict(self, origin: float) -> Dict:
+
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "offset_ms": round((self.started - origin) * 1000.0, 2),
+            "duration_ms": round(self.duration_ms, 2) if self.duration_ms is not None else None,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+class Trace:
+
+    def __init__(self, trace_id: str):
+
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.root: Optional[Span] = None
+
+    def add(self, span: Span) -> Optional[Span]:
+
+        # Spans arriving after the trace was exported (background work started
+        # by the request) or past the cap are counted, not kept.
+        if (self.root is not None and self.root.duration_ms is not None) or len(self.spans) >= settings.TRACE_MAX_SPANS:
+            self.dropped += 1
+            return None
+        self.spans.append(span)
+        return span
+
+    def to_dict(self) -> Dict:
+
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat(),
+            "duration_ms": round(root.duration_ms, 2),
+            "error": root.error,
+            "attributes": root.attributes,
+            "dropped_spans": self.dropped,
+            "spans": [span.to_dict(root.started) for span in self.spans]
+        }
+
+class Tracer:
+
+    # In-process tracing: one trace per request with child spans for DB calls,
+    # upstream HTTP and generation phases. Finished traces go to a ring buffer
+    # (GET /admin/traces) and, with TRACE_FILE, one JSON line each to a file;
+    # no collector needed. The current span lives in a ContextVar, so work in
+    # threadpool dependencies lands in the right trace.
+
+    def __init__(self):
+
+        self.buffer = deque(maxlen=settings.TRACE_BUFFER_SIZE)
+        self.lock = threading.Lock()
+        self.file = None
+        self.exported = 0
+
+    @staticmethod
+    def _parse_traceparent(value: Optional[str]):
+
+        # Returns (trace id, parent span id, sampled), or None when absent or invalid.
+        parts = (value or "").strip().split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        try:
+            int(parts[1], 16), int(parts[2], 16)
+            sampled = int(parts[3], 16) & 1
+        except ValueError:
+            return None
+        if parts[1] == "0" * 32:
+            return None
+        return parts[1], parts[2], bool(sampled)
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes) -> Optional[Span]:
+
+        # A root span, continuing the caller's trace when it sent a traceparent.
+        if not settings.TRACING_ENABLED:
+            return None
+        incoming = self._parse_traceparent(traceparent)
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < settings.TRACE_SAMPLE_RATE
+        if not sampled:
+            return None
+        trace = Trace(trace_id)
+        trace.root = trace.add(Span(trace, name, parent_id, attributes))
+        return trace.root
+
+    @contextmanager
+    def trace(self, name: str, traceparent: Optional[str] = None, **attributes):
+
+        root = self.start_trace(name, traceparent, **attributes)
+        if root is None:
+            yield None
+            return
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.end(error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end()
+
+    @staticmethod
+    def current() -> Optional[Span]:
+
+        return _current_span.get()
+
+    def start_span(self, name: str, **attributes) -> Optional[Span]:
+
+        # A child of the current span that does not become current itself.
+        # Safe inside async generators, which may resume in another context.
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        return parent.trace.add(Span(parent.trace, name, parent.span_id, attributes))
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+
+        span = self.start_span(name, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def record(self, name: str, started: float, finished: float, parent: Optional[Span] = None, **attributes) -> Optional[Span]:
+
+        # A span measured after the fact from perf_counter() readings.
+        parent = parent or _current_span.get()
+        if parent is None:
+            return None
+        span = parent.trace.add(Span(parent.trace, name, parent.span_id, attributes, started=started))
+        if span is not None:
+            span.end(finished=finished)
+        return span
+
+    def set_attributes(self, **attributes):
+
+        span = _current_span.get()
+        if span is not None:
+            span.trace.root.set(**attributes)
+
+    def traceparent(self) -> Optional[str]:
+
+        span = _current_span.get()
+        return span.traceparent() if span is not None else None
+
+    def export(self, trace: Trace):
+
+        entry = trace.to_dict()
+        self.buffer.append(entry)
+        self.exported += 1
+        if not settings.TRACE_FILE:
+            return
+        line = dumps(entry) + b"\n"
+        with self.lock:
+            try:
+                if self.file is None:
+                    self.file = open(settings.TRACE_FILE, "ab")
+                self.file.write(line)
+                self.file.flush()
+            except OSError as e:
+                print(f"⚠ Could not write trace file {settings.TRACE_FILE}: {e}")
+
+    def find(self, trace_id: str) -> Optional[Dict]:
+
+        for entry in reversed(self.buffer):
+            if entry["trace_id"] == trace_id:
+                return entry
+        return None
+
+    def recent(self, limit: int = 50, min_ms: float = 0.0, name: Optional[str] = None) -> List[Dict]:
+
+        entries = []
+        for entry in reversed(self.buffer):
+            if entry["duration_ms"] < min_ms or (name and name not in entry["name"]):
+                continue
+            entries.append({
+                "trace_id": entry["trace_id"],
+                "name": entry["name"],
+                "started_at": entry["started_at"],
+                "duration_ms": entry["duration_ms"],
+                "error": entry["error"],
+                "spans": len(entry["spans"]),
+                "attributes": entry["attributes"]
+            })
+            if len(entries) >= limit:
+                break
+        return entries
+
+    def close(self):
+
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class TracingMiddleware:
+
+    # The root span of every HTTP request. Its id comes back in X-Trace-Id, so a
+    # slow request seen in the browser can be looked up under /admin/traces.
+
+    def __init__(self, app):
+
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1") or None
+        with tracer.trace(f"{scope['method']} {scope['path']}", traceparent, method=scope["method"], path=scope["path"]) as root:
+            if root is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_wrapper(message):
+
+                if message["type"] == "http.response.start":
+                    root.set(status=message["status"])
+                    message["headers"] = list(message.get("headers") or []) + [(b"x-trace-id", root.trace.trace_id.encode())]
+                elif message["type"] == "http.response.body" and "first_byte_ms" not in root.attributes:
+                    root.set(first_byte_ms=round((time.perf_counter() - root.started) * 1000.0, 2))
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+tracer = Tracer()
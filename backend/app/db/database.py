@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core.diagnostics import instrument_engine
 from app.db.models import Base
 
 engine = create_engine(
@@ -8,11 +11,101 @@ engine = create_engine(
     connect_args={"check_same_thread": False}
 )
 
+if engine.dialect.name == "sqlite":
+
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+
+        # WAL lets readers proceed while another worker process writes, and the
+        # busy timeout makes writers wait for the lock instead of failing.
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        # SQLite ignores foreign keys, including ON DELETE CASCADE, unless asked.
+        cursor.execute("PRAGMA foreign_keys=ON")
+        if settings.SQLITE_WAL_ENABLED:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+if settings.DIAGNOSTICS_ENABLED:
+    instrument_engine(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _backfill_message_tree(conn):
+
+    # Sessions written before messages had parents were linear: chain each
+    # message to the one before it and make the last one the active leaf. Runs
+    # in the transaction that adds the column, so it happens exactly once.
+    rows = conn.execute(text(
+        "SELECT id, session_id FROM chat_messages ORDER BY session_id, created_at, id"
+    ))
+    parents, leaves = [], {}
+    previous_id, previous_session = None, None
+    for message_id, session_id in rows:
+        if session_id == previous_session:
+            parents.append({"id": message_id, "parent_id": previous_id})
+        leaves[session_id] = message_id
+        previous_id, previous_session = message_id, session_id
+
+    if parents:
+        conn.execute(text("UPDATE chat_messages SET parent_id = :parent_id WHERE id = :id"), parents)
+    if leaves:
+        conn.execute(
+            text("UPDATE chat_sessions SET active_message_id = :leaf WHERE id = :id"),
+            [{"id": session_id, "leaf": leaf} for session_id, leaf in leaves.items()]
+        )
+    print(f"✓ Linked {len(parents)} messages into branches for {len(leaves)} sessions")
+
+def _add_missing_columns():
+
+    # create_all never alters existing tables, so columns added to the models
+    # after a database was created are appended here as nullable columns.
+    # Constraints are not: tables created before ON DELETE CASCADE keep plain
+    # foreign keys, which is why deletes also remove children explicitly.
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        added = set()
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                added.add(f"{table.name}.{column.name}")
+
+        if "chat_messages.parent_id" in added:
+            _backfill_message_tree(conn)
+
+def _add_missing_indexes():
+
+    # Likewise for indexes declared on existing tables.
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine, checkfirst=True)
+
 def init_db():
 
-    Base.metadata.create_all(bind=engine)
+    # Workers started without a master-side init (uvicorn --workers) can race
+    # each other here; whoever loses retries against the now-current schema.
+    for attempt in range(3):
+        try:
+            Base.metadata.create_all(bind=engine)
+            _add_missing_columns()
+            _add_missing_indexes()
+            return
+        except OperationalError:
+            if attempt == 2:
+                raise
+            time.sleep(0.2 * (attempt + 1))
 
 def get_db():
 
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Float, UniqueConstraint, LargeBinary, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
+from app.core.compression import message_codec
 
 Base = declarative_base()
 
@@ -16,30 +18,207 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Tombstone: a deleted account is hidden and locked out at once while its
+    # chats are purged in the background (app.services.deletion_service).
+    deleted_at = Column(DateTime, nullable=True, index=True)
 
-    sessions = relationship("ChatSession", back_populates="user", cascade="all, delete-orphan")
+    # lazy="raise_on_sql": collections must be loaded explicitly (selectinload) or
+    # queried directly, so an accidental per-row lazy load fails instead of N+1.
+    # passive_deletes: children are removed by ON DELETE CASCADE or set-based
+    # deletes, never loaded into the session just to be deleted one by one.
+    sessions = relationship(
+        "ChatSession",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        lazy="raise_on_sql",
+        passive_deletes=True
+    )
 
 class ChatSession(Base):
 
     __tablename__ = "chat_sessions"
+    # NULL keys do not collide, so only imported sessions are constrained.
+    __table_args__ = (Index("ix_chat_sessions_import_key", "user_id", "import_key", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     title = Column(String(200), default="New Chat")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Integer, nullable=True)
+    summary_updated_at = Column(DateTime, nullable=True)
+    # Leaf of the branch the user is looking at; the conversation shown and sent
+    # as context is the parent chain from here to the root.
+    active_message_id = Column(Integer, nullable=True)
+    # Set while the messages live in the archive tier (app.services.archive_service)
+    # instead of chat_messages; the row itself stays as a stub for the sidebar.
+    archived_at = Column(DateTime, nullable=True, index=True)
+    archived_messages = Column(Integer, nullable=True)
+    # Length of the active branch at archive time, for the sidebar count.
+    archived_path_messages = Column(Integer, nullable=True)
+    # Opening a session does not move updated_at, so this keeps a session that
+    # was just restored from going straight back to the archive.
+    restored_at = Column(DateTime, nullable=True)
+    # Content hash of an imported conversation; a retried import skips it.
+    import_key = Column(String(64), nullable=True)
 
     user = relationship("User", back_populates="sessions")
-    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    messages = relationship(
+        "ChatMessage",
+        back_populates="session",
+        cascade="all, delete-orphan",
+        lazy="raise_on_sql",
+        passive_deletes=True,
+        order_by="(ChatMessage.created_at, ChatMessage.id)"
+    )
 
 class ChatMessage(Base):
 
     __tablename__ = "chat_messages"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
+    session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Edits and regenerations add a sibling under the same parent instead of
+    # deleting the old turns, so a session is a tree of branches.
+    parent_id = Column(Integer, ForeignKey("chat_messages.id", ondelete="CASCADE"), nullable=True, index=True)
     role = Column(String(20), nullable=False)
-    content = Column(Text, nullable=False)
+    # Large bodies may be stored zstd-compressed in content_zstd, leaving
+    # content empty; content_size keeps the original length for SQL that sums
+    # lengths (and, being set only on compressed rows, finds them by index).
+    # Read and write through the content property below.
+    _content = Column("content", Text, nullable=False)
+    content_zstd = Column(LargeBinary, nullable=True)
+    content_dict = Column(Integer, nullable=True)
+    content_size = Column(Integer, nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Set once the message is in its owner's vector index (semantic_service).
+    embedded_at = Column(DateTime, nullable=True, index=True)
 
     session = relationship("ChatSession", back_populates="messages")
+
+    @hybrid_property
+    def content(self):
+
+        # Decoded on first access only, so rows loaded for ids, roles or the
+        # tree walk never pay for decompression.
+        if self.content_zstd is None:
+            return self._content
+        decoded = self.__dict__.get("_decoded_content")
+        if decoded is None:
+            decoded = message_codec.decompress(self.content_zstd, self.content_dict)
+            self.__dict__["_decoded_content"] = decoded
+        return decoded
+
+    @content.setter
+    def content(self, value):
+
+        self.__dict__.pop("_decoded_content", None)
+        compressed = message_codec.compress(value)
+        if compressed is None:
+            self._content = value
+            self.content_zstd = None
+            self.content_dict = None
+            self.content_size = None
+        else:
+            self._content = ""
+            self.content_zstd, self.content_dict = compressed
+            self.content_size = len(value)
+
+    @content.expression
+    def content(cls):
+
+        # SQL sees the plain column only: compressed rows read as "".
+        return cls._content
+
+    @hybrid_property
+    def content_length(self):
+
+        return len(self.content)
+
+    @content_length.expression
+    def content_length(cls):
+
+        return func.coalesce(cls.content_size, func.length(cls._content))
+
+class InferenceMetric(Base):
+
+    __tablename__ = "inference_metrics"
+
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(Integer, ForeignKey("chat_messages.id", ondelete="SET NULL"), nullable=True, index=True)
+    # Plain columns rather than foreign keys so workload history survives
+    # deleted sessions and accounts.
+    user_id = Column(Integer, nullable=True, index=True)
+    session_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    backend = Column(String(200), nullable=True)
+    model = Column(String(200), nullable=True)
+    route = Column(String(50), nullable=True)
+    route_reason = Column(String(20), nullable=True)
+    task = Column(String(20), nullable=True)
+    mode = Column(String(20), nullable=True)
+    streamed = Column(Boolean, default=False)
+    coalesced = Column(Boolean, default=False)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)
+    draft_tokens = Column(Integer, nullable=True)
+    draft_accepted = Column(Integer, nullable=True)
+    queued_ms = Column(Float, nullable=True)
+    ttft_ms = Column(Float, nullable=True)
+    prompt_ms = Column(Float, nullable=True)
+    generation_ms = Column(Float, nullable=True)
+    tokens_per_second = Column(Float, nullable=True)
+    max_tokens = Column(Integer, nullable=True)
+    temperature = Column(Float, nullable=True)
+    top_p = Column(Float, nullable=True)
+
+class UsageRollup(Base):
+
+    __tablename__ = "usage_rollups"
+    __table_args__ = (UniqueConstraint("period", "user_id", "bucket", name="uq_usage_rollups_bucket"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String(8), nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    # 0 holds the totals across all users.
+    user_id = Column(Integer, nullable=False, default=0)
+    messages = Column(Integer, nullable=False, default=0)
+    sessions = Column(Integer, nullable=False, default=0)
+    requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    active_users = Column(Integer, nullable=False, default=0)
+
+class ArchivedSession(Base):
+
+    __tablename__ = "archived_sessions"
+
+    # Where a session's archived message tree is: one compressed record in an
+    # append-only segment file.
+    session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), primary_key=True)
+    segment = Column(Integer, nullable=False, index=True)
+    offset = Column(Integer, nullable=False)
+    length = Column(Integer, nullable=False)
+    codec = Column(String(10), nullable=False)
+    checksum = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CompressionDictionary(Base):
+
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    data = Column(LargeBinary, nullable=False)
+    samples = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class UsageCounter(Base):
+
+    __tablename__ = "usage_counters"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
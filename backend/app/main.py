@@ -2,22 +2,54 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.core.config import settings
+from app.core.diagnostics import SlowRequestMiddleware, loop_lag_monitor
+from app.core.tracing import TracingMiddleware, tracer
+from app.core.state import state_store
+from app.core.serialization import FastJSONResponse
 from app.db.database import init_db
 from app.services.inference_service import inference_service
+from app.services.summary_service import summary_service
+from app.services.health_service import health_monitor
+from app.services.usage_service import usage_aggregator
+from app.services.persistence_service import write_behind
+from app.services.deletion_service import account_purger
+from app.services.archive_service import session_archiver
+from app.services.semantic_service import embedding_indexer
 from app.api.endpoints import auth, chat, admin
 import json
+import os
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
-    inference_service.check_health()
+    write_behind.start()
+    health_monitor.start()
+    summary_service.start()
+    usage_aggregator.start()
+    account_purger.start()
+    session_archiver.start()
+    embedding_indexer.start()
+    if settings.DIAGNOSTICS_ENABLED:
+        loop_lag_monitor.start()
 
     yield
 
+    await loop_lag_monitor.stop()
+    await summary_service.stop()
+    await health_monitor.stop()
+    await usage_aggregator.stop()
+    await account_purger.stop()
+    await session_archiver.stop()
+    await embedding_indexer.stop()
+    # Last, so writes from requests finishing during shutdown are committed.
+    await write_behind.stop()
+    tracer.close()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description="A lightweight, CPU-only web application for LLM inference",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
 
@@ -27,8 +59,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Degrade-Mode",
+        "Retry-After",
+        "X-RateLimit-Limit",
+        "X-RateLimit-Remaining",
+        "X-RateLimit-Reset",
+        "X-RateLimit-Tokens-Limit",
+        "X-RateLimit-Tokens-Remaining",
+        "X-Trace-Id",
+    ],
 )
 
+if settings.DIAGNOSTICS_ENABLED:
+    app.add_middleware(SlowRequestMiddleware)
+
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
 app.include_router(auth.router, prefix=settings.API_V1_STR)
 app.include_router(chat.router, prefix=settings.API_V1_STR)
 app.include_router(admin.router, prefix=settings.API_V1_STR)
@@ -41,11 +89,26 @@ async def root():
         "docs": "/docs"
     }
 
+@app.get("/livez")
+async def liveness_check():
+    # The process and its event loop are responsive; says nothing about llama-server.
+    return {"status": "alive", "worker_pid": os.getpid()}
+
+@app.get("/readyz")
+async def readiness_check():
+    readiness = health_monitor.readiness()
+    return FastJSONResponse(
+        content=readiness,
+        status_code=200 if readiness["ready"] else 503
+    )
+
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
-        "model_loaded": inference_service.model_loaded
+        "model_loaded": inference_service.model_loaded,
+        "worker_pid": os.getpid(),
+        "state_backend": state_store.name
     }
 
 if __name__ == "__main__":
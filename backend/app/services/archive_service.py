@@ -0,0 +1,409 @@
+import asyncio
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, or_, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.compression import decode_content, zstandard
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.core.state import state_store, process_id
+from app.db.database import SessionLocal
+from app.db.models import User, ChatSession, ChatMessage, ArchivedSession
+
+class SegmentStore:
+
+    # Append-only segment files, one compressed record per archived session.
+    # Only the archiver (behind a cluster-wide lock) appends; readers map each
+    # segment once and slice records out of the mapping, remapping when a
+    # record lies past the end they mapped.
+
+    def __init__(self, directory: str):
+
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.maps: Dict[int, Tuple[object, mmap.mmap]] = {}
+
+    def path(self, segment: int) -> str:
+
+        return os.path.join(self.directory, f"segment-{segment:06d}.arc")
+
+    def segments(self) -> List[int]:
+
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            int(name[8:14]) for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".arc")
+        )
+
+    def append(self, records: List[bytes]) -> List[Tuple[int, int]]:
+
+        # Returns (segment, offset) per record, durable on disk before the
+        # database points at it.
+        os.makedirs(self.directory, exist_ok=True)
+        existing = self.segments()
+        segment = existing[-1] if existing else 1
+        handle = open(self.path(segment), "ab")
+        locations = []
+        try:
+            for record in records:
+                if handle.tell() and handle.tell() + len(record) > settings.ARCHIVE_SEGMENT_MAX_BYTES:
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                    handle.close()
+                    segment += 1
+                    handle = open(self.path(segment), "ab")
+                locations.append((segment, handle.tell()))
+                handle.write(record)
+            handle.flush()
+            os.fsync(handle.fileno())
+        finally:
+            handle.close()
+        return locations
+
+    def read(self, segment: int, offset: int, length: int) -> bytes:
+
+        with self.lock:
+            entry = self.maps.get(segment)
+            if entry is None or len(entry[1]) < offset + length:
+                if entry is not None:
+                    entry[1].close()
+                    entry[0].close()
+                handle = open(self.path(segment), "rb")
+                entry = (handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+                self.maps[segment] = entry
+            return entry[1][offset:offset + length]
+
+    def remove(self, segment: int):
+
+        with self.lock:
+            entry = self.maps.pop(segment, None)
+            if entry is not None:
+                entry[1].close()
+                entry[0].close()
+        os.remove(self.path(segment))
+
+def _encode(payload: bytes) -> Tuple[str, bytes]:
+
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=settings.ARCHIVE_COMPRESSION_LEVEL).compress(payload)
+    return "zlib", zlib.compress(payload, min(settings.ARCHIVE_COMPRESSION_LEVEL, 9))
+
+def _decode(codec: str, record: bytes) -> bytes:
+
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this archived session")
+        return zstandard.ZstdDecompressor().decompress(record)
+    return zlib.decompress(record)
+
+def _path_length(messages: List[list], leaf_id: Optional[int]) -> int:
+
+    # Messages on the parent chain from the active leaf, as the sidebar counts them.
+    parents = {message[0]: message[1] for message in messages}
+    length = 0
+    while leaf_id in parents:
+        length += 1
+        leaf_id = parents[leaf_id]
+    return length
+
+class ArchiveService:
+
+    # Sessions nobody has touched for ARCHIVE_AFTER_DAYS leave chat_messages for
+    # the segment files, which keeps the hot table and its indexes small. The
+    # session row stays behind as a stub (title, dates, summary, active leaf),
+    # so the sidebar is unaffected, and the first request that needs the
+    # messages moves them back with their original ids.
+
+    store = SegmentStore(settings.ARCHIVE_DIR)
+
+    @staticmethod
+    def _payload(db: Session, session_id: int) -> List[list]:
+
+        rows = db.query(
+            ChatMessage.id, ChatMessage.parent_id, ChatMessage.role, ChatMessage.content,
+            ChatMessage.content_zstd, ChatMessage.content_dict, ChatMessage.created_at
+        ).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.id.asc()).all()
+        return [
+            [message_id, parent_id, role, decode_content(content, blob, dict_id), created_at]
+            for message_id, parent_id, role, content, blob, dict_id, created_at in rows
+        ]
+
+    @staticmethod
+    def archive_idle(db: Session, days: int = None) -> dict:
+
+        cutoff = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS if days is None else days)
+        eligible = [
+            ChatSession.archived_at.is_(None),
+            ChatSession.updated_at < cutoff,
+            or_(ChatSession.restored_at.is_(None), ChatSession.restored_at < cutoff)
+        ]
+        totals = {"sessions": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+        last_id = 0
+        while True:
+            session_ids = [row[0] for row in db.query(ChatSession.id).filter(
+                ChatSession.id > last_id, *eligible
+            ).order_by(ChatSession.id.asc()).limit(settings.ARCHIVE_BATCH_SESSIONS).all()]
+            if not session_ids:
+                break
+            last_id = session_ids[-1]
+
+            leaves = dict(db.query(ChatSession.id, ChatSession.active_message_id).filter(
+                ChatSession.id.in_(session_ids)
+            ).all())
+            records, entries, path_lengths = [], [], {}
+            for session_id in session_ids:
+                messages = ArchiveService._payload(db, session_id)
+                if not messages:
+                    continue
+                path_lengths[session_id] = _path_length(messages, leaves.get(session_id))
+                raw = dumps(messages)
+                codec, record = _encode(raw)
+                records.append(record)
+                entries.append({
+                    "session_id": session_id,
+                    "codec": codec,
+                    "length": len(record),
+                    "checksum": zlib.crc32(record),
+                    "message_count": len(messages),
+                    "raw_bytes": len(raw)
+                })
+            db.rollback()
+            if not records:
+                continue
+
+            # Segment first: a crash between the two leaves unreferenced bytes,
+            # never an index row pointing at nothing.
+            for entry, (segment, offset) in zip(entries, ArchiveService.store.append(records)):
+                entry["segment"] = segment
+                entry["offset"] = offset
+
+            # Re-checked inside the write: a session written to since it was
+            # read keeps its messages in the hot table.
+            still_idle = {row[0] for row in db.query(ChatSession.id).filter(
+                ChatSession.id.in_([entry["session_id"] for entry in entries]), *eligible
+            ).all()}
+            counts = dict(db.query(ChatMessage.session_id, func.count(ChatMessage.id)).filter(
+                ChatMessage.session_id.in_(still_idle)
+            ).group_by(ChatMessage.session_id).all())
+            entries = [entry for entry in entries if counts.get(entry["session_id"]) == entry["message_count"]]
+            if not entries:
+                db.rollback()
+                continue
+
+            now = datetime.utcnow()
+            archived_ids = [entry["session_id"] for entry in entries]
+            db.execute(ArchivedSession.__table__.insert(), [{**entry, "created_at": now} for entry in entries])
+            db.execute(delete(ChatMessage).where(ChatMessage.session_id.in_(archived_ids)))
+            for entry in entries:
+                # updated_at is kept: archiving is not activity.
+                db.execute(update(ChatSession).where(ChatSession.id == entry["session_id"]).values(
+                    archived_at=now,
+                    archived_messages=entry["message_count"],
+                    archived_path_messages=path_lengths[entry["session_id"]],
+                    updated_at=ChatSession.updated_at
+                ))
+            db.commit()
+            totals["sessions"] += len(entries)
+            totals["messages"] += sum(entry["message_count"] for entry in entries)
+            totals["raw_bytes"] += sum(entry["raw_bytes"] for entry in entries)
+            totals["stored_bytes"] += sum(entry["length"] for entry in entries)
+        return totals
+
+    @staticmethod
+    def read_messages(db: Session, session_id: int) -> List[list]:
+
+        entry = db.query(ArchivedSession).filter(ArchivedSession.session_id == session_id).first()
+        if entry is None:
+            return []
+        record = ArchiveService.store.read(entry.segment, entry.offset, entry.length)
+        if zlib.crc32(record) != entry.checksum:
+            raise RuntimeError(f"Archived session {session_id} is corrupt (segment {entry.segment})")
+        return json.loads(_decode(entry.codec, record))
+
+    @staticmethod
+    def rehydrate(db: Session, session: ChatSession) -> bool:
+
+        # Claim the session first so two requests opening it at once cannot
+        # both restore it; the loser sees rowcount 0, reloads and gets False.
+        claimed = db.execute(update(ChatSession).where(
+            ChatSession.id == session.id,
+            ChatSession.archived_at.isnot(None)
+        ).values(
+            archived_at=None,
+            archived_messages=None,
+            archived_path_messages=None,
+            restored_at=datetime.utcnow(),
+            updated_at=ChatSession.updated_at
+        )).rowcount
+        if not claimed:
+            db.rollback()
+            db.refresh(session)
+            return False
+
+        messages = ArchiveService.read_messages(db, session.id)
+        ids = [message[0] for message in messages]
+        taken = db.query(func.count(ChatMessage.id)).filter(ChatMessage.id.in_(ids)).scalar() if ids else 0
+
+        mapping = {}
+        if not taken:
+            db.add_all([
+                ChatMessage(
+                    id=message_id,
+                    session_id=session.id,
+                    parent_id=parent_id,
+                    role=role,
+                    content=content,
+                    created_at=datetime.fromisoformat(created_at)
+                )
+                for message_id, parent_id, role, content, created_at in messages
+            ])
+            db.flush()
+        else:
+            # Another message reused an id after these rows left the table
+            # (SQLite hands out max(id) + 1), so the tree gets new ids.
+            for message_id, parent_id, role, content, created_at in messages:
+                message = ChatMessage(
+                    session_id=session.id,
+                    parent_id=mapping.get(parent_id),
+                    role=role,
+                    content=content,
+                    created_at=datetime.fromisoformat(created_at)
+                )
+                db.add(message)
+                db.flush()
+                mapping[message_id] = message.id
+
+        values = {"updated_at": ChatSession.updated_at}
+        if mapping:
+            values["active_message_id"] = mapping.get(session.active_message_id)
+            values["summary_message_id"] = mapping.get(session.summary_message_id)
+        db.execute(update(ChatSession).where(ChatSession.id == session.id).values(**values))
+        db.execute(delete(ArchivedSession).where(ArchivedSession.session_id == session.id))
+        db.commit()
+
+        set_committed_value(session, "archived_at", None)
+        set_committed_value(session, "archived_messages", None)
+        set_committed_value(session, "archived_path_messages", None)
+        set_committed_value(session, "restored_at", datetime.utcnow())
+        if mapping:
+            set_committed_value(session, "active_message_id", values["active_message_id"])
+            set_committed_value(session, "summary_message_id", values["summary_message_id"])
+        return True
+
+    @staticmethod
+    def search(db: Session, user: User, query: str, limit: int = 50) -> List[int]:
+
+        # Case-insensitive substring match over the user's archived sessions,
+        # read straight from the segments without restoring them. Newest
+        # first, stopping at limit: search results are cut to the newest
+        # sessions anyway, so older segments need not be decompressed.
+        needle = query.lower()
+        session_ids = [row[0] for row in db.query(ChatSession.id).filter(
+            ChatSession.user_id == user.id,
+            ChatSession.archived_at.isnot(None)
+        ).order_by(ChatSession.updated_at.desc()).all()]
+        matched = []
+        for session_id in session_ids:
+            if any(needle in message[3].lower() for message in ArchiveService.read_messages(db, session_id)):
+                matched.append(session_id)
+                if len(matched) >= limit:
+                    break
+        return matched
+
+    @staticmethod
+    def collect_segments(db: Session) -> int:
+
+        # Rehydrated and deleted sessions leave dead records behind; a segment
+        # nobody points at any more is removed. The newest one is still being
+        # appended to and is always kept.
+        segments = ArchiveService.store.segments()[:-1]
+        live = {row[0] for row in db.query(ArchivedSession.segment).distinct().all()}
+        removed = 0
+        for segment in segments:
+            if segment not in live:
+                ArchiveService.store.remove(segment)
+                removed += 1
+        return removed
+
+    @staticmethod
+    def stats(db: Session) -> dict:
+
+        sessions, messages, raw_bytes, stored_bytes = db.query(
+            func.count(ArchivedSession.session_id),
+            func.coalesce(func.sum(ArchivedSession.message_count), 0),
+            func.coalesce(func.sum(ArchivedSession.raw_bytes), 0),
+            func.coalesce(func.sum(ArchivedSession.length), 0)
+        ).one()
+        segments = ArchiveService.store.segments()
+        disk_bytes = sum(os.path.getsize(ArchiveService.store.path(segment)) for segment in segments)
+        return {
+            "sessions": sessions,
+            "messages": messages,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "segments": len(segments),
+            "disk_bytes": disk_bytes
+        }
+
+class SessionArchiver:
+
+    def __init__(self):
+
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+
+        if settings.ARCHIVE_ENABLED and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def _run(self):
+
+        while True:
+            if state_store.acquire_lock("session_archive", process_id(), ttl=3600):
+                try:
+                    await asyncio.to_thread(self.run_once)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Session archive error: {e}")
+                finally:
+                    state_store.release_lock("session_archive", process_id())
+            await asyncio.sleep(settings.ARCHIVE_POLL_SECONDS)
+
+    def run_once(self, days: int = None) -> dict:
+
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            totals = ArchiveService.archive_idle(db, days)
+            totals["segments_removed"] = ArchiveService.collect_segments(db)
+            if totals["sessions"] or totals["segments_removed"]:
+                print(
+                    f"✓ Archived {totals['sessions']} sessions ({totals['messages']} messages, "
+                    f"{totals['raw_bytes']} → {totals['stored_bytes']} bytes), removed "
+                    f"{totals['segments_removed']} segments in {time.perf_counter() - started:.2f}s"
+                )
+            return totals
+        finally:
+            db.close()
+
+session_archiver = SessionArchiver()
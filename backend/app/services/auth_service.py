@@ -2,6 +2,8 @@ from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.db.models import User
+from app.services.usage_service import UsageService
+from app.core.tracing import tracer
 from app.core.security import verify_password, get_password_hash, create_access_token, decode_access_token
 from app.api.models.schemas import UserCreate, UserLogin, UserUpdate
 from typing import Optional
@@ -32,6 +34,7 @@ class AuthService:
             hashed_password=hashed_password
         )
         db.add(db_user)
+        UsageService.bump_counters(db, users=1, active_users=1)
         db.commit()
         db.refresh(db_user)
         return db_user
@@ -40,7 +43,7 @@ class AuthService:
     def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
 
         user = db.query(User).filter(User.username == username).first()
-        if not user:
+        if not user or user.deleted_at is not None:
             return None
         if not verify_password(password, user.hashed_password):
             return None
@@ -71,30 +74,33 @@ class AuthService:
         db: Session = None
     ) -> User:
 
-        token = credentials.credentials
-        payload = decode_access_token(token)
+        with tracer.span("auth.get_current_user"):
+            token = credentials.credentials
+            payload = decode_access_token(token)
 
-        if payload is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials"
-            )
+            if payload is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate credentials"
+                )
 
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials"
-            )
+            username: str = payload.get("sub")
+            if username is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate credentials"
+                )
 
-        user = db.query(User).filter(User.username == username).first()
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
+            user = db.query(User).filter(User.username == username).first()
+            # Tokens of a deleted account die with the tombstone, not at expiry.
+            if user is None or user.deleted_at is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="User not found"
+                )
 
-        return user
+            tracer.set_attributes(user_id=user.id)
+            return user
 
     @staticmethod
     def update_user(db: Session, user: User, update_data: UserUpdate) -> User:
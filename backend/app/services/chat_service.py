@@ -1,71 +1,382 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import func, or_, select, literal
 from app.db.models import User, ChatSession, ChatMessage
 from app.api.models.schemas import ChatSessionCreate, InferenceRequest
-from typing import List, Optional
+from app.core.config import settings
+from app.core.compression import decode_content
+from app.core.state import state_store
+from app.services.usage_service import UsageService
+from app.services.deletion_service import DeletionService
+from app.services.archive_service import ArchiveService
+from app.services.push_service import push_hub
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
 from datetime import datetime, timedelta
 from fastapi import HTTPException, status
 
+def estimate_tokens(text: str) -> int:
+
+    # Roughly four characters per token for English text with Phi/Llama tokenizers.
+    return len(text) // 4 + 1
+
+MESSAGE_FIELDS = ("id", "role", "content", "created_at", "parent_id")
+
+# Passed as parent_id to add_message: append to the session's active leaf.
+ACTIVE_LEAF = -1
+
+class ChatVersions:
+
+    # A per-user counter bumped on every session or message write. It is shared
+    # across workers through the state store and prefixed with an epoch, so a
+    # counter that restarts from zero (memory store) never repeats an old stamp.
+
+    @staticmethod
+    def _epoch() -> str:
+
+        epoch = state_store.get("chat_version_epoch")
+        if epoch is None:
+            epoch = str(int(time.time() * 1000))
+            state_store.set("chat_version_epoch", epoch)
+        return epoch
+
+    @staticmethod
+    def get(user_id: int) -> str:
+
+        return f"{ChatVersions._epoch()}.{state_store.get(f'chat_version:{user_id}') or 0}"
+
+    @staticmethod
+    def bump(user_id: int) -> str:
+
+        version = f"{ChatVersions._epoch()}.{state_store.incr(f'chat_version:{user_id}')}"
+        # Open WebSocket tabs of this user refetch their sidebar.
+        push_hub.publish(user_id, "v", version)
+        return version
+
+class SidebarCache:
+
+    def __init__(self, max_users: int = 1024):
+
+        self.max_users = max_users
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[str, List[dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, limit: int, version: str) -> Optional[List[dict]]:
+
+        with self._lock:
+            entry = self._entries.get((user_id, limit))
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end((user_id, limit))
+            return entry[1]
+
+    def put(self, user_id: int, limit: int, version: str, sessions: List[dict]):
+
+        with self._lock:
+            self._entries[(user_id, limit)] = (version, sessions)
+            self._entries.move_to_end((user_id, limit))
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+sidebar_cache = SidebarCache()
+
 class ChatService:
 
     @staticmethod
     def create_session(db: Session, user: User, session_data: ChatSessionCreate) -> ChatSession:
 
+        session_count = db.query(func.count(ChatSession.id)).filter(ChatSession.user_id == user.id).scalar()
+        if session_count >= settings.MAX_SESSIONS_PER_USER:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Session limit reached ({settings.MAX_SESSIONS_PER_USER}); delete old chats to start new ones"
+            )
+
         session = ChatSession(
             user_id=user.id,
             title=session_data.title or "New Chat"
         )
         db.add(session)
+        UsageService.record_usage(db, user.id, sessions=1)
+        UsageService.bump_counters(db, sessions=1)
         db.commit()
         db.refresh(session)
+        ChatVersions.bump(user.id)
         return session
 
     @staticmethod
-    def get_session(db: Session, session_id: int, user: User) -> Optional[ChatSession]:
+    def get_session(db: Session, session_id: int, user: User, rehydrate: bool = True) -> Optional[ChatSession]:
 
         session = db.query(ChatSession).filter(
             ChatSession.id == session_id,
             ChatSession.user_id == user.id
         ).first()
+        # Callers get a session whose messages are in chat_messages; an archived
+        # one is restored here. Pass rehydrate=False when only the row matters.
+        if session is not None and session.archived_at is not None and rehydrate:
+            try:
+                # Restored ids may differ from the archived ones, so cached
+                # histories (ETags, sidebar) must be refetched.
+                if ArchiveService.rehydrate(db, session):
+                    ChatVersions.bump(user.id)
+            except OperationalError:
+                # Lost the write race to another request restoring the same session.
+                db.rollback()
+                db.refresh(session)
+                if session.archived_at is not None:
+                    raise
+        return session
+
+    @staticmethod
+    def get_session_detail(db: Session, session_id: int, user: User) -> Optional[dict]:
+
+        session = ChatService.get_session(db, session_id, user)
+        if not session:
+            return None
+        return {
+            "id": session.id,
+            "title": session.title,
+            "created_at": session.created_at,
+            "updated_at": session.updated_at,
+            "messages": ChatService.get_path_with_siblings(db, session)
+        }
+
+    @staticmethod
+    def _active_path(leaf_id: int, stop_at: Optional[int] = None):
+
+        # Recursive walk from the leaf up the parent chain; every step is a
+        # primary-key lookup, so it costs one index probe per turn on the path.
+        # depth 0 is the leaf. With stop_at the walk ends at that message.
+        path = select(
+            ChatMessage.id, ChatMessage.parent_id, literal(0).label("depth")
+        ).where(ChatMessage.id == leaf_id).cte("active_path", recursive=True)
+        parent = aliased(ChatMessage)
+        step = select(parent.id, parent.parent_id, path.c.depth + 1).where(parent.id == path.c.parent_id)
+        if stop_at is not None:
+            step = step.where(path.c.id != stop_at)
+        return path.union_all(step)
+
+    @staticmethod
+    def get_path_messages(db: Session, session: ChatSession) -> List[ChatMessage]:
+
+        if session.active_message_id is None:
+            return []
+        path = ChatService._active_path(session.active_message_id)
+        return db.query(ChatMessage).join(path, ChatMessage.id == path.c.id).order_by(path.c.depth.desc()).all()
+
+    @staticmethod
+    def get_path_with_siblings(db: Session, session: ChatSession) -> List[dict]:
+
+        messages = ChatService.get_path_messages(db, session)
+        if not messages:
+            return []
+
+        # One indexed lookup on parent_id for the alternatives at every turn.
+        siblings = {}
+        parent_ids = {msg.parent_id for msg in messages if msg.parent_id is not None}
+        query = db.query(ChatMessage.id, ChatMessage.parent_id).filter(ChatMessage.session_id == session.id)
+        if messages[0].parent_id is None:
+            query = query.filter(or_(ChatMessage.parent_id.in_(parent_ids), ChatMessage.parent_id.is_(None)))
+        else:
+            query = query.filter(ChatMessage.parent_id.in_(parent_ids))
+        for message_id, parent_id in query.order_by(ChatMessage.id.asc()).all():
+            siblings.setdefault(parent_id, []).append(message_id)
+
+        return [
+            {
+                "id": msg.id,
+                "role": msg.role,
+                "content": msg.content,
+                "created_at": msg.created_at,
+                "parent_id": msg.parent_id,
+                "sibling_ids": siblings.get(msg.parent_id, [msg.id])
+            }
+            for msg in messages
+        ]
+
+    @staticmethod
+    def get_message(db: Session, session_id: int, message_id: int) -> ChatMessage:
+
+        message = db.query(ChatMessage).filter(
+            ChatMessage.id == message_id,
+            ChatMessage.session_id == session_id
+        ).first()
+        if not message:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Message not found"
+            )
+        return message
+
+    @staticmethod
+    def _subtree(message_id: int):
+
+        # Downward walk over the parent_id index.
+        tree = select(ChatMessage.id).where(ChatMessage.id == message_id).cte("subtree", recursive=True)
+        child = aliased(ChatMessage)
+        return tree.union_all(select(child.id).where(child.parent_id == tree.c.id))
+
+    @staticmethod
+    def set_active_leaf(db: Session, session: ChatSession, message_id: Optional[int]):
+
+        # Switching branches is not activity; keep the sidebar order as it is.
+        db.query(ChatSession).filter(ChatSession.id == session.id).update({
+            ChatSession.active_message_id: message_id,
+            ChatSession.updated_at: ChatSession.updated_at
+        }, synchronize_session=False)
+        set_committed_value(session, "active_message_id", message_id)
+
+    @staticmethod
+    def switch_branch(db: Session, session_id: int, message_id: int, user: User) -> ChatSession:
+
+        session = ChatService.get_session(db, session_id, user)
+        if not session:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Session not found"
+            )
+        ChatService.get_message(db, session_id, message_id)
+
+        # Resume the branch where it was last extended: its newest descendant.
+        subtree = ChatService._subtree(message_id)
+        leaf = db.query(func.max(subtree.c.id)).scalar()
+        ChatService.set_active_leaf(db, session, leaf)
+        db.commit()
+        ChatVersions.bump(user.id)
+        return session
+
+    @staticmethod
+    def rename_session(db: Session, session_id: int, user: User, title: str) -> ChatSession:
+
+        session = ChatService.get_session(db, session_id, user, rehydrate=False)
+        if not session:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Session not found"
+            )
+
+        session.title = title
+        db.commit()
+        db.refresh(session)
+        ChatVersions.bump(user.id)
         return session
 
     @staticmethod
-    def get_user_sessions(db: Session, user: User, limit: int = 100) -> List[dict]:
+    def search_sessions(db: Session, user: User, query: str, limit: int = 50, include_archived: bool = False) -> List[dict]:
+
+        # LIKE wildcards in the query are escaped, so SQL matches the same
+        # plain substring as the compressed and archive paths.
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{escaped}%"
+        matched_ids = ChatService._search_compressed(db, user, query)
+        if include_archived:
+            matched_ids += ArchiveService.search(db, user, query, limit)
+
+        sessions = db.query(ChatSession).filter(
+            ChatSession.user_id == user.id,
+            or_(
+                ChatSession.title.ilike(pattern, escape="\\"),
+                ChatSession.messages.any(ChatMessage.content.ilike(pattern, escape="\\")),
+                ChatSession.id.in_(matched_ids)
+            )
+        ).order_by(ChatSession.updated_at.desc()).limit(limit).all()
+
+        return ChatService._session_list(db, sessions)
 
-        sessions = db.query(
-            ChatSession,
-            func.count(ChatMessage.id).label('message_count')
-        ).outerjoin(
-            ChatMessage, ChatSession.id == ChatMessage.session_id
+    @staticmethod
+    def _search_compressed(db: Session, user: User, query: str) -> List[int]:
+
+        # SQL cannot look inside compressed bodies, so the user's compressed
+        # messages are decoded and matched here (case-insensitive like ilike).
+        # content_size is indexed and only set on compressed rows, so a tree
+        # without any costs one index probe.
+        if db.query(ChatMessage.id).filter(ChatMessage.content_size.isnot(None)).first() is None:
+            return []
+        needle = query.lower()
+        rows = db.query(ChatMessage.session_id, ChatMessage.content_zstd, ChatMessage.content_dict).join(
+            ChatSession, ChatMessage.session_id == ChatSession.id
         ).filter(
-            ChatSession.user_id == user.id
-        ).group_by(ChatSession.id).order_by(
-            ChatSession.updated_at.desc()
-        ).limit(limit).all()
+            ChatSession.user_id == user.id,
+            ChatMessage.content_size.isnot(None)
+        ).all()
+        matched = set()
+        for session_id, blob, dict_id in rows:
+            if session_id not in matched and needle in decode_content("", blob, dict_id).lower():
+                matched.add(session_id)
+        return list(matched)
+
+    @staticmethod
+    def _path_lengths(db: Session, sessions: List[ChatSession]) -> Dict[int, int]:
+
+        # Messages on each session's active branch, what the session view shows;
+        # one recursive walk from all the leaves at once, one step per message.
+        leaves = [session.active_message_id for session in sessions if session.active_message_id is not None]
+        if not leaves:
+            return {}
+        path = select(
+            ChatMessage.session_id, ChatMessage.parent_id
+        ).where(ChatMessage.id.in_(leaves)).cte("session_paths", recursive=True)
+        parent = aliased(ChatMessage)
+        path = path.union_all(
+            select(parent.session_id, parent.parent_id).where(parent.id == path.c.parent_id)
+        )
+        return dict(db.execute(
+            select(path.c.session_id, func.count()).group_by(path.c.session_id)
+        ).all())
+
+    @staticmethod
+    def _session_list(db: Session, sessions: List[ChatSession]) -> List[dict]:
 
+        lengths = ChatService._path_lengths(db, sessions)
         return [
             {
                 "id": session.id,
                 "title": session.title,
                 "created_at": session.created_at,
                 "updated_at": session.updated_at,
-                "message_count": message_count
+                # Archived sessions have no hot rows; sessions archived before
+                # the path length was recorded fall back to every stored message.
+                "message_count": lengths.get(session.id, 0) + (
+                    session.archived_path_messages if session.archived_path_messages is not None
+                    else session.archived_messages or 0
+                )
             }
-            for session, message_count in sessions
+            for session in sessions
         ]
 
+    @staticmethod
+    def get_user_sessions(db: Session, user: User, limit: int = 100, version: str = None) -> List[dict]:
+
+        if version is None:
+            version = ChatVersions.get(user.id)
+        cached = sidebar_cache.get(user.id, limit, version)
+        if cached is not None:
+            return cached
+
+        sessions = db.query(ChatSession).filter(
+            ChatSession.user_id == user.id
+        ).order_by(ChatSession.updated_at.desc()).limit(limit).all()
+
+        result = ChatService._session_list(db, sessions)
+        sidebar_cache.put(user.id, limit, version, result)
+        return result
+
     @staticmethod
     def delete_session(db: Session, session_id: int, user: User) -> bool:
 
-        session = ChatService.get_session(db, session_id, user)
+        session = ChatService.get_session(db, session_id, user, rehydrate=False)
         if not session:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Session not found"
             )
 
-        db.delete(session)
+        DeletionService.delete_sessions(db, [session.id])
         db.commit()
+        ChatVersions.bump(user.id)
         return True
 
     @staticmethod
@@ -73,25 +384,78 @@ class ChatService:
         db: Session,
         session_id: int,
         role: str,
-        content: str
+        content: str,
+        parent_id: Optional[int] = ACTIVE_LEAF,
+        commit: bool = True
     ) -> ChatMessage:
 
+        # With commit=False the message is only flushed (so it has an id) and the
+        # caller commits and bumps ChatVersions, e.g. as part of a group commit.
+        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        if parent_id == ACTIVE_LEAF:
+            parent_id = session.active_message_id if session else None
+
         message = ChatMessage(
             session_id=session_id,
+            parent_id=parent_id,
             role=role,
             content=content
         )
         db.add(message)
-        db.commit()
-        db.refresh(message)
+        db.flush()
 
-        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        user_id = None
         if session:
+            user_id = session.user_id
             session.updated_at = datetime.utcnow()
-            db.commit()
+            session.active_message_id = message.id
+            UsageService.record_usage(db, user_id, at=message.created_at, messages=1)
+            UsageService.bump_counters(db, messages=1)
 
+        if commit:
+            db.commit()
+            db.refresh(message)
+            if user_id is not None:
+                ChatVersions.bump(user_id)
         return message
 
+    @staticmethod
+    def start_turn(
+        db: Session,
+        session: ChatSession,
+        prompt: str,
+        parent_message_id: Optional[int] = None,
+        regenerate: bool = False,
+        commit: bool = True
+    ) -> ChatMessage:
+
+        # Returns the user message the next reply answers. Edits and regenerations
+        # branch off an earlier message and leave the existing turns in place.
+        if regenerate:
+            if not parent_message_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="parent_message_id is required to regenerate"
+                )
+            user_message = ChatService.get_message(db, session.id, parent_message_id)
+            if user_message.role != "user":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Only replies to a user message can be regenerated"
+                )
+            ChatService.set_active_leaf(db, session, user_message.id)
+            if commit:
+                db.commit()
+                ChatVersions.bump(session.user_id)
+            return user_message
+
+        parent_id = ACTIVE_LEAF
+        if parent_message_id is not None:
+            parent_id = parent_message_id or None
+            if parent_id is not None:
+                ChatService.get_message(db, session.id, parent_id)
+        return ChatService.add_message(db, session.id, role="user", content=prompt, parent_id=parent_id, commit=commit)
+
     @staticmethod
     def get_session_messages(db: Session, session_id: int, user: User) -> List[ChatMessage]:
 
@@ -102,32 +466,152 @@ class ChatService:
                 detail="Session not found"
             )
 
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.created_at.asc()).all()
+        return ChatService.get_path_messages(db, session)
 
-        return messages
+    @staticmethod
+    def get_session_message_fields(db: Session, session_id: int, user: User, fields: List[str]) -> List[dict]:
+
+        unknown = [field for field in fields if field not in MESSAGE_FIELDS]
+        if unknown or not fields:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid fields: {', '.join(unknown) or '(none)'}. Allowed: {', '.join(MESSAGE_FIELDS)}"
+            )
+
+        session = ChatService.get_session(db, session_id, user)
+        if not session:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Session not found"
+            )
+
+        if session.active_message_id is None:
+            return []
+        # Only the requested columns are selected, so e.g. listing ids never reads content.
+        path = ChatService._active_path(session.active_message_id)
+        columns = [getattr(ChatMessage, field) for field in fields]
+        if "content" in fields:
+            columns += [ChatMessage.content_zstd, ChatMessage.content_dict]
+        rows = db.query(*columns).join(
+            path, ChatMessage.id == path.c.id
+        ).order_by(path.c.depth.desc()).all()
+
+        if "content" not in fields:
+            return [dict(zip(fields, row)) for row in rows]
+        result = []
+        for row in rows:
+            item = dict(zip(fields, row))
+            item["content"] = decode_content(item["content"], row[-2], row[-1])
+            result.append(item)
+        return result
 
     @staticmethod
-    def get_recent_messages(db: Session, session_id: int, limit: int = 10) -> List[ChatMessage]:
+    def _summary_on_path(path, summary_id: int):
 
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(
-            ChatMessage.created_at.desc()
-        ).limit(limit).all()
+        return select(func.count()).select_from(path).where(path.c.id == summary_id).scalar_subquery()
 
-        return list(reversed(messages))
+    @staticmethod
+    def _summarized_path_query(db: Session, session: ChatSession, *columns):
+
+        # The active path after the summarized prefix. The walk stops at the
+        # summary's last message; if it reaches the root instead, the summary
+        # belongs to another branch and the whole path counts. Each row carries
+        # that verdict as its last column, so this stays a single query.
+        summary_id = session.summary_message_id if session.summary else None
+        path = ChatService._active_path(session.active_message_id, summary_id)
+        on_path = ChatService._summary_on_path(path, summary_id) if summary_id is not None else literal(0)
+        query = db.query(*columns, on_path).join(path, ChatMessage.id == path.c.id)
+        return query, path, summary_id
+
+    @staticmethod
+    def get_unsummarized_messages(db: Session, session: ChatSession) -> Tuple[List[ChatMessage], bool]:
+
+        # Also returns whether session.summary covers the active branch; a
+        # summary of another branch must not be built on.
+        if session.active_message_id is None:
+            return [], False
+        query, path, summary_id = ChatService._summarized_path_query(db, session, ChatMessage)
+        rows = query.order_by(path.c.depth.desc()).all()
+        if rows and rows[0][1]:
+            return [msg for msg, _ in rows if msg.id != summary_id], True
+        return [msg for msg, _ in rows], False
+
+    @staticmethod
+    def count_unsummarized_tokens(db: Session, session: ChatSession) -> int:
+
+        if session.active_message_id is None:
+            return 0
+        query, path, summary_id = ChatService._summarized_path_query(
+            db, session, ChatMessage.id, ChatMessage.content_length
+        )
+        rows = query.all()
+        if rows and rows[0][2]:
+            rows = [row for row in rows if row[0] != summary_id]
+        return sum(length for _, length, _ in rows) // 4 + len(rows)
 
     @staticmethod
-    def update_session_title(db: Session, session_id: int, title: str) -> ChatSession:
+    def build_context_messages(
+        db: Session,
+        session: ChatSession,
+        limit: int = None,
+        token_budget: int = None
+    ) -> List[dict]:
+
+        if limit is None:
+            limit = settings.CONTEXT_MESSAGE_LIMIT
+        if token_budget is None:
+            token_budget = settings.CONTEXT_TOKEN_BUDGET
+
+        recent, summary_valid = [], False
+        if session.active_message_id is not None:
+            query, path, summary_id = ChatService._summarized_path_query(db, session, ChatMessage)
+            # One extra row in case the last one is the summary boundary itself.
+            rows = query.order_by(path.c.depth.asc()).limit(limit + 1).all()
+            summary_valid = bool(rows and rows[0][1])
+            recent = [msg for msg, _ in rows if not (summary_valid and msg.id == summary_id)][:limit]
+            recent.reverse()
+
+        summary_message = None
+        if summary_valid:
+            summary_message = {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{session.summary}"
+            }
+            token_budget -= estimate_tokens(summary_message["content"])
+
+        # Drop the oldest raw turns until the prompt fits, always keeping the latest one.
+        used = sum(estimate_tokens(msg.content) for msg in recent)
+        while len(recent) > 1 and used > token_budget:
+            used -= estimate_tokens(recent.pop(0).content)
+
+        messages = [{"role": msg.role, "content": msg.content} for msg in recent]
+        if summary_message:
+            messages.insert(0, summary_message)
+        return messages
+
+    @staticmethod
+    def update_session_summary(db: Session, session_id: int, summary: str, summary_message_id: int) -> None:
+
+        # Keep updated_at as-is so background summaries do not reorder the sidebar.
+        db.query(ChatSession).filter(ChatSession.id == session_id).update({
+            ChatSession.summary: summary,
+            ChatSession.summary_message_id: summary_message_id,
+            ChatSession.summary_updated_at: datetime.utcnow(),
+            ChatSession.updated_at: ChatSession.updated_at
+        }, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def update_session_title(db: Session, session_id: int, title: str, commit: bool = True) -> ChatSession:
 
         session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
         if session:
             session.title = title
             session.updated_at = datetime.utcnow()
-            db.commit()
-            db.refresh(session)
+            if commit:
+                db.commit()
+                db.refresh(session)
+                ChatVersions.bump(session.user_id)
         return session
 
     @staticmethod
@@ -140,7 +624,9 @@ class ChatService:
 
     @staticmethod
     def delete_messages_from(db: Session, session_id: int, message_id: int, user: User) -> int:
-        """Delete a message and all messages after it in the session."""
+
+        # Deletes a message and the branches below it. Edits no longer need this;
+        # it remains for explicitly pruning a branch.
         session = ChatService.get_session(db, session_id, user)
         if not session:
             raise HTTPException(
@@ -148,37 +634,39 @@ class ChatService:
                 detail="Session not found"
             )
 
-        # Get the message to find its created_at timestamp
-        target_message = db.query(ChatMessage).filter(
-            ChatMessage.id == message_id,
-            ChatMessage.session_id == session_id
-        ).first()
+        target_message = ChatService.get_message(db, session_id, message_id)
+        subtree_ids = [row[0] for row in db.execute(select(ChatService._subtree(message_id).c.id)).all()]
 
-        if not target_message:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Message not found"
-            )
+        if session.active_message_id in subtree_ids:
+            ChatService.set_active_leaf(db, session, target_message.parent_id)
+        if session.summary_message_id in subtree_ids:
+            session.summary = None
+            session.summary_message_id = None
+            session.summary_updated_at = None
 
-        # Delete the target message and all messages after it
-        deleted_count = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id,
-            ChatMessage.created_at >= target_message.created_at
+        db.query(ChatMessage).filter(
+            ChatMessage.id.in_(subtree_ids)
         ).delete(synchronize_session=False)
+        deleted_count = len(subtree_ids)
 
+        UsageService.bump_counters(db, messages=-deleted_count)
         db.commit()
+        ChatVersions.bump(user.id)
         return deleted_count
 
     @staticmethod
     def cleanup_old_sessions(db: Session, retention_days: int = 60):
 
         cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
-        old_sessions = db.query(ChatSession).filter(
+        old_sessions = db.query(ChatSession.id, ChatSession.user_id).filter(
             ChatSession.updated_at < cutoff_date
         ).all()
 
-        for session in old_sessions:
-            db.delete(session)
-
-        db.commit()
+        # Chunked so a large backlog never holds the write lock for long.
+        chunk = settings.DELETE_CHUNK_SIZE
+        for start in range(0, len(old_sessions), chunk):
+            DeletionService.delete_sessions(db, [session_id for session_id, _ in old_sessions[start:start + chunk]])
+            db.commit()
+        for user_id in {user_id for _, user_id in old_sessions}:
+            ChatVersions.bump(user_id)
         return len(old_sessions)
@@ -0,0 +1,96 @@
+import time
+from sqlalchemy import bindparam, func, or_
+from sqlalchemy.orm import Session
+from app.core.compression import message_codec, decode_content, zstandard
+from app.core.config import settings
+from app.db.models import ChatMessage, CompressionDictionary
+
+class CompressionService:
+
+    @staticmethod
+    def train_dictionary(db: Session, max_samples: int = 5000, size: int = None) -> CompressionDictionary:
+
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+
+        # The most recent bodies are the best predictor of what is written next.
+        rows = db.query(ChatMessage._content, ChatMessage.content_zstd, ChatMessage.content_dict).order_by(
+            ChatMessage.id.desc()
+        ).limit(max_samples).all()
+        samples = [decode_content(content, blob, dict_id) for content, blob, dict_id in rows]
+        samples = [sample for sample in samples if len(sample) >= 64]
+        if not samples:
+            raise RuntimeError("Not enough messages to train a dictionary")
+
+        try:
+            dictionary = message_codec.train(samples, size or settings.MESSAGE_COMPRESSION_DICT_SIZE)
+        except zstandard.ZstdError as e:
+            raise RuntimeError(f"Dictionary training failed ({len(samples)} samples): {e}")
+
+        row = CompressionDictionary(data=dictionary.as_bytes(), samples=len(samples))
+        db.add(row)
+        db.commit()
+        message_codec.load(force=True)
+        return row
+
+    @staticmethod
+    def compress_existing(db: Session, batch_size: int = 500, recompress: bool = False) -> dict:
+
+        # Walks the table in id order, one short transaction per batch, so it can
+        # run next to a live server. recompress also re-encodes rows written with
+        # an older dictionary than the newest one.
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        message_codec.load(force=True)
+        active_id = message_codec.active_id or 0
+        table = ChatMessage.__table__
+        statement = table.update().where(table.c.id == bindparam("row_id")).values(
+            content=bindparam("new_content"),
+            content_zstd=bindparam("new_zstd"),
+            content_dict=bindparam("new_dict"),
+            content_size=bindparam("new_size")
+        )
+
+        pending = ChatMessage.content_zstd.is_(None)
+        if recompress:
+            pending = or_(pending, func.coalesce(ChatMessage.content_dict, 0) != active_id)
+
+        totals = {"scanned": 0, "compressed": 0, "bytes_before": 0, "bytes_after": 0}
+        last_id = 0
+        started = time.perf_counter()
+        while True:
+            rows = db.query(
+                ChatMessage.id, ChatMessage._content, ChatMessage.content_zstd, ChatMessage.content_dict
+            ).filter(
+                ChatMessage.id > last_id,
+                pending,
+                ChatMessage.content_length >= settings.MESSAGE_COMPRESSION_MIN_BYTES
+            ).order_by(ChatMessage.id.asc()).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for row_id, content, blob, dict_id in rows:
+                text = decode_content(content, blob, dict_id)
+                compressed = message_codec.compress(text, force=True)
+                if compressed is None:
+                    continue
+                updates.append({
+                    "row_id": row_id,
+                    "new_content": "",
+                    "new_zstd": compressed[0],
+                    "new_dict": compressed[1],
+                    "new_size": len(text)
+                })
+                totals["bytes_before"] += len(blob) if blob is not None else len(text.encode("utf-8"))
+                totals["bytes_after"] += len(compressed[0])
+            if updates:
+                db.execute(statement, updates)
+            db.commit()
+            totals["scanned"] += len(rows)
+            totals["compressed"] += len(updates)
+            print(f"  … {totals['scanned']} scanned, {totals['compressed']} compressed (up to id {last_id})")
+
+        totals["seconds"] = round(time.perf_counter() - started, 2)
+        return totals
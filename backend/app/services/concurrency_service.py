@@ -0,0 +1,207 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.state import state_store, get_json
+
+class InferenceBusyError(RuntimeError):
+
+    pass
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class AdaptiveConcurrencyLimiter:
+
+    # Gates in-flight generations per worker process. Every window the limit is
+    # re-tuned from what llama-server actually delivered: additive increase while
+    # aggregate tokens/s keeps improving, multiplicative decrease when time to
+    # first token or per-request decode speed crosses its target.
+
+    def __init__(self, health_key: str = "inference:health"):
+
+        # Until the health monitor has read llama-server's slot count the
+        # limit starts at CONCURRENCY_INITIAL_LIMIT.
+        self.limit = settings.CONCURRENCY_INITIAL_LIMIT
+        self.health_key = health_key
+        self.seeded = False
+        self._seed_checked = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.history = deque(maxlen=500)
+        self.recent_latency = deque(maxlen=500)
+        self._condition: Optional[asyncio.Condition] = None
+        self._reset_window()
+        self._probe: Optional[Dict] = None
+        self._cooldown = 0
+
+    def _seed(self):
+
+        # Start at this worker's share of llama-server's parallelism
+        # (total_slots from /props): fewer in flight leaves slots idle, more
+        # only queues inside llama-server. Every worker has its own limiter,
+        # so the slots are split between the WEB_CONCURRENCY workers.
+        self._seed_checked = time.monotonic()
+        slots = (get_json(state_store, self.health_key) or {}).get("total_slots")
+        if not slots:
+            return
+        self.seeded = True
+        previous = self.limit
+        share = math.ceil(slots / max(1, settings.WEB_CONCURRENCY))
+        self.limit = max(settings.CONCURRENCY_MIN_LIMIT, min(settings.CONCURRENCY_MAX_LIMIT, share))
+        if self.limit != previous:
+            print(f"Concurrency limit {previous} -> {self.limit} (llama-server has {slots} slots for {settings.WEB_CONCURRENCY} workers)")
+        if self._condition is not None:
+            self._condition.notify_all()
+
+    def _reset_window(self):
+
+        self.window_started = time.monotonic()
+        self.window_samples: List[Dict] = []
+        self.window_peak = self.in_flight
+        self.window_queued = 0
+
+    @asynccontextmanager
+    async def slot(self):
+
+        if not settings.ADAPTIVE_CONCURRENCY_ENABLED:
+            yield {}
+            return
+
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+
+        queued_at = time.perf_counter()
+        async with self._condition:
+            if not self.seeded and time.monotonic() - self._seed_checked >= settings.HEALTH_POLL_SECONDS:
+                self._seed()
+            if self.in_flight >= self.limit:
+                self.waiting += 1
+                self.window_queued += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self.in_flight < self.limit),
+                        timeout=settings.CONCURRENCY_QUEUE_TIMEOUT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    raise InferenceBusyError("Timed out waiting for an inference slot")
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.window_peak = max(self.window_peak, self.in_flight)
+
+        # Callers fill in first_token_at / completion_tokens / tokens_per_second.
+        sample = {"queued_ms": (time.perf_counter() - queued_at) * 1000.0, "started_at": time.perf_counter()}
+        failed = False
+        try:
+            yield sample
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                if not failed:
+                    self._record(sample)
+                self._condition.notify_all()
+
+    def _record(self, sample: Dict):
+
+        finished_at = time.perf_counter()
+        first_token_at = sample.get("first_token_at") or finished_at
+        # What the user waited for the first token, queueing included.
+        self.recent_latency.append((time.monotonic(), sample["queued_ms"] + (first_token_at - sample["started_at"]) * 1000.0))
+        self.window_samples.append({
+            "ttft_ms": (first_token_at - sample["started_at"]) * 1000.0,
+            "completion_tokens": sample.get("completion_tokens", 0),
+            "tokens_per_second": sample.get("tokens_per_second"),
+            "queued_ms": sample["queued_ms"]
+        })
+        if time.monotonic() - self.window_started >= settings.CONCURRENCY_WINDOW_SECONDS:
+            self._adjust()
+
+    def _adjust(self):
+
+        elapsed = time.monotonic() - self.window_started
+        samples = self.window_samples
+        ttft_p90 = _percentile([s["ttft_ms"] for s in samples], 0.9)
+        decode_p50 = _percentile([s["tokens_per_second"] for s in samples if s["tokens_per_second"]], 0.5)
+        throughput = sum(s["completion_tokens"] for s in samples) / elapsed if elapsed > 0 else 0.0
+        # Without contention there is no evidence that more slots would help.
+        saturated = self.window_peak >= self.limit or self.window_queued > 0
+
+        previous = self.limit
+        reason = "hold"
+        if ttft_p90 is not None and ttft_p90 > settings.CONCURRENCY_TTFT_TARGET_MS:
+            self.limit = max(settings.CONCURRENCY_MIN_LIMIT, int(self.limit * 0.75))
+            reason = "ttft over target"
+        elif decode_p50 is not None and decode_p50 < settings.CONCURRENCY_MIN_TOKENS_PER_SECOND:
+            self.limit = max(settings.CONCURRENCY_MIN_LIMIT, int(self.limit * 0.75))
+            reason = "decode speed under target"
+        elif self._probe is not None and saturated:
+            # The last increase must pay for itself in aggregate tokens/s,
+            # otherwise the CPU is already saturated and we only add latency.
+            if throughput < self._probe["throughput"] * 1.05:
+                self.limit = self._probe["limit"]
+                reason = "no throughput gain"
+            else:
+                reason = "throughput gain"
+        elif saturated and self._cooldown == 0 and self.limit < settings.CONCURRENCY_MAX_LIMIT:
+            reason = "probe"
+
+        self._probe = None
+        if reason in ("probe", "throughput gain") and self.limit < settings.CONCURRENCY_MAX_LIMIT:
+            self._probe = {"limit": self.limit, "throughput": throughput}
+            self.limit += 1
+        if reason == "no throughput gain":
+            self._cooldown = 5
+        elif self._cooldown:
+            self._cooldown -= 1
+
+        self.history.append({
+            "at": datetime.utcnow().isoformat(),
+            "limit": self.limit,
+            "previous_limit": previous,
+            "reason": reason,
+            "requests": len(samples),
+            "ttft_p90_ms": round(ttft_p90, 1) if ttft_p90 is not None else None,
+            "decode_tokens_per_second_p50": round(decode_p50, 2) if decode_p50 is not None else None,
+            "throughput_tokens_per_second": round(throughput, 2),
+            "peak_in_flight": self.window_peak,
+            "queued": self.window_queued
+        })
+        if self.limit != previous:
+            print(f"Concurrency limit {previous} -> {self.limit} ({reason})")
+        if self._condition is not None:
+            self._condition.notify_all()
+        self._reset_window()
+
+    def recent_latency_p90(self, seconds: float) -> Optional[float]:
+
+        cutoff = time.monotonic() - seconds
+        return _percentile([latency for at, latency in self.recent_latency if at >= cutoff], 0.9)
+
+    def stats(self) -> Dict:
+
+        return {
+            "enabled": settings.ADAPTIVE_CONCURRENCY_ENABLED,
+            "limit": self.limit,
+            "seeded_from_slots": self.seeded,
+            "min_limit": settings.CONCURRENCY_MIN_LIMIT,
+            "max_limit": settings.CONCURRENCY_MAX_LIMIT,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "ttft_target_ms": settings.CONCURRENCY_TTFT_TARGET_MS,
+            "min_tokens_per_second": settings.CONCURRENCY_MIN_TOKENS_PER_SECOND,
+            "history": list(self.history)
+        }
+
+concurrency_limiter = AdaptiveConcurrencyLimiter()
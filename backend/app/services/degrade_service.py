@@ -0,0 +1,128 @@
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+from app.core.config import settings
+from app.services.concurrency_service import concurrency_limiter
+
+MODES = ("normal", "degraded", "critical")
+
+class DegradeController:
+
+    # Steps up as soon as queue depth or user-visible TTFT crosses a threshold,
+    # and back down one level at a time once pressure has stayed below the
+    # current level for DEGRADE_RECOVERY_SECONDS, so it does not flap.
+
+    def __init__(self):
+
+        self.level = 0
+        self.pressure_seen_at = time.monotonic()
+        self.transitions = deque(maxlen=100)
+
+    def signals(self) -> Dict:
+
+        # Queue depth counts per admitted slot: a node running at its limit
+        # with a short queue is busy, not overloaded.
+        limit = max(1, concurrency_limiter.limit)
+        return {
+            "queue_depth": concurrency_limiter.waiting,
+            "limit": limit,
+            "queue_per_slot": round(concurrency_limiter.waiting / limit, 2),
+            "ttft_p90_ms": concurrency_limiter.recent_latency_p90(settings.DEGRADE_WINDOW_SECONDS)
+        }
+
+    def pressure_level(self, signals: Dict) -> int:
+
+        queue = signals["queue_per_slot"]
+        latency = signals["ttft_p90_ms"] or 0.0
+        if queue >= settings.CRITICAL_QUEUE_PER_SLOT or latency >= settings.CRITICAL_TTFT_MS:
+            return 2
+        if queue >= settings.DEGRADE_QUEUE_PER_SLOT or latency >= settings.DEGRADE_TTFT_MS:
+            return 1
+        return 0
+
+    def mode(self) -> str:
+
+        if not settings.DEGRADE_ENABLED:
+            return MODES[0]
+
+        signals = self.signals()
+        target = self.pressure_level(signals)
+        now = time.monotonic()
+        if target > self.level:
+            self._set_level(target, signals)
+            self.pressure_seen_at = now
+        elif target == self.level:
+            self.pressure_seen_at = now
+        elif now - self.pressure_seen_at >= settings.DEGRADE_RECOVERY_SECONDS:
+            self._set_level(self.level - 1, signals)
+            self.pressure_seen_at = now
+        return MODES[self.level]
+
+    def _set_level(self, level: int, signals: Dict):
+
+        self.transitions.append({
+            "at": datetime.utcnow().isoformat(),
+            "from": MODES[self.level],
+            "to": MODES[level],
+            **signals
+        })
+        print(f"⚠ Inference mode {MODES[self.level]} -> {MODES[level]} ({signals})")
+        self.level = level
+
+    @staticmethod
+    def policy(mode: str) -> Dict:
+
+        if mode == "critical":
+            return {
+                "max_tokens": settings.CRITICAL_MAX_TOKENS,
+                "context_token_budget": settings.CRITICAL_CONTEXT_TOKEN_BUDGET,
+                "background_tasks": False,
+                "accept_batch": False
+            }
+        if mode == "degraded":
+            return {
+                "max_tokens": settings.DEGRADED_MAX_TOKENS,
+                "context_token_budget": settings.DEGRADED_CONTEXT_TOKEN_BUDGET,
+                "background_tasks": False,
+                "accept_batch": False
+            }
+        return {
+            "max_tokens": None,
+            "context_token_budget": settings.CONTEXT_TOKEN_BUDGET,
+            "background_tasks": True,
+            "accept_batch": True
+        }
+
+    @staticmethod
+    def cap_max_tokens(max_tokens: Optional[int], policy: Dict) -> Optional[int]:
+
+        cap = policy["max_tokens"]
+        if cap is None:
+            return max_tokens
+        # None and -1 both mean "up to the server default", which is unbounded.
+        if max_tokens is None or max_tokens < 0:
+            return cap
+        return min(max_tokens, cap)
+
+    def allows_background(self) -> bool:
+
+        return self.policy(self.mode())["background_tasks"]
+
+    def stats(self) -> Dict:
+
+        mode = self.mode()
+        return {
+            "enabled": settings.DEGRADE_ENABLED,
+            "mode": mode,
+            "policy": self.policy(mode),
+            "signals": self.signals(),
+            "thresholds": {
+                "degraded": {"queue_per_slot": settings.DEGRADE_QUEUE_PER_SLOT, "ttft_ms": settings.DEGRADE_TTFT_MS},
+                "critical": {"queue_per_slot": settings.CRITICAL_QUEUE_PER_SLOT, "ttft_ms": settings.CRITICAL_TTFT_MS}
+            },
+            "recovery_seconds": settings.DEGRADE_RECOVERY_SECONDS,
+            "transitions": list(self.transitions)
+        }
+
+degrade_controller = DegradeController()
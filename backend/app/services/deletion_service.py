@@ -0,0 +1,182 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.state import state_store, process_id
+from app.db.database import SessionLocal
+from app.db.models import User, ChatSession, ChatMessage
+from app.services.usage_service import UsageService
+from app.services.semantic_service import SemanticService
+
+PURGE_LOCK_TTL = 600
+
+class DeletionService:
+
+    # Set-based deletes that never load the rows they remove. Children go
+    # first, highest ids first (a reply always has a higher id than its
+    # parent), so every statement is valid with foreign keys enforced even on
+    # tables created before ON DELETE CASCADE. Counters are bumped in the same
+    # transaction as each delete, so they always match what is left. Counts come
+    # from the selected ids, not rowcount: rows removed by a cascade (a reply
+    # deleted with its parent in the same statement) are not in rowcount.
+
+    @staticmethod
+    def delete_sessions(db: Session, session_ids: List[int]) -> int:
+
+        if not session_ids:
+            return 0
+        messages = db.query(func.count(ChatMessage.id)).filter(ChatMessage.session_id.in_(session_ids)).scalar()
+        messages += DeletionService._archived_messages(db, session_ids)
+        db.execute(delete(ChatMessage).where(ChatMessage.session_id.in_(session_ids)))
+        sessions = db.execute(delete(ChatSession).where(ChatSession.id.in_(session_ids))).rowcount
+        UsageService.bump_counters(db, sessions=-sessions, messages=-messages)
+        return messages
+
+    @staticmethod
+    def _archived_messages(db: Session, session_ids) -> int:
+
+        # Archived sessions keep counting their messages; their index rows go
+        # with the session (ON DELETE CASCADE) and the segment bytes are
+        # reclaimed by the archiver.
+        return db.query(func.coalesce(func.sum(ChatSession.archived_messages), 0)).filter(
+            ChatSession.id.in_(session_ids)
+        ).scalar()
+
+    @staticmethod
+    def tombstone_user(db: Session, user: User):
+
+        # The account disappears from auth, admin views and user counters now;
+        # its chats are removed later in chunks by the purger.
+        UsageService.bump_counters(
+            db,
+            users=-1,
+            active_users=-1 if user.is_active else 0,
+            admin_users=-1 if user.is_admin else 0
+        )
+        user.deleted_at = datetime.utcnow()
+        user.is_active = False
+        db.commit()
+
+    @staticmethod
+    def purge_user(db: Session, user_id: int, lock: Optional[str] = None) -> dict:
+
+        # One bounded transaction per chunk keeps the SQLite write lock short,
+        # so chat traffic interleaves with a large purge instead of waiting it out.
+        # With lock, the purger's lease is renewed after every chunk; a purger
+        # that lost it stops rather than race the new holder.
+        def renew():
+            if lock is not None and not state_store.acquire_lock(lock, process_id(), ttl=PURGE_LOCK_TTL):
+                raise RuntimeError(f"lost the {lock} lock")
+
+        chunk = settings.DELETE_CHUNK_SIZE
+        sessions_of_user = select(ChatSession.id).where(ChatSession.user_id == user_id)
+        message_table = ChatMessage.__table__
+        totals = {"messages": 0, "sessions": 0}
+
+        while True:
+            # Replies always sort above their parents, so a chunk taken from the
+            # top holds every descendant of the messages in it.
+            batch = [row[0] for row in db.execute(
+                select(ChatMessage.id).where(
+                    ChatMessage.session_id.in_(sessions_of_user)
+                ).order_by(ChatMessage.id.desc()).limit(chunk)
+            ).all()]
+            if not batch:
+                break
+            # One statement per row, children first, so no row goes by cascade
+            # and rowcount is exact; rows another purger got to first count 0.
+            deleted = db.execute(
+                delete(message_table).where(message_table.c.id == bindparam("row_id")),
+                [{"row_id": message_id} for message_id in batch]
+            ).rowcount
+            UsageService.bump_counters(db, messages=-deleted)
+            db.commit()
+            totals["messages"] += deleted
+            renew()
+
+        while True:
+            batch = [row[0] for row in db.execute(sessions_of_user.limit(chunk)).all()]
+            if not batch:
+                break
+            archived = DeletionService._archived_messages(db, batch)
+            deleted = db.execute(delete(ChatSession).where(ChatSession.id.in_(batch))).rowcount
+            UsageService.bump_counters(db, sessions=-deleted, messages=-archived)
+            db.commit()
+            totals["sessions"] += deleted
+            totals["messages"] += archived
+            renew()
+
+        db.execute(delete(User).where(User.id == user_id, User.deleted_at.isnot(None)))
+        db.commit()
+        SemanticService.index.drop(user_id)
+        return totals
+
+class AccountPurger:
+
+    def __init__(self):
+
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    def wake(self):
+
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _run(self):
+
+        while True:
+            # Tombstones are rows, so work left by a crash or another worker
+            # is picked up by the periodic pass.
+            if state_store.acquire_lock("account_purge", process_id(), ttl=PURGE_LOCK_TTL):
+                try:
+                    await asyncio.to_thread(self.purge_pending)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Account purge error: {e}")
+                finally:
+                    state_store.release_lock("account_purge", process_id())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=settings.PURGE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    def purge_pending(self) -> int:
+
+        db = SessionLocal()
+        try:
+            user_ids = [row[0] for row in db.query(User.id).filter(User.deleted_at.isnot(None)).all()]
+            for user_id in user_ids:
+                started = time.perf_counter()
+                totals = DeletionService.purge_user(db, user_id, lock="account_purge")
+                print(
+                    f"✓ Purged user {user_id}: {totals['sessions']} sessions, "
+                    f"{totals['messages']} messages in {time.perf_counter() - started:.2f}s"
+                )
+            return len(user_ids)
+        finally:
+            db.close()
+
+account_purger = AccountPurger()
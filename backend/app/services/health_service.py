@@ -0,0 +1,204 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.state import state_store, process_id, get_json, set_json
+from app.services.inference_service import inference_service, MAIN_BACKEND
+
+class HealthMonitor:
+
+    def __init__(self):
+
+        self.task: Optional[asyncio.Task] = None
+        self.warmup_task: Optional[asyncio.Task] = None
+        self.started_at = time.time()
+
+    def start(self):
+
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+
+        if self.task is None:
+            return
+        for task in (self.task, self.warmup_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+        self.warmup_task = None
+        state_store.release_lock("health_monitor", process_id())
+
+    async def _run(self):
+
+        interval = settings.HEALTH_POLL_SECONDS
+        while True:
+            # One worker polls llama-server and publishes the result; the others
+            # read it from the shared store. The lease moves if the poller dies.
+            if state_store.acquire_lock("health_monitor", process_id(), ttl=interval * 3):
+                try:
+                    status = await self.poll()
+                    # Warm-up runs beside the poll loop, so a slow first
+                    # completion cannot outlive this lease.
+                    warming = self.warmup_task is not None and not self.warmup_task.done()
+                    if status["upstream_ok"] and settings.WARMUP_ENABLED and not self.warmed_up() and not warming:
+                        self.warmup_task = asyncio.create_task(self.warm_up())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Health monitor error: {e}")
+            await asyncio.sleep(interval)
+
+    async def _get(self, path: str):
+
+        return await inference_service.async_client.get(
+            f"{inference_service.server_url}{path}",
+            timeout=settings.HEALTH_TIMEOUT_SECONDS
+        )
+
+    async def poll(self) -> Dict:
+
+        previous = self.status() or {}
+        status = {
+            "checked_at": time.time(),
+            "upstream_ok": False,
+            "upstream_status": None,
+            "total_slots": previous.get("total_slots"),
+            "idle_slots": None,
+            "n_ctx": previous.get("n_ctx"),
+            "model_path": previous.get("model_path"),
+            "consecutive_failures": previous.get("consecutive_failures", 0),
+            "last_ok_at": previous.get("last_ok_at")
+        }
+
+        try:
+            response = await self._get("/health")
+            status["upstream_status"] = response.status_code
+            status["upstream_ok"] = response.status_code == 200
+        except Exception as e:
+            status["upstream_status"] = f"unreachable: {type(e).__name__}"
+
+        if status["upstream_ok"]:
+            # /props and /slots are informational; older or locked-down servers
+            # may not expose them, which must not make the node unready.
+            try:
+                props = (await self._get("/props")).json()
+                status["total_slots"] = props.get("total_slots", status["total_slots"])
+                status["n_ctx"] = props.get("default_generation_settings", {}).get("n_ctx", status["n_ctx"])
+                status["model_path"] = props.get("model_path", status["model_path"])
+            except Exception:
+                pass
+            try:
+                response = await self._get("/slots")
+                if response.status_code == 200:
+                    slots = response.json()
+                    status["total_slots"] = len(slots)
+                    status["idle_slots"] = sum(1 for slot in slots if not slot.get("is_processing"))
+            except Exception:
+                pass
+            status["consecutive_failures"] = 0
+            status["last_ok_at"] = status["checked_at"]
+        else:
+            status["consecutive_failures"] += 1
+            # A restarted llama-server comes back with cold caches.
+            state_store.delete("inference:warmed_up")
+
+        # Extra model backends only need to be up to be routed to; a failed one
+        # sends its traffic to main until it answers again.
+        status["backends"] = {}
+        for backend in inference_service.backends.values():
+            if backend.name == MAIN_BACKEND:
+                continue
+            try:
+                response = await inference_service.async_client.get(f"{backend.url}/health", timeout=settings.HEALTH_TIMEOUT_SECONDS)
+                backend.healthy = response.status_code == 200
+            except Exception:
+                backend.healthy = False
+            status["backends"][backend.name] = backend.healthy
+            if backend.healthy:
+                # Seeds that backend's concurrency limiter, as /props does for main.
+                try:
+                    props = (await inference_service.async_client.get(f"{backend.url}/props", timeout=settings.HEALTH_TIMEOUT_SECONDS)).json()
+                    if props.get("total_slots"):
+                        set_json(state_store, backend.limiter.health_key, {"total_slots": props["total_slots"]}, ttl=settings.HEALTH_POLL_SECONDS * 6)
+                except Exception:
+                    pass
+
+        set_json(state_store, "inference:health", status, ttl=settings.HEALTH_POLL_SECONDS * 6)
+        inference_service.model_loaded = status["upstream_ok"]
+        return status
+
+    async def warm_up(self) -> bool:
+
+        # Prime llama-server's caches so the first real user does not pay for them.
+        # It holds its own lease, renewed while the completion runs, so only
+        # one worker warms up even if the poll lease moves meanwhile.
+        owner = process_id()
+        ttl = settings.HEALTH_POLL_SECONDS * 3
+        if not state_store.acquire_lock("health_warmup", owner, ttl=ttl):
+            return False
+        started = time.perf_counter()
+        job = asyncio.ensure_future(inference_service.generate_response_async(
+            prompt=settings.WARMUP_PROMPT,
+            max_tokens=settings.WARMUP_MAX_TOKENS,
+            temperature=0.0
+        ))
+        try:
+            while not (await asyncio.wait({job}, timeout=settings.HEALTH_POLL_SECONDS))[0]:
+                state_store.acquire_lock("health_warmup", owner, ttl=ttl)
+            job.result()
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+        except Exception as e:
+            print(f"Warm-up failed: {e}")
+            return False
+        finally:
+            state_store.release_lock("health_warmup", owner)
+
+        state_store.set("inference:warmed_up", "1")
+        print(f"✓ Warm-up completion finished in {time.perf_counter() - started:.1f}s")
+        return True
+
+    def status(self) -> Optional[Dict]:
+
+        return get_json(state_store, "inference:health")
+
+    def warmed_up(self) -> bool:
+
+        return state_store.get("inference:warmed_up") == "1"
+
+    def readiness(self) -> Dict:
+
+        status = self.status()
+        reasons = []
+
+        if status is None:
+            reasons.append("upstream not checked yet")
+        else:
+            if not status["upstream_ok"]:
+                reasons.append(f"llama-server unhealthy ({status['upstream_status']})")
+            if time.time() - status["checked_at"] > settings.HEALTH_POLL_SECONDS * 3:
+                reasons.append("health status is stale")
+            total_slots = status.get("total_slots")
+            if status["upstream_ok"] and status.get("idle_slots") == 0 and total_slots:
+                # Every slot is busy; accept a bounded local queue, then shed.
+                if inference_service.active_requests >= total_slots * settings.READY_MAX_QUEUE_PER_SLOT:
+                    reasons.append("no inference capacity")
+
+        if settings.WARMUP_ENABLED and not self.warmed_up():
+            reasons.append("warm-up not finished")
+
+        return {
+            "ready": not reasons,
+            "reasons": reasons,
+            "upstream": status,
+            "active_requests": inference_service.active_requests
+        }
+
+health_monitor = HealthMonitor()
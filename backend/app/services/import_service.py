@@ -0,0 +1,331 @@
+import hashlib
+import io
+import json
+import re
+import time
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, TextIO
+from sqlalchemy import bindparam, func, insert
+from sqlalchemy.orm import Session
+from app.core.compression import message_codec
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.db.database import engine
+from app.db.models import User, ChatSession, ChatMessage
+from app.services.chat_service import ChatVersions
+from app.services.usage_service import UsageService
+
+ROLES = ("user", "assistant", "system")
+JSON_MEMBERS = (".json", ".ndjson", ".jsonl")
+# Larger than any real conversation; past this a value is malformed, and the
+# parser stops instead of buffering the rest of the upload.
+MAX_VALUE_CHARS = 64 * 1024 * 1024
+SPACE = re.compile(r"\s*")
+SEPARATOR = re.compile(r"[\s,]*")
+
+def iter_json_values(stream: TextIO, chunk_size: int = 1 << 20) -> Iterator[Any]:
+
+    # Every top-level value of a stream, read a chunk at a time: a single
+    # export, NDJSON lines or concatenated objects. A top-level array (a list
+    # of exports) is unpacked element by element, so only one conversation is
+    # ever held in memory.
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    in_array = False
+
+    while True:
+        pos = (SEPARATOR if in_array else SPACE).match(buffer, pos).end()
+        if pos >= len(buffer):
+            if eof:
+                if in_array:
+                    raise ValueError("Unexpected end of file inside a JSON array")
+                return
+            chunk = stream.read(chunk_size)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+            continue
+
+        if buffer[pos] == "[" and not in_array:
+            in_array, pos = True, pos + 1
+            continue
+        if buffer[pos] == "]" and in_array:
+            in_array, pos = False, pos + 1
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof or len(buffer) - pos > MAX_VALUE_CHARS:
+                raise ValueError(f"Invalid JSON: {e.msg}")
+            # Most likely cut off at the chunk boundary: read on and retry.
+            chunk = stream.read(chunk_size)
+            buffer, pos = buffer[pos:] + chunk, 0
+            eof = not chunk
+            continue
+        pos = end
+        yield value
+
+def iter_upload(fileobj: BinaryIO) -> Iterator[Any]:
+
+    # A zip bundle of .json/.ndjson files, or one such file.
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    if head == b"PK\x03\x04":
+        with zipfile.ZipFile(fileobj) as bundle:
+            for name in sorted(bundle.namelist()):
+                if name.endswith("/") or name.startswith("__MACOSX/") or not name.lower().endswith(JSON_MEMBERS):
+                    continue
+                with bundle.open(name) as member:
+                    yield from iter_json_values(io.TextIOWrapper(member, encoding="utf-8-sig"))
+        return
+    yield from iter_json_values(io.TextIOWrapper(fileobj, encoding="utf-8-sig"))
+
+def _parse_time(value: Any, default: datetime) -> datetime:
+
+    if not value:
+        return default
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def normalize_session(item: Any) -> dict:
+
+    # Accepts GET /chat/sessions/{id}/export?format=json output; messages may
+    # carry "timestamp" or "created_at".
+    if not isinstance(item, dict) or not isinstance(item.get("messages"), list) or not item["messages"]:
+        raise ValueError("expected an object with a non-empty messages list")
+
+    now = datetime.utcnow()
+    created_at = _parse_time(item.get("created_at"), None)
+    messages, source = [], []
+    for message in item["messages"]:
+        if not isinstance(message, dict) or message.get("role") not in ROLES or not isinstance(message.get("content"), str):
+            raise ValueError("every message needs a role (user, assistant or system) and string content")
+        stamp = message.get("timestamp") or message.get("created_at")
+        at = _parse_time(stamp, messages[-1][2] if messages else created_at or now)
+        messages.append((message["role"], message["content"], at))
+        source.append((message["role"], message["content"], stamp))
+
+    title = str(item.get("title") or "Imported chat")[:200]
+    # Hashes what the file says, not the defaults filled in above, so the same
+    # item always gets the same key.
+    key = hashlib.sha256(dumps([title, item.get("created_at"), source])).hexdigest()
+    created_at = created_at or messages[0][2]
+    return {
+        "title": title,
+        "created_at": created_at,
+        "updated_at": _parse_time(item.get("updated_at"), messages[-1][2]),
+        "messages": messages,
+        "import_key": key
+    }
+
+class ImportService:
+
+    # Bulk import of exported conversations. Sessions are collected until a
+    # batch holds IMPORT_BATCH_MESSAGES messages and each batch is written
+    # with a few executemany statements in one transaction. Every session
+    # carries a hash of its content, so re-running an interrupted import only
+    # adds what is missing.
+
+    @staticmethod
+    def import_sessions(
+        db: Session,
+        user: User,
+        items: Iterable[Any],
+        progress: Optional[Callable[[dict], None]] = None,
+        enforce_limit: bool = True
+    ) -> dict:
+
+        totals = {
+            "sessions": 0,
+            "messages": 0,
+            "duplicates": 0,
+            "invalid": 0,
+            "limit_reached": False,
+            "errors": [],
+            "seconds": 0.0,
+            "messages_per_second": 0.0
+        }
+        started = time.perf_counter()
+        remaining = None
+        if enforce_limit:
+            existing = db.query(func.count(ChatSession.id)).filter(ChatSession.user_id == user.id).scalar()
+            remaining = max(0, settings.MAX_SESSIONS_PER_USER - existing)
+            db.rollback()
+
+        def elapsed():
+            seconds = time.perf_counter() - started
+            totals["seconds"] = round(seconds, 2)
+            totals["messages_per_second"] = round(totals["messages"] / max(seconds, 1e-6), 1)
+
+        def flush(batch: List[dict]):
+            nonlocal remaining
+            written, duplicates = ImportService._write_batch(db, user.id, batch, remaining)
+            totals["sessions"] += len(written)
+            totals["messages"] += sum(len(session["messages"]) for session in written)
+            totals["duplicates"] += duplicates
+            if remaining is not None:
+                remaining -= len(written)
+                if len(written) + duplicates < len(batch):
+                    totals["limit_reached"] = True
+            elapsed()
+            if written:
+                ChatVersions.bump(user.id)
+            if progress is not None:
+                progress(dict(totals, errors=list(totals["errors"])))
+
+        batch, batch_messages = [], 0
+        try:
+            for index, item in enumerate(items):
+                try:
+                    session = normalize_session(item)
+                except ValueError as e:
+                    totals["invalid"] += 1
+                    if len(totals["errors"]) < 20:
+                        totals["errors"].append(f"item {index}: {e}")
+                    continue
+                batch.append(session)
+                batch_messages += len(session["messages"])
+                if batch_messages >= settings.IMPORT_BATCH_MESSAGES:
+                    flush(batch)
+                    batch, batch_messages = [], 0
+                    if totals["limit_reached"]:
+                        break
+        except (ValueError, zipfile.BadZipFile) as e:
+            # Unreadable input: keep what was parsed before it and say where it stopped.
+            totals["errors"].append(f"stopped after {totals['sessions'] + len(batch)} sessions: {e}")
+        if batch and not totals["limit_reached"]:
+            flush(batch)
+        elapsed()
+        return totals
+
+    @staticmethod
+    def _write_batch(db: Session, user_id: int, batch: List[dict], remaining: Optional[int]):
+
+        # Returns (sessions written, duplicates skipped).
+        keys = [session["import_key"] for session in batch]
+        seen = {row[0] for row in db.query(ChatSession.import_key).filter(
+            ChatSession.user_id == user_id,
+            ChatSession.import_key.in_(keys)
+        ).all()}
+        fresh = []
+        for session in batch:
+            if session["import_key"] not in seen:
+                seen.add(session["import_key"])
+                fresh.append(session)
+        duplicates = len(batch) - len(fresh)
+        if remaining is not None:
+            fresh = fresh[:remaining]
+        if not fresh:
+            db.rollback()
+            return [], duplicates
+
+        session_table = ChatSession.__table__
+        session_ids = db.execute(
+            insert(session_table).returning(session_table.c.id, sort_by_parameter_order=True),
+            [
+                {
+                    "user_id": user_id,
+                    "title": session["title"],
+                    "created_at": session["created_at"],
+                    "updated_at": session["updated_at"],
+                    "import_key": session["import_key"]
+                }
+                for session in fresh
+            ]
+        ).scalars().all()
+
+        if engine.dialect.name == "sqlite":
+            leaves = ImportService._insert_messages_sqlite(db, session_ids, fresh)
+        else:
+            leaves = ImportService._insert_messages_by_level(db, session_ids, fresh)
+        for session in fresh:
+            UsageService.record_usage(db, user_id, at=session["created_at"], sessions=1, messages=len(session["messages"]))
+        message_count = sum(len(session["messages"]) for session in fresh)
+
+        db.execute(
+            session_table.update().where(session_table.c.id == bindparam("row_id")).values(
+                active_message_id=bindparam("leaf"),
+                updated_at=session_table.c.updated_at
+            ),
+            leaves
+        )
+        UsageService.bump_counters(db, sessions=len(fresh), messages=message_count)
+        UsageService.flush_deferred(db)
+        db.commit()
+        return fresh, duplicates
+
+    @staticmethod
+    def _message_row(session_id: int, parent_id: Optional[int], role: str, content: str, at: datetime) -> dict:
+
+        row = {
+            "session_id": session_id,
+            "parent_id": parent_id,
+            "role": role,
+            "content": content,
+            "content_zstd": None,
+            "content_dict": None,
+            "content_size": None,
+            "created_at": at
+        }
+        compressed = message_codec.compress(content)
+        if compressed is not None:
+            row.update(content="", content_zstd=compressed[0], content_dict=compressed[1], content_size=len(content))
+        return row
+
+    @staticmethod
+    def _insert_messages_sqlite(db: Session, session_ids: List[int], fresh: List[dict]) -> List[dict]:
+
+        # The session insert took SQLite's write lock, so no other writer can
+        # claim ids until commit: the message ids are assigned here, which lets
+        # every parent_id be known up front and the whole batch go in as one
+        # executemany.
+        next_id = (db.query(func.max(ChatMessage.id)).scalar() or 0) + 1
+        rows, leaves = [], []
+        for session_id, session in zip(session_ids, fresh):
+            parent_id = None
+            for role, content, at in session["messages"]:
+                row = ImportService._message_row(session_id, parent_id, role, content, at)
+                row["id"] = next_id
+                rows.append(row)
+                parent_id = next_id
+                next_id += 1
+            leaves.append({"row_id": session_id, "leaf": parent_id})
+        db.execute(insert(ChatMessage.__table__), rows)
+        return leaves
+
+    @staticmethod
+    def _insert_messages_by_level(db: Session, session_ids: List[int], fresh: List[dict]) -> List[dict]:
+
+        # Other databases hand out ids from a sequence that concurrent writers
+        # share, so ids are never picked here. Each imported session is a
+        # single chain; the n-th message of every session goes in as one
+        # executemany, and the ids it returns are the parents of the next level.
+        message_table = ChatMessage.__table__
+        parents: List[Optional[int]] = [None] * len(fresh)
+        depth = 0
+        while True:
+            level = [index for index, session in enumerate(fresh) if depth < len(session["messages"])]
+            if not level:
+                break
+            ids = db.execute(
+                insert(message_table).returning(message_table.c.id, sort_by_parameter_order=True),
+                [ImportService._message_row(session_ids[index], parents[index], *fresh[index]["messages"][depth]) for index in level]
+            ).scalars().all()
+            for index, message_id in zip(level, ids):
+                parents[index] = message_id
+            depth += 1
+        return [{"row_id": session_id, "leaf": leaf} for session_id, leaf in zip(session_ids, parents)]
+
+    @staticmethod
+    def run(db: Session, user: User, fileobj: BinaryIO,
+            progress: Optional[Callable[[dict], None]] = None, enforce_limit: bool = True) -> dict:
+
+        # Usage deltas of a batch are merged into one update per rollup row.
+        UsageService.defer(db)
+        try:
+            return ImportService.import_sessions(db, user, iter_upload(fileobj), progress, enforce_limit)
+        finally:
+            db.info.pop("usage_deferred", None)
@@ -1,7 +1,78 @@
+import asyncio
+import hashlib
 import httpx
 import json
-from typing import Optional, Generator, AsyncGenerator, List, Dict
+import sys
+import time
+from typing import Optional, Generator, AsyncGenerator, List, Dict, Tuple
 from app.core.config import settings
+from app.core.diagnostics import track, record_time
+from app.core.state import state_store
+from app.core.tracing import tracer
+from app.services.concurrency_service import AdaptiveConcurrencyLimiter, concurrency_limiter, InferenceBusyError
+
+MAIN_BACKEND = "main"
+
+TITLE_PROMPT = (
+    "Write a title of at most six words for a conversation that starts with "
+    "the message below. Reply with the title only, without quotes.\n\n{message}"
+)
+
+def parse_pairs(value: str) -> Dict[str, str]:
+
+    # "a=x, b=y" -> {"a": "x", "b": "y"}; used by MODEL_BACKENDS and MODEL_TASK_ROUTES.
+    pairs = {}
+    for item in value.split(","):
+        name, _, target = item.partition("=")
+        if name.strip() and target.strip():
+            pairs[name.strip()] = target.strip()
+    return pairs
+
+class _Flight:
+
+    # One upstream generation shared by every identical request that arrives
+    # while it is running.
+
+    def __init__(self, table: Dict, key: str):
+
+        self.table = table
+        self.key = key
+        self.chunks: List[str] = []
+        self.stats: Dict = {}
+        self.subscribers = 0
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.get_running_loop().create_future()
+
+    def notify(self):
+
+        changed, self.changed = self.changed, asyncio.get_running_loop().create_future()
+        changed.set_result(None)
+
+class ModelBackend:
+
+    # One llama-server instance. Each has its own concurrency limiter, so work
+    # routed to a small model never waits for (or takes) a main-model slot.
+    # The main backend keeps the shared limiter that degrade mode watches.
+
+    def __init__(self, name: str, url: str, limiter: AdaptiveConcurrencyLimiter):
+
+        self.name = name
+        self.url = url.rstrip("/")
+        self.limiter = limiter
+        self.active_requests = 0
+
+    @property
+    def healthy(self) -> bool:
+
+        # Written by the health monitor; unknown counts as up.
+        return state_store.get(f"inference:backend:{self.name}") != "0"
+
+    @healthy.setter
+    def healthy(self, value: bool):
+
+        state_store.set(f"inference:backend:{self.name}", "1" if value else "0", ttl=settings.HEALTH_POLL_SECONDS * 6)
 
 class InferenceService:
 
@@ -10,25 +81,91 @@ class InferenceService:
         self.server_url = settings.LLAMA_SERVER_URL
         self.client = httpx.Client(timeout=300.0)
         self.async_client = httpx.AsyncClient(timeout=300.0)
-        self.model_loaded = False
-
-    def check_health(self) -> bool:
-
-        try:
-            response = self.client.get(f"{self.server_url}/health")
-            self.model_loaded = response.status_code == 200
-            return self.model_loaded
-        except Exception:
-            self.model_loaded = False
-            return False
+        self.backends: Dict[str, ModelBackend] = {MAIN_BACKEND: ModelBackend(MAIN_BACKEND, self.server_url, concurrency_limiter)}
+        for name, url in parse_pairs(settings.MODEL_BACKENDS).items():
+            if name != MAIN_BACKEND:
+                self.backends[name] = ModelBackend(name, url, AdaptiveConcurrencyLimiter(f"inference:backend:{name}:health"))
+        self.task_routes = parse_pairs(settings.MODEL_TASK_ROUTES)
+        self.routes: Dict[Tuple[str, str, str], int] = {}
+        self._streams: Dict[str, _Flight] = {}
+        self._completions: Dict[str, _Flight] = {}
+        self.coalescing = {"upstream": 0, "coalesced": 0, "cancelled": 0}
+
+    @property
+    def active_requests(self) -> int:
+
+        return self.backends[MAIN_BACKEND].active_requests
+
+    def route(self, task: str = "chat", messages: Optional[List[Dict]] = None, model: Optional[str] = None) -> Tuple[ModelBackend, str]:
+
+        # Which backend serves a request, and why. A model asked for by name
+        # wins; then the task's route (titles and summaries to a small model);
+        # then short chat prompts to MODEL_SHORT_PROMPT_BACKEND. Routes to
+        # backends that are not configured are ignored, and a configured one
+        # that is down falls back to main.
+        if model:
+            if model not in self.backends:
+                raise ValueError(f"Unknown model backend: {model}")
+            return self.backends[model], "requested"
+
+        target, reason = None, "default"
+        if task in self.task_routes:
+            target, reason = self.task_routes[task], "task"
+        elif task == "chat" and messages and settings.MODEL_SHORT_PROMPT_TOKENS > 0:
+            # Same estimate as chat_service.estimate_tokens.
+            prompt_tokens = sum(len(message["content"]) for message in messages) // 4 + 1
+            if prompt_tokens <= settings.MODEL_SHORT_PROMPT_TOKENS:
+                target, reason = settings.MODEL_SHORT_PROMPT_BACKEND, "short_prompt"
+
+        backend = self.backends.get(target)
+        if backend is None or backend.name == MAIN_BACKEND:
+            return self.backends[MAIN_BACKEND], "default"
+        if not backend.healthy:
+            return self.backends[MAIN_BACKEND], "fallback"
+        return backend, reason
+
+    def _routed(self, task: str, messages: List[Dict], model: Optional[str], stats: Optional[Dict]) -> ModelBackend:
+
+        backend, reason = self.route(task, messages, model)
+        key = (task, backend.name, reason)
+        self.routes[key] = self.routes.get(key, 0) + 1
+        if stats is not None:
+            stats["task"] = task
+            stats["route_reason"] = reason
+        return backend
+
+    def routing_stats(self) -> Dict:
+
+        return {
+            "backends": {
+                name: {
+                    "url": backend.url,
+                    "healthy": backend.healthy,
+                    "active_requests": backend.active_requests,
+                    "limit": backend.limiter.limit,
+                    "in_flight": backend.limiter.in_flight,
+                    "waiting": backend.limiter.waiting
+                }
+                for name, backend in self.backends.items()
+            },
+            "task_routes": self.task_routes,
+            "routes": [
+                {"task": task, "backend": name, "reason": reason, "requests": count}
+                for (task, name, reason), count in sorted(self.routes.items())
+            ]
+        }
 
-    def generate_response(
+    def _build_request_data(
         self,
-        prompt: str,
+        messages: List[Dict],
         max_tokens: int = None,
         temperature: float = None,
-        top_p: float = None
-    ) -> str:
+        top_p: float = None,
+        stream: bool = False,
+        n_probs: int = None,
+        speculative: Optional[Dict] = None,
+        seed: Optional[int] = None
+    ) -> Dict:
 
         if max_tokens is None:
             max_tokens = settings.MODEL_MAX_TOKENS
@@ -36,30 +173,124 @@ class InferenceService:
             temperature = settings.MODEL_TEMPERATURE
         if top_p is None:
             top_p = settings.MODEL_TOP_P
+        if n_probs is None:
+            n_probs = settings.MODEL_N_PROBS
 
         request_data = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+            "messages": messages,
             "max_tokens": max_tokens,
             "temperature": temperature,
             "top_p": top_p,
-            "stream": False
+            "stream": stream
         }
 
+        if n_probs:
+            request_data["n_probs"] = n_probs
+        if seed is not None:
+            request_data["seed"] = seed
+
+        # llama-server reads draft settings as flat "speculative.*" keys; they are
+        # ignored when the server was started without a draft model.
+        draft = {}
+        if settings.SPECULATIVE_ENABLED:
+            draft = {
+                "n_max": settings.SPECULATIVE_DRAFT_MAX,
+                "n_min": settings.SPECULATIVE_DRAFT_MIN,
+                "p_min": settings.SPECULATIVE_DRAFT_P_MIN
+            }
+        if speculative:
+            draft.update({key: value for key, value in speculative.items() if value is not None})
+        for key, value in draft.items():
+            request_data[f"speculative.{key}"] = value
+
+        return request_data
+
+    @staticmethod
+    def summarize_timings(timings: Optional[Dict]) -> Optional[Dict]:
+
+        if not timings:
+            return None
+
+        predicted_n = timings.get("predicted_n", 0)
+        predicted_ms = timings.get("predicted_ms", 0.0)
+        draft_n = timings.get("draft_n", 0)
+        draft_accepted = timings.get("draft_n_accepted", 0)
+
+        tokens_per_second = timings.get("predicted_per_second")
+        if tokens_per_second is None and predicted_ms:
+            tokens_per_second = predicted_n / (predicted_ms / 1000.0)
+
+        return {
+            "prompt_tokens": timings.get("prompt_n", 0),
+            "prompt_ms": timings.get("prompt_ms", 0.0),
+            "prompt_tokens_per_second": timings.get("prompt_per_second"),
+            "completion_tokens": predicted_n,
+            "generation_ms": predicted_ms,
+            "tokens_per_second": tokens_per_second,
+            "cached_tokens": timings.get("cache_n", 0),
+            "draft_tokens": draft_n,
+            "draft_accepted": draft_accepted,
+            "acceptance_rate": (draft_accepted / draft_n) if draft_n else None
+        }
+
+    @staticmethod
+    def _start_stats(backend: ModelBackend, stats: Optional[Dict], request_data: Dict):
+
+        # What ran where, for per-message telemetry.
+        if stats is not None:
+            stats["backend"] = backend.url
+            stats["route"] = backend.name
+            stats["params"] = {
+                "max_tokens": request_data["max_tokens"],
+                "temperature": request_data["temperature"],
+                "top_p": request_data["top_p"]
+            }
+
+    @property
+    def model_loaded(self) -> bool:
+
+        # Shared so every worker reports the same upstream state, whichever one checked last.
+        return state_store.get("inference:model_loaded") == "1"
+
+    @model_loaded.setter
+    def model_loaded(self, value: bool):
+
+        state_store.set("inference:model_loaded", "1" if value else "0")
+
+    def generate_response(
+        self,
+        prompt: str,
+        max_tokens: int = None,
+        temperature: float = None,
+        top_p: float = None,
+        n_probs: int = None,
+        speculative: Optional[Dict] = None,
+        stats: Optional[Dict] = None
+    ) -> str:
+
+        request_data = self._build_request_data(
+            [{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stream=False,
+            n_probs=n_probs,
+            speculative=speculative
+        )
+
         try:
-            response = self.client.post(
-                f"{self.server_url}/v1/chat/completions",
-                json=request_data
-            )
+            with track("http"):
+                response = self.client.post(
+                    f"{self.server_url}/v1/chat/completions",
+                    json=request_data
+                )
             response.raise_for_status()
 
             result = response.json()
 
             if "choices" in result and len(result["choices"]) > 0:
+                if stats is not None:
+                    stats["timings"] = self.summarize_timings(result.get("timings"))
                 message = result["choices"][0].get("message", {})
                 content = message.get("content", "")
                 return content.strip()
@@ -76,29 +307,23 @@ class InferenceService:
         prompt: str,
         max_tokens: int = None,
         temperature: float = None,
-        top_p: float = None
+        top_p: float = None,
+        n_probs: int = None,
+        speculative: Optional[Dict] = None,
+        stats: Optional[Dict] = None
     ) -> Generator[str, None, None]:
 
-        if max_tokens is None:
-            max_tokens = settings.MODEL_MAX_TOKENS
-        if temperature is None:
-            temperature = settings.MODEL_TEMPERATURE
-        if top_p is None:
-            top_p = settings.MODEL_TOP_P
-
-        request_data = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "top_p": top_p,
-            "stream": True
-        }
-
+        request_data = self._build_request_data(
+            [{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stream=True,
+            n_probs=n_probs,
+            speculative=speculative
+        )
+
+        started = time.perf_counter()
         try:
             with self.client.stream(
                 "POST",
@@ -117,6 +342,8 @@ class InferenceService:
 
                         try:
                             data = json.loads(data_str)
+                            if stats is not None and "timings" in data:
+                                stats["timings"] = self.summarize_timings(data["timings"])
                             if "choices" in data and len(data["choices"]) > 0:
                                 delta = data["choices"][0].get("delta", {})
                                 content = delta.get("content", "")
@@ -129,6 +356,8 @@ class InferenceService:
             raise RuntimeError(f"LLM server error: {e.response.status_code}")
         except Exception as e:
             raise RuntimeError(f"Failed to stream response: {str(e)}")
+        finally:
+            record_time("http", time.perf_counter() - started)
 
     async def generate_response_stream_async(
         self,
@@ -136,38 +365,96 @@ class InferenceService:
         messages: List[Dict] = None,
         max_tokens: int = None,
         temperature: float = None,
-        top_p: float = None
+        top_p: float = None,
+        n_probs: int = None,
+        speculative: Optional[Dict] = None,
+        seed: Optional[int] = None,
+        stats: Optional[Dict] = None,
+        task: str = "chat",
+        model: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
 
-        if max_tokens is None:
-            max_tokens = settings.MODEL_MAX_TOKENS
-        if temperature is None:
-            temperature = settings.MODEL_TEMPERATURE
-        if top_p is None:
-            top_p = settings.MODEL_TOP_P
-
         if messages is None:
             if prompt is None:
                 raise ValueError("Either prompt or messages must be provided")
             messages = [{"role": "user", "content": prompt}]
 
-        request_data = {
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "top_p": top_p,
-            "stream": True
-        }
+        request_data = self._build_request_data(
+            messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stream=True,
+            n_probs=n_probs,
+            speculative=speculative,
+            seed=seed
+        )
+
+        backend = self._routed(task, messages, model, stats)
+        key = self._coalesce_key(backend, request_data)
+        if key is None:
+            async for chunk in self._stream_upstream(backend, request_data, stats):
+                yield chunk
+            return
+
+        flight, leader = self._join_flight(self._streams, key)
+        if leader:
+            flight.task = asyncio.create_task(self._run_stream_flight(flight, backend, request_data))
+            flight.task.add_done_callback(lambda _: self._forget_flight(flight))
+
+        joined = time.perf_counter()
+        ttft_ms = None
+        try:
+            # Late joiners replay what was already generated, then follow live.
+            index = 0
+            while True:
+                if index < len(flight.chunks):
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - joined) * 1000.0
+                    index += 1
+                    yield flight.chunks[index - 1]
+                    continue
+                if flight.finished:
+                    break
+                # Shielded: one subscriber going away must not cancel the shared wake-up.
+                await asyncio.shield(flight.changed)
+            if flight.error is not None:
+                raise flight.error
+            self._copy_flight_stats(flight, stats, leader, ttft_ms)
+        finally:
+            self._leave_flight(flight)
+
+    async def _run_stream_flight(self, flight: "_Flight", backend: ModelBackend, request_data: Dict):
+
+        try:
+            async for chunk in self._stream_upstream(backend, request_data, flight.stats):
+                flight.chunks.append(chunk)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            flight.notify()
 
+    async def _stream_upstream(self, backend: ModelBackend, request_data: Dict, stats: Optional[Dict]) -> AsyncGenerator[str, None]:
+
+        self._start_stats(backend, stats, request_data)
+        backend.active_requests += 1
+        span = self._start_span("llm.stream", backend, request_data, stats)
+        started = time.perf_counter()
         try:
-            async with self.async_client.stream(
+            async with backend.limiter.slot() as sample, self.async_client.stream(
                 "POST",
-                f"{self.server_url}/v1/chat/completions",
+                f"{backend.url}/v1/chat/completions",
                 json=request_data,
+                headers=self._trace_headers(span),
                 timeout=300.0
             ) as response:
+                responded = time.perf_counter()
                 response.raise_for_status()
 
+                timings = None
+                chunks = 0
                 async for line in response.aiter_lines():
                     if line.startswith("data: "):
                         data_str = line[6:]
@@ -177,52 +464,314 @@ class InferenceService:
 
                         try:
                             data = json.loads(data_str)
+                            if "timings" in data:
+                                timings = self.summarize_timings(data["timings"])
+                                if stats is not None:
+                                    stats["timings"] = timings
+                                    stats["model"] = data.get("model")
                             if "choices" in data and len(data["choices"]) > 0:
                                 delta = data["choices"][0].get("delta", {})
                                 content = delta.get("content", "")
                                 if content:
+                                    if not chunks:
+                                        sample["first_token_at"] = time.perf_counter()
+                                        if stats is not None:
+                                            # As the user saw it, limiter queueing included.
+                                            stats["ttft_ms"] = (sample["first_token_at"] - started) * 1000.0
+                                            stats["queued_ms"] = sample.get("queued_ms")
+                                    chunks += 1
                                     yield content
                         except json.JSONDecodeError:
                             continue
 
+                self._trace_phases(span, sample, started, responded, sample.get("first_token_at"), timings)
+                self._fill_sample(sample, timings, chunks)
+
+        except InferenceBusyError:
+            raise
         except httpx.HTTPStatusError as e:
             raise RuntimeError(f"LLM server error: {e.response.status_code}")
         except Exception as e:
             raise RuntimeError(f"Failed to stream response: {str(e)}")
+        finally:
+            backend.active_requests -= 1
+            record_time("http", time.perf_counter() - started)
+            if span is not None:
+                span.end(error=sys.exc_info()[1])
 
-    async def generate_title(self, first_message: str) -> str:
-
-        title_prompt = f
-
-        messages = [{"role": "user", "content": title_prompt}]
+    async def generate_response_async(
+        self,
+        prompt: str = None,
+        messages: List[Dict] = None,
+        max_tokens: int = None,
+        temperature: float = None,
+        top_p: float = None,
+        n_probs: int = None,
+        speculative: Optional[Dict] = None,
+        seed: Optional[int] = None,
+        stats: Optional[Dict] = None,
+        task: str = "chat",
+        model: Optional[str] = None
+    ) -> str:
 
-        request_data = {
-            "messages": messages,
-            "max_tokens": 20,
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "stream": False
-        }
+        if messages is None:
+            if prompt is None:
+                raise ValueError("Either prompt or messages must be provided")
+            messages = [{"role": "user", "content": prompt}]
 
+        request_data = self._build_request_data(
+            messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stream=False,
+            n_probs=n_probs,
+            speculative=speculative,
+            seed=seed
+        )
+
+        backend = self._routed(task, messages, model, stats)
+        key = self._coalesce_key(backend, request_data)
+        if key is None:
+            return await self._complete_upstream(backend, request_data, stats)
+
+        flight, leader = self._join_flight(self._completions, key)
+        if leader:
+            flight.task = asyncio.create_task(self._complete_upstream(backend, request_data, flight.stats))
+            flight.task.add_done_callback(lambda _: self._forget_flight(flight))
+
+        joined = time.perf_counter()
         try:
-            response = await self.async_client.post(
-                f"{self.server_url}/v1/chat/completions",
-                json=request_data
-            )
-            response.raise_for_status()
-            result = response.json()
+            result = await asyncio.shield(flight.task)
+        finally:
+            self._leave_flight(flight)
+        self._copy_flight_stats(flight, stats, leader, (time.perf_counter() - joined) * 1000.0)
+        return result
 
-            if "choices" in result and len(result["choices"]) > 0:
-                message = result["choices"][0].get("message", {})
-                title = message.get("content", "").strip()
+    async def _complete_upstream(self, backend: ModelBackend, request_data: Dict, stats: Optional[Dict]) -> str:
 
-                if title and len(title.split()) <= 6:
-                    return title
+        self._start_stats(backend, stats, request_data)
 
-            return first_message[:50] + ("..." if len(first_message) > 50 else "")
+        backend.active_requests += 1
+        span = self._start_span("llm.complete", backend, request_data, stats)
+        started = time.perf_counter()
+        try:
+            async with backend.limiter.slot() as sample:
+                with track("http"):
+                    response = await self.async_client.post(
+                        f"{backend.url}/v1/chat/completions",
+                        json=request_data,
+                        headers=self._trace_headers(span)
+                    )
+                responded = time.perf_counter()
+                response.raise_for_status()
 
+                result = response.json()
+
+                if "choices" in result and len(result["choices"]) > 0:
+                    timings = self.summarize_timings(result.get("timings"))
+                    if stats is not None:
+                        stats["timings"] = timings
+                        stats["model"] = result.get("model")
+                        stats["queued_ms"] = sample.get("queued_ms")
+                        if timings:
+                            stats["ttft_ms"] = (sample.get("queued_ms") or 0.0) + timings["prompt_ms"]
+                    self._trace_phases(span, sample, started, responded, None, timings)
+                    self._fill_sample(sample, timings, None)
+                    message = result["choices"][0].get("message", {})
+                    content = message.get("content", "")
+                    return content.strip()
+                else:
+                    raise ValueError("Invalid response format from llama-server")
+
+        except InferenceBusyError:
+            raise
+        except httpx.HTTPStatusError as e:
+            raise RuntimeError(f"LLM server error: {e.response.status_code}")
+        except Exception as e:
+            raise RuntimeError(f"Failed to generate response: {str(e)}")
+        finally:
+            backend.active_requests -= 1
+            if span is not None:
+                span.end(error=sys.exc_info()[1])
+
+    def _coalesce_key(self, backend: ModelBackend, request_data: Dict) -> Optional[str]:
+
+        # Only deterministic sampling can be shared: greedy decoding, or a fixed seed.
+        if not settings.COALESCE_ENABLED:
+            return None
+        if request_data["temperature"] != 0 and request_data.get("seed") is None:
+            return None
+
+        normalized = dict(request_data, backend=backend.name)
+        normalized["messages"] = [
+            {"role": message["role"], "content": message["content"].replace("\r\n", "\n").strip()}
+            for message in request_data["messages"]
+        ]
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _join_flight(self, table: Dict[str, "_Flight"], key: str):
+
+        flight = table.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(table, key)
+            table[key] = flight
+            self.coalescing["upstream"] += 1
+        else:
+            self.coalescing["coalesced"] += 1
+        flight.subscribers += 1
+        return flight, leader
+
+    def _leave_flight(self, flight: "_Flight"):
+
+        flight.subscribers -= 1
+        # Nobody is listening any more: stop llama-server instead of finishing
+        # a generation no one will read.
+        if flight.subscribers == 0 and flight.task is not None and not flight.task.done():
+            # Forget it right away so a new identical request starts fresh
+            # instead of joining a generation that is being cancelled.
+            self._forget_flight(flight)
+            flight.task.cancel()
+            self.coalescing["cancelled"] += 1
+
+    @staticmethod
+    def _forget_flight(flight: "_Flight"):
+
+        if flight.table.get(flight.key) is flight:
+            del flight.table[flight.key]
+
+    @staticmethod
+    def _copy_flight_stats(flight: "_Flight", stats: Optional[Dict], leader: bool, ttft_ms: Optional[float]):
+
+        if stats is None:
+            return
+        stats.update(flight.stats)
+        stats["coalesced"] = not leader
+        if not leader:
+            stats["ttft_ms"] = ttft_ms
+            stats["queued_ms"] = None
+
+    def coalescing_stats(self) -> Dict:
+
+        return dict(
+            self.coalescing,
+            in_flight_streams=len(self._streams),
+            in_flight_completions=len(self._completions)
+        )
+
+    @staticmethod
+    def _start_span(name: str, backend: ModelBackend, request_data: Dict, stats: Optional[Dict]):
+
+        return tracer.start_span(
+            name,
+            backend=backend.name,
+            task=(stats or {}).get("task"),
+            max_tokens=request_data["max_tokens"]
+        )
+
+    @staticmethod
+    def _trace_headers(span) -> Optional[Dict]:
+
+        # llama-server (or a proxy in front of it) can log the caller's trace id.
+        return {"traceparent": span.traceparent()} if span is not None else None
+
+    @staticmethod
+    def _trace_phases(span, sample: Dict, started: float, responded: float, first_token_at: Optional[float], timings: Optional[Dict]):
+
+        # Splits one upstream call into limiter queue, connection pool and
+        # request, prompt processing and generation. Without streamed tokens
+        # the last two are placed from llama-server's own timings.
+        if span is None:
+            return
+        finished = time.perf_counter()
+        slot_at = sample.get("started_at", started)
+        if slot_at > started:
+            tracer.record("llm.queue", started, slot_at, parent=span)
+        timings = timings or {}
+        prefill = {
+            "prompt_tokens": timings.get("prompt_tokens"),
+            "cached_tokens": timings.get("cached_tokens"),
+            "server_ms": timings.get("prompt_ms")
+        }
+        generation = {
+            "completion_tokens": timings.get("completion_tokens"),
+            "tokens_per_second": timings.get("tokens_per_second"),
+            "draft_accepted": timings.get("draft_accepted"),
+            "server_ms": timings.get("generation_ms")
+        }
+        if first_token_at is not None:
+            tracer.record("llm.connect", slot_at, responded, parent=span)
+            tracer.record("llm.prefill", responded, first_token_at, parent=span, **prefill)
+            tracer.record("llm.generation", first_token_at, finished, parent=span, **generation)
+        elif timings:
+            generation_at = max(slot_at, responded - timings["generation_ms"] / 1000.0)
+            prefill_at = max(slot_at, generation_at - timings["prompt_ms"] / 1000.0)
+            tracer.record("llm.connect", slot_at, prefill_at, parent=span)
+            tracer.record("llm.prefill", prefill_at, generation_at, parent=span, **prefill)
+            tracer.record("llm.generation", generation_at, responded, parent=span, **generation)
+        else:
+            tracer.record("llm.connect", slot_at, responded, parent=span)
+
+    @staticmethod
+    def _fill_sample(sample: Dict, timings: Optional[Dict], chunks: Optional[int]):
+
+        # Feeds the adaptive concurrency limiter; llama-server's own timings are
+        # preferred over wall-clock estimates when it reports them.
+        if timings:
+            sample["completion_tokens"] = timings["completion_tokens"]
+            sample["tokens_per_second"] = timings["tokens_per_second"]
+            if "first_token_at" not in sample and "started_at" in sample:
+                sample["first_token_at"] = sample["started_at"] + timings["prompt_ms"] / 1000.0
+        elif chunks and "first_token_at" in sample:
+            sample["completion_tokens"] = chunks
+            decode_seconds = time.perf_counter() - sample["first_token_at"]
+            if decode_seconds > 0 and chunks > 1:
+                sample["tokens_per_second"] = (chunks - 1) / decode_seconds
+
+    async def embed_async(self, texts: List[str]) -> List[List[float]]:
+
+        # OpenAI-style /v1/embeddings. llama-server only serves it when started
+        # with --embeddings, usually as a separate instance (EMBEDDING_SERVER_URL).
+        request_data = {"input": texts}
+        if settings.EMBEDDING_MODEL:
+            request_data["model"] = settings.EMBEDDING_MODEL
+        try:
+            with track("http"), tracer.span("llm.embed", texts=len(texts)) as span:
+                response = await self.async_client.post(
+                    f"{settings.EMBEDDING_SERVER_URL or self.server_url}/v1/embeddings",
+                    json=request_data,
+                    headers=self._trace_headers(span)
+                )
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise RuntimeError(f"Embedding server error: {e.response.status_code}")
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Failed to get embeddings: {str(e)}")
+        data = sorted(response.json().get("data", []), key=lambda item: item.get("index", 0))
+        if len(data) != len(texts):
+            raise RuntimeError("Invalid response format from embedding server")
+        return [item["embedding"] for item in data]
+
+    async def generate_title(self, first_message: str) -> Optional[str]:
+
+        # None when the model is unavailable or answers with something that
+        # is not a short title; callers keep their first-words title then.
+        try:
+            title = await self.generate_response_async(
+                prompt=TITLE_PROMPT.format(message=first_message[:1000]),
+                max_tokens=settings.TITLE_MAX_TOKENS,
+                temperature=0.2,
+                task="title"
+            )
         except Exception:
-            return first_message[:50] + ("..." if len(first_message) > 50 else "")
+            return None
+
+        lines = title.strip().splitlines()
+        title = lines[0].strip().strip('"\'*#').strip() if lines else ""
+        if title and len(title.split()) <= 6 and len(title) <= 80:
+            return title
+        return None
 
     def __del__(self):
 
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+from app.db.models import InferenceMetric, User
+from app.services.usage_service import UsageService, hour_bucket
+
+class MetricsService:
+
+    @staticmethod
+    def record_inference(
+        db: Session,
+        message_id: Optional[int],
+        user_id: int,
+        session_id: int,
+        stats: Dict,
+        mode: str,
+        streamed: bool,
+        commit: bool = True
+    ) -> Optional[InferenceMetric]:
+
+        timings = stats.get("timings") or {}
+        params = stats.get("params") or {}
+        metric = InferenceMetric(
+            message_id=message_id,
+            user_id=user_id,
+            session_id=session_id,
+            backend=stats.get("backend"),
+            model=stats.get("model"),
+            route=stats.get("route"),
+            route_reason=stats.get("route_reason"),
+            task=stats.get("task"),
+            mode=mode,
+            streamed=streamed,
+            coalesced=bool(stats.get("coalesced")),
+            prompt_tokens=timings.get("prompt_tokens"),
+            completion_tokens=timings.get("completion_tokens"),
+            cached_tokens=timings.get("cached_tokens"),
+            draft_tokens=timings.get("draft_tokens"),
+            draft_accepted=timings.get("draft_accepted"),
+            queued_ms=stats.get("queued_ms"),
+            ttft_ms=stats.get("ttft_ms"),
+            prompt_ms=timings.get("prompt_ms"),
+            generation_ms=timings.get("generation_ms"),
+            tokens_per_second=timings.get("tokens_per_second"),
+            max_tokens=params.get("max_tokens"),
+            temperature=params.get("temperature"),
+            top_p=params.get("top_p")
+        )
+        if not commit:
+            # Part of the caller's transaction; the caller handles failures.
+            MetricsService._add(db, metric, user_id)
+            return metric
+
+        # Telemetry must never fail the request that produced it.
+        try:
+            MetricsService._add(db, metric, user_id)
+            db.commit()
+            return metric
+        except Exception as e:
+            db.rollback()
+            print(f"Error recording inference metrics: {e}")
+            return None
+
+    @staticmethod
+    def _add(db: Session, metric: InferenceMetric, user_id: int):
+
+        db.add(metric)
+        UsageService.record_usage(
+            db,
+            user_id,
+            requests=1,
+            prompt_tokens=metric.prompt_tokens or 0,
+            completion_tokens=metric.completion_tokens or 0
+        )
+
+    @staticmethod
+    def aggregate_inference(
+        db: Session,
+        group_by: str = "hour",
+        hours: int = 24,
+        user_id: Optional[int] = None
+    ) -> List[Dict]:
+
+        if group_by == "user":
+            keys = [InferenceMetric.user_id, User.username]
+        elif group_by == "route":
+            keys = [InferenceMetric.route, InferenceMetric.task]
+        else:
+            keys = [hour_bucket(InferenceMetric.created_at).label("hour")]
+
+        query = db.query(
+            *keys,
+            func.count(InferenceMetric.id).label("requests"),
+            func.sum(InferenceMetric.prompt_tokens).label("prompt_tokens"),
+            func.sum(InferenceMetric.completion_tokens).label("completion_tokens"),
+            func.sum(InferenceMetric.cached_tokens).label("cached_tokens"),
+            func.avg(InferenceMetric.ttft_ms).label("avg_ttft_ms"),
+            func.max(InferenceMetric.ttft_ms).label("max_ttft_ms"),
+            func.avg(InferenceMetric.queued_ms).label("avg_queued_ms"),
+            func.avg(InferenceMetric.tokens_per_second).label("avg_tokens_per_second"),
+            func.sum(case((InferenceMetric.mode != "normal", 1), else_=0)).label("degraded_requests"),
+            func.sum(case((InferenceMetric.coalesced == True, 1), else_=0)).label("coalesced_requests")
+        ).filter(InferenceMetric.created_at >= datetime.utcnow() - timedelta(hours=hours))
+
+        if group_by == "user":
+            query = query.outerjoin(User, User.id == InferenceMetric.user_id)
+        if user_id is not None:
+            query = query.filter(InferenceMetric.user_id == user_id)
+
+        rows = query.group_by(*keys).order_by(*keys).all()
+        return [
+            {
+                key: round(value, 2) if isinstance(value, float) else value
+                for key, value in row._mapping.items()
+            }
+            for row in rows
+        ]
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from typing import Any, Callable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.tracing import tracer
+from app.db.database import SessionLocal
+from app.services.usage_service import UsageService
+
+Write = Callable[[Session], Any]
+
+class WriteBehindQueue:
+
+    # Group commit for the chat write path. Concurrent requests hand in write
+    # callables; the worker runs every callable that arrived within a short
+    # window in one transaction on a worker thread, commits once, and only then
+    # resolves each caller's future, so an id returned to a client is always
+    # durable. While one batch commits the next one accumulates, so under load
+    # the number of commits stays flat as turns per second grow.
+
+    def __init__(self):
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.counters = {"batches": 0, "writes": 0, "max_batch": 0, "replayed_batches": 0, "failed_writes": 0, "commit_ms": 0.0}
+
+    def start(self):
+
+        if not settings.WRITE_BEHIND_ENABLED or self.worker is not None:
+            return
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+
+        # Drain: new writes run inline from here on, everything already queued
+        # is committed before the worker exits.
+        if self.worker is None:
+            return
+        queue, self.queue = self.queue, None
+        queue.put_nowait(None)
+        await self.worker
+        self.worker = None
+
+    async def submit(self, write: Write) -> Any:
+
+        # Runs write(db) and returns its result once it is committed. Exceptions
+        # raised by write (e.g. HTTPException from validation) propagate to the caller.
+        if self.queue is None:
+            ok, value = self._execute([write])[0]
+            if not ok:
+                raise value
+            return value
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((write, future))
+        # A caller that goes away (client disconnect) must not cancel a write
+        # that may already be part of a batch. The batch's own queries run on
+        # the writer thread, outside any request trace; this span is the wait.
+        with tracer.span("db.write_behind", queued=self.queue.qsize()):
+            return await asyncio.shield(future)
+
+    async def _run(self):
+
+        loop = asyncio.get_running_loop()
+        queue = self.queue
+        stopping = False
+        while not stopping:
+            batch = [await queue.get()]
+            deadline = loop.time() + settings.WRITE_BEHIND_INTERVAL_MS / 1000.0
+            while len(batch) < settings.WRITE_BEHIND_MAX_BATCH:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            stopping = any(item is None for item in batch)
+            batch = [item for item in batch if item is not None]
+            if not batch:
+                continue
+            try:
+                outcomes = await asyncio.to_thread(self._execute, [write for write, _ in batch])
+            except Exception as e:
+                outcomes = [(False, e)] * len(batch)
+            for (_, future), (ok, value) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _execute(self, writes: List[Write]) -> List[Tuple[bool, Any]]:
+
+        # Results are used after the session closes, so keep their loaded state.
+        db = SessionLocal(expire_on_commit=False)
+        UsageService.defer(db)
+        started = time.perf_counter()
+        try:
+            try:
+                results = [(True, write(db)) for write in writes]
+                self._commit(db)
+                self._count(len(writes), started)
+                return results
+            except Exception as e:
+                self._rollback(db)
+                if len(writes) == 1:
+                    self.counters["failed_writes"] += 1
+                    return [(False, e)]
+
+            # One write failed the group: replay each in its own transaction so
+            # only the failing caller sees the error.
+            self.counters["replayed_batches"] += 1
+            outcomes = []
+            for write in writes:
+                try:
+                    value = write(db)
+                    self._commit(db)
+                    outcomes.append((True, value))
+                except Exception as e:
+                    self._rollback(db)
+                    self.counters["failed_writes"] += 1
+                    outcomes.append((False, e))
+            self._count(len(writes), started)
+            return outcomes
+        finally:
+            db.close()
+
+    @staticmethod
+    def _commit(db: Session):
+
+        UsageService.flush_deferred(db)
+        db.commit()
+
+    @staticmethod
+    def _rollback(db: Session):
+
+        db.rollback()
+        UsageService.defer(db)
+
+    def _count(self, size: int, started: float):
+
+        self.counters["batches"] += 1
+        self.counters["writes"] += size
+        self.counters["max_batch"] = max(self.counters["max_batch"], size)
+        self.counters["commit_ms"] += (time.perf_counter() - started) * 1000.0
+
+    def stats(self) -> dict:
+
+        batches = self.counters["batches"]
+        return {
+            "enabled": self.worker is not None,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            **self.counters,
+            "commit_ms": round(self.counters["commit_ms"], 1),
+            "avg_batch": round(self.counters["writes"] / batches, 2) if batches else None
+        }
+
+write_behind = WriteBehindQueue()
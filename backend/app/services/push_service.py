@@ -0,0 +1,123 @@
+import asyncio
+from typing import Any, Dict, Optional, Set
+from fastapi import WebSocket
+from app.core.config import settings
+from app.core.serialization import dumps_str
+
+class PushChannel:
+
+    # One WebSocket connection (GET /chat/ws). Frames are JSON arrays
+    # [kind, stream, data] written by a single sender task from a bounded
+    # queue: generations wait when it is full, so a slow client slows the
+    # llama-server streams feeding it instead of growing memory. Consecutive
+    # token frames of one stream are merged on the way out.
+
+    def __init__(self, websocket: WebSocket, user_id: int):
+
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_FRAMES)
+        self.version: Optional[str] = None
+        self.resync = False
+        self.closed = False
+
+    async def send(self, kind: str, stream: Any, data: Any):
+
+        if not self.closed:
+            await self.queue.put([kind, stream, data])
+
+    def push(self, kind: str, data: Any):
+
+        # Server-initiated frames never wait. When the queue is full they are
+        # dropped and the client is told to refetch the sidebar instead.
+        if self.closed:
+            return
+        if kind == "v":
+            if data == self.version:
+                return
+            self.version = data
+        try:
+            self.queue.put_nowait([kind, None, data])
+        except asyncio.QueueFull:
+            self.resync = True
+
+    async def run_sender(self):
+
+        pending = None
+        try:
+            while True:
+                frame = pending or await self.queue.get()
+                pending = None
+                if frame[0] == "t":
+                    while not self.queue.empty():
+                        following = self.queue.get_nowait()
+                        if following[0] != "t" or following[1] != frame[1]:
+                            pending = following
+                            break
+                        frame[2] += following[2]
+                await self.websocket.send_text(dumps_str(frame))
+                if self.resync and pending is None and self.queue.empty():
+                    self.resync = False
+                    await self.websocket.send_text(dumps_str(["v", None, None]))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The client is gone; the receive loop sees the disconnect and cleans up.
+            self.close()
+
+    def close(self):
+
+        # Releases generations blocked on a full queue; later sends are no-ops.
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+class PushHub:
+
+    # Open channels of this worker by user. Writes made by other workers reach
+    # a channel through its periodic ChatVersions poll instead.
+
+    def __init__(self):
+
+        self.channels: Dict[int, Set[PushChannel]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, channel: PushChannel):
+
+        self.loop = asyncio.get_running_loop()
+        self.channels.setdefault(channel.user_id, set()).add(channel)
+
+    def unregister(self, channel: PushChannel):
+
+        channels = self.channels.get(channel.user_id)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self.channels[channel.user_id]
+
+    def publish(self, user_id: int, kind: str, data: Any):
+
+        if user_id not in self.channels:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not self.loop:
+            # Called from a worker thread (write-behind, imports).
+            try:
+                self.loop.call_soon_threadsafe(self.publish, user_id, kind, data)
+            except RuntimeError:
+                pass
+            return
+        for channel in list(self.channels.get(user_id, ())):
+            channel.push(kind, data)
+
+    def stats(self) -> dict:
+
+        return {
+            "users": len(self.channels),
+            "connections": sum(len(channels) for channels in self.channels.values())
+        }
+
+push_hub = PushHub()
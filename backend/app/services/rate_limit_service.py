@@ -0,0 +1,104 @@
+import math
+from typing import Dict
+from fastapi import HTTPException, status
+from app.core.config import settings
+from app.core.state import state_store, get_json, set_json
+from app.db.models import User
+
+def default_limits() -> Dict:
+
+    user = {
+        "requests_per_minute": settings.RATE_LIMIT_REQUESTS_PER_MINUTE,
+        "request_burst": settings.RATE_LIMIT_REQUEST_BURST,
+        "tokens_per_hour": settings.RATE_LIMIT_TOKENS_PER_HOUR,
+        "token_burst": settings.RATE_LIMIT_TOKEN_BURST
+    }
+    multiplier = settings.ADMIN_RATE_LIMIT_MULTIPLIER
+    admin = {name: value * multiplier if value else value for name, value in user.items()}
+    return {"roles": {"user": user, "admin": admin}, "users": {}}
+
+class RateLimiter:
+
+    # Two token buckets per user, kept in the shared state store so every
+    # worker sees the same balance: one refills with requests, the other with
+    # generated tokens. Generation is charged after the fact, so the token
+    # bucket may go into bounded debt and block the next request until repaid.
+
+    def get_config(self) -> Dict:
+
+        return get_json(state_store, "ratelimit:config") or default_limits()
+
+    def set_config(self, config: Dict):
+
+        set_json(state_store, "ratelimit:config", config)
+
+    def reset_config(self):
+
+        state_store.delete("ratelimit:config")
+
+    def limits_for(self, user_id: int, is_admin: bool) -> Dict:
+
+        config = self.get_config()
+        role = "admin" if is_admin else "user"
+        limits = dict(default_limits()["roles"][role])
+        limits.update(config.get("roles", {}).get(role, {}))
+        limits.update(config.get("users", {}).get(str(user_id), {}))
+        return limits
+
+    def check(self, user: User) -> Dict[str, str]:
+
+        if not settings.RATE_LIMIT_ENABLED:
+            return {}
+
+        limits = self.limits_for(user.id, user.is_admin)
+        headers = {}
+        retry_after = None
+
+        if limits["tokens_per_hour"] and limits["token_burst"]:
+            rate = limits["tokens_per_hour"] / 3600.0
+            allowed, remaining = state_store.take_tokens(
+                f"ratelimit:tokens:{user.id}", limits["token_burst"], rate, 0
+            )
+            headers["X-RateLimit-Tokens-Limit"] = str(int(limits["token_burst"]))
+            headers["X-RateLimit-Tokens-Remaining"] = str(max(0, math.floor(remaining)))
+            if not allowed:
+                # Wait until the debt is repaid and at least one token is back.
+                retry_after = (1 - remaining) / rate
+
+        # A request rejected for tokens does not also spend a request.
+        if retry_after is None and limits["requests_per_minute"] and limits["request_burst"]:
+            rate = limits["requests_per_minute"] / 60.0
+            allowed, remaining = state_store.take_tokens(
+                f"ratelimit:requests:{user.id}", limits["request_burst"], rate, 1
+            )
+            headers["X-RateLimit-Limit"] = str(int(limits["request_burst"]))
+            headers["X-RateLimit-Remaining"] = str(max(0, math.floor(remaining)))
+            headers["X-RateLimit-Reset"] = str(math.ceil((limits["request_burst"] - remaining) / rate))
+            if not allowed:
+                retry_after = (1 - remaining) / rate
+
+        if retry_after is not None:
+            headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers=headers
+            )
+        return headers
+
+    def charge(self, user_id: int, is_admin: bool, completion_tokens: int):
+
+        if not settings.RATE_LIMIT_ENABLED or not completion_tokens:
+            return
+
+        limits = self.limits_for(user_id, is_admin)
+        if limits["tokens_per_hour"] and limits["token_burst"]:
+            state_store.take_tokens(
+                f"ratelimit:tokens:{user_id}",
+                limits["token_burst"],
+                limits["tokens_per_hour"] / 3600.0,
+                completion_tokens,
+                force=True
+            )
+
+rate_limiter = RateLimiter()
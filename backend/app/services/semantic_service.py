@@ -0,0 +1,407 @@
+import asyncio
+import heapq
+import json
+import math
+import os
+import re
+import shutil
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+from app.core.compression import decode_content
+from app.core.config import settings
+from app.core.state import state_store, process_id
+from app.db.database import SessionLocal
+from app.db.models import User, ChatSession, ChatMessage
+from app.services.archive_service import ArchiveService
+from app.services.degrade_service import degrade_controller
+from app.services.inference_service import inference_service
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EMBEDDED_ROLES = ("user", "assistant")
+SNIPPET_CHARS = 200
+WORD = re.compile(r"\w+")
+
+def _unit_rows(vectors: List[List[float]]) -> bytes:
+
+    if numpy is not None:
+        matrix = numpy.asarray(vectors, dtype=numpy.float32)
+        norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(numpy.float32).tobytes()
+    rows = array("f")
+    for vector in vectors:
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        rows.extend(x / norm for x in vector)
+    return rows.tobytes()
+
+def keyword_score(terms: set, text: str) -> float:
+
+    # Share of the query's words that occur in the text.
+    if not terms:
+        return 0.0
+    return len(terms & set(WORD.findall(text.lower()))) / len(terms)
+
+class VectorIndex:
+
+    # One directory per user under EMBEDDING_INDEX_DIR:
+    #   vectors.f32  unit-length float32 rows, dim from meta.json
+    #   rows.i64     (message_id, session_id) per row
+    #   live.u8      1 per row, flipped to 0 when the row is tombstoned
+    # Rows are only appended, by the indexer behind a cluster-wide lock, and
+    # live.u8 is written last, so its size is the number of complete rows and
+    # readers need no lock. Tombstones are set in place.
+
+    def __init__(self, root: str):
+
+        self.root = root
+
+    def path(self, user_id: int, name: str) -> str:
+
+        return os.path.join(self.root, f"user-{user_id}", name)
+
+    def meta(self, user_id: int) -> Optional[dict]:
+
+        try:
+            with open(self.path(user_id, "meta.json")) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    def count(self, user_id: int) -> int:
+
+        try:
+            return os.path.getsize(self.path(user_id, "live.u8"))
+        except FileNotFoundError:
+            return 0
+
+    def _entries(self, user_id: int, count: int) -> array:
+
+        entries = array("q")
+        if count:
+            with open(self.path(user_id, "rows.i64"), "rb") as handle:
+                entries.frombytes(handle.read(count * 16))
+        return entries
+
+    def append(self, user_id: int, entries: List[Tuple[int, int]], vectors: List[List[float]]):
+
+        # Raises ValueError when the vectors do not match the index (another
+        # model or dimension); the caller rebuilds the user's index.
+        dim = len(vectors[0])
+        meta = self.meta(user_id)
+        if meta is None:
+            os.makedirs(os.path.dirname(self.path(user_id, "meta.json")), exist_ok=True)
+            meta = {"dim": dim, "model": settings.EMBEDDING_MODEL}
+            with open(self.path(user_id, "meta.json"), "w") as handle:
+                json.dump(meta, handle)
+        elif meta["dim"] != dim or meta.get("model") != settings.EMBEDDING_MODEL:
+            raise ValueError(f"index of user {user_id} holds {meta['dim']}-d vectors of {meta.get('model')}")
+
+        count = self.count(user_id)
+        # A re-embedded message (restored from the archive, or an id SQLite
+        # handed out again) replaces its older rows.
+        appended = {message_id for message_id, _ in entries}
+        existing = self._entries(user_id, count)
+        stale = [row for row in range(count) if existing[row * 2] in appended]
+
+        flat = array("q")
+        for message_id, session_id in entries:
+            flat.extend((message_id, session_id))
+        # Truncating first drops whatever a crash left after the last complete row.
+        for name, size, data in (
+            ("vectors.f32", count * dim * 4, _unit_rows(vectors)),
+            ("rows.i64", count * 16, flat.tobytes()),
+            ("live.u8", count, b"\x01" * len(entries))
+        ):
+            with open(self.path(user_id, name), "ab") as handle:
+                handle.truncate(size)
+                handle.write(data)
+        self.tombstone(user_id, stale)
+
+    def tombstone(self, user_id: int, rows: List[int]):
+
+        if not rows:
+            return
+        try:
+            with open(self.path(user_id, "live.u8"), "r+b") as handle:
+                for row in rows:
+                    handle.seek(row)
+                    handle.write(b"\x00")
+        except FileNotFoundError:
+            pass
+
+    def search(self, user_id: int, query: List[float], limit: int) -> List[Tuple[float, int, int, int]]:
+
+        # Top rows by cosine similarity as (score, row, message_id, session_id).
+        meta = self.meta(user_id)
+        count = self.count(user_id)
+        if meta is None or not count or meta["dim"] != len(query):
+            return []
+        dim = meta["dim"]
+        unit = array("f")
+        unit.frombytes(_unit_rows([query]))
+
+        if numpy is not None:
+            vectors = numpy.memmap(self.path(user_id, "vectors.f32"), dtype=numpy.float32, mode="r", shape=(count, dim))
+            live = numpy.fromfile(self.path(user_id, "live.u8"), dtype=numpy.uint8, count=count)
+            scores = vectors @ numpy.frombuffer(unit, dtype=numpy.float32)
+            scores[live == 0] = -numpy.inf
+            k = min(limit, count)
+            top = numpy.argpartition(-scores, k - 1)[:k]
+            top = top[numpy.argsort(-scores[top])]
+            best = [(float(scores[row]), int(row)) for row in top if live[row]]
+        else:
+            vectors = array("f")
+            with open(self.path(user_id, "vectors.f32"), "rb") as handle:
+                vectors.frombytes(handle.read(count * dim * 4))
+            with open(self.path(user_id, "live.u8"), "rb") as handle:
+                live = handle.read(count)
+            best = heapq.nlargest(limit, (
+                (sum(a * b for a, b in zip(unit, vectors[row * dim:(row + 1) * dim])), row)
+                for row in range(count) if live[row]
+            ))
+
+        entries = self._entries(user_id, count)
+        return [(score, row, entries[row * 2], entries[row * 2 + 1]) for score, row in best]
+
+    def drop(self, user_id: int):
+
+        shutil.rmtree(os.path.join(self.root, f"user-{user_id}"), ignore_errors=True)
+
+    def stats(self) -> dict:
+
+        users = rows = live = disk_bytes = 0
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if not name.startswith("user-"):
+                    continue
+                users += 1
+                for file_name in os.listdir(os.path.join(self.root, name)):
+                    disk_bytes += os.path.getsize(os.path.join(self.root, name, file_name))
+                try:
+                    with open(os.path.join(self.root, name, "live.u8"), "rb") as handle:
+                        flags = handle.read()
+                except FileNotFoundError:
+                    continue
+                rows += len(flags)
+                live += flags.count(1)
+        return {"users": users, "rows": rows, "live_rows": live, "disk_bytes": disk_bytes}
+
+class SemanticService:
+
+    index = VectorIndex(settings.EMBEDDING_INDEX_DIR)
+
+    @staticmethod
+    async def search(db: Session, user: User, query: str, k: int = 10, keyword_weight: float = 0.0) -> List[dict]:
+
+        # Raises RuntimeError when the query cannot be embedded.
+        query_vector = (await inference_service.embed_async([query[:settings.EMBEDDING_MAX_CHARS]]))[0]
+        hits = SemanticService.index.search(user.id, query_vector, settings.SEMANTIC_CANDIDATES)
+        if not hits:
+            return []
+
+        # The index is never updated when messages are deleted: every hit is
+        # checked against the user's rows here and dead ones are tombstoned.
+        texts = {
+            message_id: (session_id, decode_content(content, blob, dict_id))
+            for message_id, session_id, content, blob, dict_id in db.query(
+                ChatMessage.id, ChatMessage.session_id, ChatMessage._content,
+                ChatMessage.content_zstd, ChatMessage.content_dict
+            ).join(ChatSession, ChatMessage.session_id == ChatSession.id).filter(
+                ChatSession.user_id == user.id,
+                ChatMessage.id.in_({hit[2] for hit in hits})
+            ).all()
+        }
+        sessions = {
+            session.id: session
+            for session in db.query(ChatSession).filter(
+                ChatSession.user_id == user.id,
+                ChatSession.id.in_({hit[3] for hit in hits})
+            ).all()
+        }
+
+        terms = set(WORD.findall(query.lower()))
+        archived: Dict[int, Dict[int, str]] = {}
+        results: Dict[int, dict] = {}
+        stale = []
+        for score, row, message_id, session_id in hits:
+            session = sessions.get(session_id)
+            found = texts.get(message_id)
+            text = found[1] if found and found[0] == session_id else None
+            if text is None and session is not None and session.archived_at is not None:
+                # Archived sessions keep their vectors; the text comes from the segment.
+                if session_id not in archived:
+                    archived[session_id] = {
+                        message[0]: message[3] for message in ArchiveService.read_messages(db, session_id)
+                    }
+                text = archived[session_id].get(message_id)
+            if text is None:
+                stale.append(row)
+                continue
+            if keyword_weight:
+                score = (1 - keyword_weight) * score + keyword_weight * keyword_score(terms, text)
+            best = results.get(session_id)
+            if best is None or score > best["score"]:
+                results[session_id] = {
+                    "id": session.id,
+                    "title": session.title,
+                    "created_at": session.created_at,
+                    "updated_at": session.updated_at,
+                    "message_id": message_id,
+                    "snippet": " ".join(text.split())[:SNIPPET_CHARS],
+                    "score": round(score, 4)
+                }
+        SemanticService.index.tombstone(user.id, stale)
+        return sorted(results.values(), key=lambda result: result["score"], reverse=True)[:k]
+
+    @staticmethod
+    def stats(db: Session) -> dict:
+
+        pending = db.query(func.count(ChatMessage.id)).filter(ChatMessage.embedded_at.is_(None)).scalar()
+        return {
+            "enabled": settings.SEMANTIC_SEARCH_ENABLED,
+            "numpy": numpy is not None,
+            "pending_messages": pending,
+            "last_error": embedding_indexer.last_error,
+            **SemanticService.index.stats()
+        }
+
+class EmbeddingIndexer:
+
+    # Embeds new messages in the background, a batch at a time, whenever
+    # llama-server has nothing interactive to do.
+
+    def __init__(self):
+
+        self.task: Optional[asyncio.Task] = None
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+
+        if settings.SEMANTIC_SEARCH_ENABLED and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def _run(self):
+
+        while True:
+            delay = settings.EMBEDDING_POLL_SECONDS
+            if state_store.acquire_lock("embedding_index", process_id(), ttl=600):
+                try:
+                    if await self.run_once():
+                        delay = 0
+                    self.failures, self.last_error = 0, None
+                except asyncio.CancelledError:
+                    raise
+                except RuntimeError as e:
+                    # Embedding server missing or down: back off, say so once.
+                    if not self.failures:
+                        print(f"⚠ Embedding paused: {e}")
+                    self.failures += 1
+                    self.last_error = str(e)
+                    delay = min(settings.EMBEDDING_POLL_SECONDS * 2 ** self.failures, 600)
+                except Exception as e:
+                    print(f"Embedding index error: {e}")
+                finally:
+                    state_store.release_lock("embedding_index", process_id())
+            await asyncio.sleep(delay)
+
+    async def run_once(self) -> int:
+
+        batch = await asyncio.to_thread(self._pending)
+        if not batch:
+            return 0
+        embed = [entry for entry in batch if entry[3]]
+        vectors = []
+        if embed:
+            # Same rule as summaries: interactive requests and load shedding come first.
+            while inference_service.active_requests > 0 or not degrade_controller.allows_background():
+                state_store.acquire_lock("embedding_index", process_id(), ttl=600)
+                await asyncio.sleep(settings.SUMMARY_IDLE_POLL_SECONDS)
+            vectors = await inference_service.embed_async([entry[3] for entry in embed])
+        await asyncio.to_thread(self._store, [entry[0] for entry in batch], embed, vectors)
+        return len(batch)
+
+    def _pending(self) -> List[Tuple[int, int, int, str]]:
+
+        # (message_id, session_id, user_id, text); newest first, so recent
+        # conversations become searchable before the backlog. System prompts
+        # and empty bodies get an empty text and are only marked as done.
+        db = SessionLocal()
+        try:
+            rows = db.query(ChatMessage, ChatSession.user_id).join(
+                ChatSession, ChatMessage.session_id == ChatSession.id
+            ).filter(
+                ChatMessage.embedded_at.is_(None)
+            ).order_by(ChatMessage.id.desc()).limit(settings.EMBEDDING_BATCH_SIZE).all()
+            return [
+                (
+                    message.id,
+                    message.session_id,
+                    user_id,
+                    message.content.strip()[:settings.EMBEDDING_MAX_CHARS] if message.role in EMBEDDED_ROLES else ""
+                )
+                for message, user_id in rows
+            ]
+        finally:
+            db.close()
+
+    def _store(self, message_ids: List[int], embedded: List[Tuple[int, int, int, str]], vectors: List[List[float]]):
+
+        by_user: Dict[int, list] = {}
+        for (message_id, session_id, user_id, _), vector in zip(embedded, vectors):
+            by_user.setdefault(user_id, []).append(((message_id, session_id), vector))
+
+        db = SessionLocal()
+        try:
+            # Accounts deleted after the batch was read are being purged; their
+            # index directory must not be recreated after the purger drops it.
+            live = {row[0] for row in db.query(User.id).filter(
+                User.id.in_(list(by_user)),
+                User.deleted_at.is_(None)
+            ).all()}
+            for user_id, items in by_user.items():
+                if user_id not in live:
+                    continue
+                entries = [item[0] for item in items]
+                try:
+                    SemanticService.index.append(user_id, entries, [item[1] for item in items])
+                except ValueError as e:
+                    # The embedding model changed: start this user's index over.
+                    print(f"⚠ Rebuilding vector index: {e}")
+                    SemanticService.index.drop(user_id)
+                    db.execute(update(ChatMessage).where(
+                        ChatMessage.session_id.in_(select(ChatSession.id).where(ChatSession.user_id == user_id))
+                    ).values(embedded_at=None))
+                    db.commit()
+                    SemanticService.index.append(user_id, entries, [item[1] for item in items])
+
+            # Messages deleted meanwhile simply match nothing here.
+            table = ChatMessage.__table__
+            now = datetime.utcnow()
+            db.execute(
+                table.update().where(table.c.id == bindparam("row_id")).values(embedded_at=now),
+                [{"row_id": message_id} for message_id in message_ids]
+            )
+            db.commit()
+        finally:
+            db.close()
+
+embedding_indexer = EmbeddingIndexer()
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Optional, Set
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.state import state_store, process_id
+from app.db.database import SessionLocal
+from app.db.models import ChatSession
+from app.services.chat_service import ChatService
+from app.services.inference_service import inference_service
+from app.services.degrade_service import degrade_controller
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an AI assistant.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Rewrite the summary so it also covers the new messages. Keep names, facts, decisions, code identifiers and open questions. Reply with the summary only, at most {max_words} words."""
+
+class SummaryService:
+
+    def __init__(self):
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.pending: Set[int] = set()
+        self.worker: Optional[asyncio.Task] = None
+
+    def start(self):
+
+        if not settings.SUMMARY_ENABLED or self.worker is not None:
+            return
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+        self.pending.clear()
+
+    def maybe_schedule(self, db: Session, session_id: int) -> bool:
+
+        if self.queue is None or session_id in self.pending:
+            return False
+
+        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        if not session:
+            return False
+        if ChatService.count_unsummarized_tokens(db, session) < settings.SUMMARY_TRIGGER_TOKENS:
+            return False
+
+        self.pending.add(session_id)
+        self.queue.put_nowait(session_id)
+        return True
+
+    async def _run(self):
+
+        while True:
+            session_id = await self.queue.get()
+            try:
+                # Summaries are best-effort: yield the backend that serves them
+                # (main, or a small model when routed there) to interactive requests first.
+                # Under load shedding they wait until the backend is back to normal.
+                while inference_service.route("summary")[0].active_requests > 0 or not degrade_controller.allows_background():
+                    await asyncio.sleep(settings.SUMMARY_IDLE_POLL_SECONDS)
+                # Another worker may have queued the same session; only one summarizes it.
+                lock_name = f"summary:{session_id}"
+                if state_store.acquire_lock(lock_name, process_id(), ttl=300):
+                    try:
+                        await self.summarize_session(session_id)
+                    finally:
+                        state_store.release_lock(lock_name, process_id())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error summarizing session {session_id}: {e}")
+            finally:
+                self.pending.discard(session_id)
+
+    async def summarize_session(self, session_id: int) -> Optional[str]:
+
+        db = SessionLocal()
+        try:
+            session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+            if not session:
+                return None
+
+            messages, summary_on_path = ChatService.get_unsummarized_messages(db, session)
+            current = session.summary if summary_on_path else None
+            # The most recent turns stay verbatim in the prompt; only fold in older ones.
+            to_fold = messages[:-settings.SUMMARY_KEEP_MESSAGES] if settings.SUMMARY_KEEP_MESSAGES else messages
+            if not to_fold:
+                return current
+
+            transcript = "\n\n".join(f"{msg.role.upper()}: {msg.content}" for msg in to_fold)
+            prompt = SUMMARY_PROMPT.format(
+                summary=current or "(none yet)",
+                transcript=transcript,
+                max_words=settings.SUMMARY_MAX_TOKENS * 3 // 4
+            )
+
+            summary = await inference_service.generate_response_async(
+                prompt=prompt,
+                max_tokens=settings.SUMMARY_MAX_TOKENS,
+                temperature=0.2,
+                task="summary"
+            )
+            if not summary:
+                return current
+
+            ChatService.update_session_summary(db, session_id, summary, to_fold[-1].id)
+            print(f"✓ Summarized {len(to_fold)} messages for session {session_id}")
+            return summary
+        finally:
+            db.close()
+
+summary_service = SummaryService()
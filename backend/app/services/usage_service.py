@@ -0,0 +1,295 @@
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.state import state_store, process_id
+from app.db.database import SessionLocal, engine
+from app.db.models import User, ChatSession, ChatMessage, InferenceMetric, UsageRollup, UsageCounter
+
+PERIODS = ("hour", "day")
+ROLLUP_FIELDS = ("messages", "sessions", "requests", "prompt_tokens", "completion_tokens")
+COUNTERS = ("users", "active_users", "admin_users", "sessions", "messages")
+
+def _insert(table):
+
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+def hour_bucket(column):
+
+    if engine.dialect.name == "postgresql":
+        return func.to_char(func.date_trunc("hour", column), "YYYY-MM-DD HH24:00")
+    return func.strftime("%Y-%m-%d %H:00", column)
+
+def bucket_start(period: str, at: datetime) -> datetime:
+
+    if period == "day":
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return at.replace(minute=0, second=0, microsecond=0)
+
+class UsageService:
+
+    # Write-path hooks: they add to the current transaction and are committed
+    # by the caller together with the change they describe.
+
+    @staticmethod
+    def defer(db: Session):
+
+        # Inside a group commit many writes hit the same few rollup rows and
+        # counters. While deferred, their deltas are summed in memory and
+        # flush_deferred applies each row once before the commit. Calling this
+        # again discards whatever was collected (after a rollback).
+        db.info["usage_deferred"] = {
+            "rollups": defaultdict(lambda: defaultdict(int)),
+            "counters": defaultdict(int)
+        }
+
+    @staticmethod
+    def flush_deferred(db: Session):
+
+        deferred = db.info.get("usage_deferred")
+        if not deferred:
+            return
+        rollups, counters = deferred["rollups"], deferred["counters"]
+        UsageService.defer(db)
+
+        totals = defaultdict(lambda: defaultdict(int))
+        for (period, bucket, user_id), deltas in rollups.items():
+            first_activity = UsageService._add_to_rollup(db, period, bucket, user_id, dict(deltas))
+            for name, delta in deltas.items():
+                totals[(period, bucket)][name] += delta
+            if first_activity:
+                totals[(period, bucket)]["active_users"] += 1
+        for (period, bucket), deltas in totals.items():
+            UsageService._add_to_rollup(db, period, bucket, 0, dict(deltas))
+        UsageService._bump(db, counters)
+
+    @staticmethod
+    def bump_counters(db: Session, **deltas: int):
+
+        deferred = db.info.get("usage_deferred")
+        if deferred is not None:
+            for name, delta in deltas.items():
+                deferred["counters"][name] += delta
+            return
+        UsageService._bump(db, deltas)
+
+    @staticmethod
+    def _bump(db: Session, deltas: Dict[str, int]):
+
+        for name, delta in deltas.items():
+            if not delta:
+                continue
+            stmt = _insert(UsageCounter.__table__).values(name=name, value=delta)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"value": UsageCounter.__table__.c.value + delta}
+            ))
+
+    @staticmethod
+    def _add_to_rollup(db: Session, period: str, bucket: datetime, user_id: int, deltas: Dict[str, int]) -> bool:
+
+        # Returns True when this call created the row, i.e. the first activity
+        # of this user in this bucket.
+        table = UsageRollup.__table__
+        where = (table.c.period == period) & (table.c.user_id == user_id) & (table.c.bucket == bucket)
+        increment = update(table).where(where).values({
+            name: table.c[name] + delta for name, delta in deltas.items()
+        })
+        if deltas and db.execute(increment).rowcount:
+            return False
+        inserted = db.execute(
+            _insert(table).values(period=period, bucket=bucket, user_id=user_id, **deltas).on_conflict_do_nothing()
+        ).rowcount
+        if inserted:
+            return True
+        if deltas:
+            db.execute(increment)
+        return False
+
+    @staticmethod
+    def record_usage(db: Session, user_id: int, at: Optional[datetime] = None, **deltas: int):
+
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        at = at or datetime.utcnow()
+        deferred = db.info.get("usage_deferred")
+        for period in PERIODS:
+            bucket = bucket_start(period, at)
+            if deferred is not None:
+                for name, delta in deltas.items():
+                    deferred["rollups"][(period, bucket, user_id)][name] += delta
+                continue
+            first_activity = UsageService._add_to_rollup(db, period, bucket, user_id, deltas)
+            global_deltas = dict(deltas, active_users=1) if first_activity else deltas
+            UsageService._add_to_rollup(db, period, bucket, 0, global_deltas)
+
+    @staticmethod
+    def get_counters(db: Session) -> Dict[str, int]:
+
+        values = dict(db.query(UsageCounter.name, UsageCounter.value).filter(UsageCounter.name.in_(COUNTERS)).all())
+        return {name: values.get(name, 0) for name in COUNTERS}
+
+    @staticmethod
+    def get_timeseries(db: Session, period: str, buckets: int, user_id: int = 0) -> List[Dict]:
+
+        step = timedelta(days=1) if period == "day" else timedelta(hours=1)
+        end = bucket_start(period, datetime.utcnow())
+        start = end - step * (buckets - 1)
+        rows = {
+            row.bucket: row
+            for row in db.query(UsageRollup).filter(
+                UsageRollup.period == period,
+                UsageRollup.user_id == user_id,
+                UsageRollup.bucket >= start
+            ).all()
+        }
+
+        series = []
+        for i in range(buckets):
+            bucket = start + step * i
+            row = rows.get(bucket)
+            point = {"bucket": bucket}
+            for name in ROLLUP_FIELDS:
+                point[name] = getattr(row, name) if row else 0
+            if user_id == 0:
+                point["active_users"] = row.active_users if row else 0
+            series.append(point)
+        return series
+
+    @staticmethod
+    def reconcile_counters(db: Session) -> Dict[str, int]:
+
+        # Full recount, run off the request path, to repair any drift from write
+        # paths that bypass the hooks (manual SQL, crashes between statements).
+        # Tombstoned accounts stop counting as users at once; their sessions and
+        # messages count until the purger removes them.
+        users = db.query(func.count(User.id)).filter(User.deleted_at.is_(None))
+        counts = {
+            "users": users.scalar(),
+            "active_users": users.filter(User.is_active == True).scalar(),
+            "admin_users": users.filter(User.is_admin == True).scalar(),
+            "sessions": db.query(func.count(ChatSession.id)).scalar(),
+            "messages": db.query(func.count(ChatMessage.id)).scalar()
+            + db.query(func.coalesce(func.sum(ChatSession.archived_messages), 0)).scalar()
+        }
+        for name, value in counts.items():
+            stmt = _insert(UsageCounter.__table__).values(name=name, value=value)
+            db.execute(stmt.on_conflict_do_update(index_elements=["name"], set_={"value": value}))
+        db.commit()
+        return counts
+
+    @staticmethod
+    def backfill_rollups(db: Session) -> int:
+
+        # One-off: fold history recorded before rollups existed into them. The
+        # marker row makes exactly one worker do it, and the cutoff keeps it from
+        # counting events the write hooks have already recorded.
+        cutoff = datetime.utcnow()
+        claimed = db.execute(
+            _insert(UsageCounter.__table__).values(name="rollups_backfilled", value=int(cutoff.timestamp())).on_conflict_do_nothing()
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return 0
+
+        hourly = defaultdict(lambda: defaultdict(int))
+        message_hour = hour_bucket(ChatMessage.created_at)
+        for user_id, hour, count in db.query(ChatSession.user_id, message_hour, func.count(ChatMessage.id)).join(
+            ChatSession, ChatSession.id == ChatMessage.session_id
+        ).filter(ChatMessage.created_at < cutoff).group_by(ChatSession.user_id, message_hour).all():
+            hourly[(user_id, hour)]["messages"] += count
+
+        session_hour = hour_bucket(ChatSession.created_at)
+        for user_id, hour, count in db.query(ChatSession.user_id, session_hour, func.count(ChatSession.id)).filter(
+            ChatSession.created_at < cutoff
+        ).group_by(ChatSession.user_id, session_hour).all():
+            hourly[(user_id, hour)]["sessions"] += count
+
+        metric_hour = hour_bucket(InferenceMetric.created_at)
+        for user_id, hour, requests, prompt_tokens, completion_tokens in db.query(
+            InferenceMetric.user_id,
+            metric_hour,
+            func.count(InferenceMetric.id),
+            func.coalesce(func.sum(InferenceMetric.prompt_tokens), 0),
+            func.coalesce(func.sum(InferenceMetric.completion_tokens), 0)
+        ).filter(
+            InferenceMetric.created_at < cutoff,
+            InferenceMetric.user_id.isnot(None)
+        ).group_by(InferenceMetric.user_id, metric_hour).all():
+            hourly[(user_id, hour)].update(requests=requests, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+        try:
+            for (user_id, hour), deltas in hourly.items():
+                UsageService.record_usage(db, user_id, at=datetime.strptime(hour, "%Y-%m-%d %H:00"), **deltas)
+            db.commit()
+        except Exception:
+            # Release the claim so the next run retries.
+            db.rollback()
+            db.query(UsageCounter).filter(UsageCounter.name == "rollups_backfilled").delete()
+            db.commit()
+            raise
+        return len(hourly)
+
+class UsageAggregator:
+
+    def __init__(self):
+
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def _run(self):
+
+        while True:
+            last = state_store.get("usage:reconciled_at")
+            due = last is None or time.time() - float(last) >= settings.USAGE_RECONCILE_SECONDS
+            if due and state_store.acquire_lock("usage_reconcile", process_id(), ttl=600):
+                try:
+                    # Full scans; keep them off the event loop.
+                    await asyncio.to_thread(self.reconcile)
+                    state_store.set("usage:reconciled_at", str(time.time()))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Usage reconcile error: {e}")
+                finally:
+                    state_store.release_lock("usage_reconcile", process_id())
+            await asyncio.sleep(60)
+
+    def reconcile(self):
+
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            buckets = UsageService.backfill_rollups(db)
+            counts = UsageService.reconcile_counters(db)
+        finally:
+            db.close()
+        if buckets:
+            print(f"✓ Backfilled usage rollups for {buckets} user-hours")
+        print(f"✓ Usage counters reconciled in {time.perf_counter() - started:.2f}s: {counts}")
+
+usage_aggregator = UsageAggregator()
@@ -0,0 +1,195 @@
+"""Database size and read/write latency of message bodies, plain vs zstd.
+
+Writes the same synthetic chat corpus (prompts, markdown answers with code
+blocks, some of them long) into a scratch SQLite database three ways:
+"plain" text, "zstd" without a dictionary, and "zstd+dict" with a dictionary
+trained by app.services.compression_service on a separate sample of the same
+corpus. Reports the database size, the write latency per message (insert and
+commit in batches like the write path) and the read latency of loading a
+session's conversation and touching every body, which is when compressed
+bodies are decoded. Needs zstandard. Run from the backend directory:
+
+    python -m benchmarks.compression --sessions 400 --turns 10
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+TOPICS = ["SQLite", "FastAPI", "React", "asyncio", "Docker", "pandas", "regular expressions", "git", "TypeScript", "NumPy"]
+PROMPTS = [
+    "How do I {verb} with {topic}?",
+    "Why does my {topic} code {problem}?",
+    "Can you explain {topic} to me like I'm new to it?",
+    "Write a function that {task} using {topic}.",
+    "What is the difference between {a} and {b} in {topic}?"
+]
+VERBS = ["paginate results", "handle errors", "write tests", "profile a slow path", "deploy", "configure logging"]
+PROBLEMS = ["hang after a while", "use so much memory", "raise a KeyError", "return stale data", "get slower over time"]
+TASKS = ["parses a CSV file", "retries a request", "deduplicates records", "groups items by date", "streams a large file"]
+
+def make_prompt(rng: random.Random) -> str:
+
+    return rng.choice(PROMPTS).format(
+        verb=rng.choice(VERBS), topic=rng.choice(TOPICS), problem=rng.choice(PROBLEMS),
+        task=rng.choice(TASKS), a=rng.choice(VERBS), b=rng.choice(TASKS)
+    )
+
+def make_answer(rng: random.Random, prompt: str) -> str:
+
+    topic = rng.choice(TOPICS)
+    parts = [f"Good question. Here is how to approach it in {topic}.", ""]
+    for step in range(rng.randint(2, 6)):
+        parts.append(f"{step + 1}. **{rng.choice(VERBS).capitalize()}**: {rng.choice(TASKS)} and check that it does not {rng.choice(PROBLEMS)}.")
+    for _ in range(rng.randint(0, 3)):
+        name = rng.choice(["load", "process", "fetch", "handle", "parse"]) + "_" + rng.choice(["items", "rows", "data", "batch"])
+        parts += [
+            "",
+            "```python",
+            f"def {name}(path, limit={rng.randint(10, 1000)}):",
+            "    results = []",
+            "    with open(path) as handle:",
+            "        for line in handle:",
+            "            if not line.strip():",
+            "                continue",
+            f"            results.append(line.split(',')[{rng.randint(0, 5)}])",
+            "            if len(results) >= limit:",
+            "                break",
+            "    return results",
+            "```"
+        ]
+    parts += ["", f"Let me know if you want me to go deeper into {topic} or {rng.choice(TOPICS)}."]
+    return "\n".join(parts)
+
+def corpus(seed: int, sessions: int, turns: int):
+
+    rng = random.Random(seed)
+    for _ in range(sessions):
+        conversation = []
+        for _ in range(turns):
+            prompt = make_prompt(rng)
+            conversation += [("user", prompt), ("assistant", make_answer(rng, prompt))]
+        yield conversation
+
+def configure(path: str, mode: str, min_bytes: int):
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["MESSAGE_COMPRESSION_ENABLED"] = "false" if mode == "plain" else "true"
+    os.environ["MESSAGE_COMPRESSION_MIN_BYTES"] = str(min_bytes)
+
+def database_size(path: str) -> int:
+
+    from app.db.database import engine
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(path)
+
+def run(mode: str, path: str, sessions: int, turns: int):
+
+    from app.core.compression import message_codec
+    from app.db.database import SessionLocal, init_db
+    from app.db.models import User, ChatSession, ChatMessage
+    from app.services.chat_service import ChatService
+    from app.services.compression_service import CompressionService
+
+    init_db()
+    db = SessionLocal()
+    user = User(username="bench", email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    if mode == "zstd+dict":
+        # Train on a different sample than the one measured.
+        for conversation in corpus(1, 200, turns):
+            session = ChatSession(user_id=user.id)
+            db.add(session)
+            db.flush()
+            db.add_all([ChatMessage(session_id=session.id, role=role, content=content) for role, content in conversation])
+        db.commit()
+        CompressionService.train_dictionary(db)
+        db.execute(ChatMessage.__table__.delete())
+        db.execute(ChatSession.__table__.delete())
+        db.commit()
+        with db.get_bind().connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+
+    # Write path: one turn (user message, then the reply as its child) per commit.
+    session_ids = []
+    written, write_seconds, body_bytes = 0, 0.0, 0
+    for conversation in corpus(0, sessions, turns):
+        session = ChatSession(user_id=user.id)
+        db.add(session)
+        db.commit()
+        session_ids.append(session.id)
+        parent_id = None
+        for i in range(0, len(conversation), 2):
+            started = time.perf_counter()
+            for role, content in conversation[i:i + 2]:
+                message = ChatMessage(session_id=session.id, role=role, content=content, parent_id=parent_id)
+                db.add(message)
+                db.flush()
+                parent_id = message.id
+                body_bytes += len(content.encode("utf-8"))
+            session.active_message_id = parent_id
+            db.commit()
+            write_seconds += time.perf_counter() - started
+            written += 2
+    size = database_size(path)
+    db.close()
+
+    # Read path: a fresh session per conversation, as a request would use.
+    read_seconds, read_chars = 0.0, 0
+    for session_id in session_ids:
+        db = SessionLocal()
+        started = time.perf_counter()
+        session = db.get(ChatSession, session_id)
+        messages = ChatService.get_path_messages(db, session)
+        read_chars += sum(len(message.content) for message in messages)
+        read_seconds += time.perf_counter() - started
+        db.close()
+
+    db = SessionLocal()
+    compressed = db.query(ChatMessage).filter(ChatMessage.content_zstd.isnot(None)).count()
+    db.close()
+
+    print(
+        f"{mode:>10}: db {size / 1024 / 1024:7.2f} MiB ({body_bytes / 1024 / 1024:.2f} MiB of bodies, "
+        f"{compressed}/{written} compressed) | write {write_seconds / written * 1000:.3f} ms/msg | "
+        f"read {read_seconds / len(session_ids) * 1000:.3f} ms/session"
+    )
+    if message_codec.active_id is not None:
+        print(f"{'':>10}  dictionary {message_codec.active_id}, {len(message_codec.dictionaries[message_codec.active_id].as_bytes())} bytes")
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Message body compression benchmark")
+    parser.add_argument("--sessions", type=int, default=400)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--min-bytes", type=int, default=256,
+                        help="MESSAGE_COMPRESSION_MIN_BYTES for the compressed modes")
+    parser.add_argument("--mode", choices=["plain", "zstd", "zstd+dict"], default=None,
+                        help="run one mode (each mode runs in its own process by default)")
+    args = parser.parse_args()
+
+    if args.mode is None:
+        for mode in ("plain", "zstd", "zstd+dict"):
+            subprocess.run([sys.executable, "-m", "benchmarks.compression", "--mode", mode,
+                            "--sessions", str(args.sessions), "--turns", str(args.turns),
+                            "--min-bytes", str(args.min_bytes)], check=True)
+        return
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "bench.db")
+        configure(path, args.mode, args.min_bytes)
+        from app.core.compression import zstandard
+        if zstandard is None and args.mode != "plain":
+            print(f"{args.mode:>10}: skipped, zstandard is not installed")
+            return
+        run(args.mode, path, args.sessions, args.turns)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""Offline load test of the real FastAPI app against a stub llama-server.
+
+Starts the stub llama-server and the backend (on a fresh SQLite database) in
+background threads, seeds users and chat history, then drives registration/login,
+session listing, search, streaming chat and export concurrently. Reports
+p50/p95/p99 latency, time to first token, event-loop lag of the app's loop and
+SQLite write/commit waits. Run from the backend directory:
+
+    python -m benchmarks.load_test --output results.json
+    python -m benchmarks.load_test --baseline results.json   # exits 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+def free_port() -> int:
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentiles(values: list) -> dict:
+
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+
+        index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+        return round(ordered[index], 3)
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": round(ordered[-1], 3),
+        "mean": round(sum(ordered) / len(ordered), 3),
+    }
+
+class LoopLagProbe:
+
+    def __init__(self, interval: float = 0.01):
+
+        self.interval = interval
+        self.samples = []
+        self.running = False
+
+    async def run(self):
+
+        self.running = True
+        loop = asyncio.get_running_loop()
+        while self.running:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected) * 1000.0)
+
+class DBWaitRecorder:
+
+    def __init__(self, engine):
+
+        from sqlalchemy import event
+
+        self.write_ms = []
+        self.commit_ms = []
+        self.lock_errors = 0
+        self.statements = 0
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+
+            conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+
+            started = conn.info["bench_started"].pop()
+            self.statements += 1
+            if not statement.lstrip().upper().startswith("SELECT"):
+                self.write_ms.append((time.perf_counter() - started) * 1000.0)
+
+        @event.listens_for(engine, "handle_error")
+        def on_error(context):
+
+            if "locked" in str(context.original_exception).lower():
+                self.lock_errors += 1
+
+        # SQLite can also block on COMMIT while readers hold a shared lock.
+        dialect = engine.dialect
+        original_commit = dialect.do_commit
+
+        def timed_commit(dbapi_connection):
+
+            started = time.perf_counter()
+            try:
+                original_commit(dbapi_connection)
+            finally:
+                self.commit_ms.append((time.perf_counter() - started) * 1000.0)
+
+        dialect.do_commit = timed_commit
+
+    def report(self) -> dict:
+
+        return {
+            "statements": self.statements,
+            "lock_errors": self.lock_errors,
+            "write_ms": percentiles(self.write_ms),
+            "commit_ms": percentiles(self.commit_ms),
+        }
+
+class ServerThread(threading.Thread):
+
+    def __init__(self, app, port: int, probe: LoopLagProbe = None):
+
+        super().__init__(daemon=True)
+        import uvicorn
+
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+        self.probe = probe
+
+    def run(self):
+
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+
+        if self.probe:
+            asyncio.get_running_loop().create_task(self.probe.run())
+        await self.server.serve()
+        if self.probe:
+            self.probe.running = False
+
+    def wait_started(self, timeout: float = 30.0):
+
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("server did not start")
+            time.sleep(0.05)
+
+    def stop(self):
+
+        self.server.should_exit = True
+        self.join(timeout=10)
+
+def seed_database(users: int, sessions_per_user: int, messages_per_session: int) -> list:
+
+    from app.core.security import get_password_hash
+    from app.db.database import SessionLocal
+    from app.db.models import User, ChatSession, ChatMessage
+
+    db = SessionLocal()
+    password_hash = get_password_hash("benchmark")
+    topics = ["docker networking", "python asyncio", "sql indexes", "rust lifetimes", "kubernetes probes"]
+    try:
+        accounts = []
+        for u in range(users):
+            user = User(username=f"bench{u}", email=f"bench{u}@example.com", hashed_password=password_hash)
+            db.add(user)
+            db.flush()
+            for s in range(sessions_per_user):
+                topic = topics[(u + s) % len(topics)]
+                session = ChatSession(user_id=user.id, title=f"{topic} #{s}")
+                db.add(session)
+                db.flush()
+                db.add_all([
+                    ChatMessage(
+                        session_id=session.id,
+                        role="user" if m % 2 == 0 else "assistant",
+                        content=f"Message {m} about {topic}. " + "lorem ipsum dolor sit amet " * 20
+                    )
+                    for m in range(messages_per_session)
+                ])
+            accounts.append(user.username)
+        db.commit()
+        return accounts
+    finally:
+        db.close()
+
+async def login(client: httpx.AsyncClient, username: str) -> dict:
+
+    response = await client.post("/api/auth/login", json={"username": username, "password": "benchmark"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def scenario_auth(client, ctx, worker: int, i: int) -> dict:
+
+    name = f"load{worker}_{i}_{random.randint(0, 1 << 30)}"
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/auth/register",
+        json={"username": name, "email": f"{name}@example.com", "password": "benchmark"}
+    )
+    response.raise_for_status()
+    response = await client.post("/api/auth/login", json={"username": name, "password": "benchmark"})
+    response.raise_for_status()
+    return {"latency_ms": (time.perf_counter() - started) * 1000.0}
+
+async def scenario_sessions(client, ctx, worker: int, i: int) -> dict:
+
+    started = time.perf_counter()
+    response = await client.get("/api/chat/sessions", headers=ctx["headers"][worker])
+    response.raise_for_status()
+    return {"latency_ms": (time.perf_counter() - started) * 1000.0}
+
+async def scenario_search(client, ctx, worker: int, i: int) -> dict:
+
+    query = random.choice(["docker", "asyncio", "index", "lifetimes", "probes", "nothing-matches"])
+    started = time.perf_counter()
+    response = await client.get("/api/chat/search", params={"q": query}, headers=ctx["headers"][worker])
+    response.raise_for_status()
+    return {"latency_ms": (time.perf_counter() - started) * 1000.0}
+
+async def scenario_export(client, ctx, worker: int, i: int) -> dict:
+
+    headers = ctx["headers"][worker]
+    session_id = random.choice(ctx["session_ids"][worker])
+    started = time.perf_counter()
+    response = await client.get(f"/api/chat/sessions/{session_id}/export", params={"format": "json"}, headers=headers)
+    response.raise_for_status()
+    return {"latency_ms": (time.perf_counter() - started) * 1000.0}
+
+async def scenario_chat(client, ctx, worker: int, i: int) -> dict:
+
+    headers = ctx["headers"][worker]
+    body = {"prompt": f"Benchmark question {i}: explain docker networking briefly.", "max_tokens": ctx["max_tokens"]}
+    if i % 2 == 1:
+        body["session_id"] = random.choice(ctx["session_ids"][worker])
+
+    started = time.perf_counter()
+    ttft = None
+    tokens = 0
+    async with client.stream("POST", "/api/chat/inference/stream", json=body, headers=headers) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event["type"] == "token":
+                tokens += 1
+                if ttft is None:
+                    ttft = (time.perf_counter() - started) * 1000.0
+            elif event["type"] == "error":
+                raise RuntimeError(event["message"])
+            elif event["type"] == "done":
+                break
+    return {"latency_ms": (time.perf_counter() - started) * 1000.0, "ttft_ms": ttft, "tokens": tokens}
+
+SCENARIOS = {
+    "auth": scenario_auth,
+    "sessions": scenario_sessions,
+    "search": scenario_search,
+    "chat": scenario_chat,
+    "export": scenario_export,
+}
+
+async def run_scenario(client, ctx, name: str, concurrency: int, requests: int) -> dict:
+
+    fn = SCENARIOS[name]
+    samples = []
+    errors = []
+    counter = iter(range(requests))
+
+    async def worker(index: int):
+
+        for i in counter:
+            try:
+                samples.append(await fn(client, ctx, index % len(ctx["headers"]), i))
+            except Exception as e:
+                errors.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "requests": len(samples),
+        "errors": len(errors),
+        "concurrency": concurrency,
+        "throughput_rps": round(len(samples) / elapsed, 3) if elapsed else None,
+        "latency_ms": percentiles([s["latency_ms"] for s in samples]),
+    }
+    ttfts = [s["ttft_ms"] for s in samples if s.get("ttft_ms") is not None]
+    if ttfts:
+        result["ttft_ms"] = percentiles(ttfts)
+        total_tokens = sum(s.get("tokens", 0) for s in samples)
+        result["tokens_per_second"] = round(total_tokens / elapsed, 3) if elapsed else None
+    if errors:
+        result["sample_errors"] = errors[:3]
+    return result
+
+async def drive(args, base_url: str, accounts: list) -> dict:
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        headers = [await login(client, username) for username in accounts]
+        session_ids = []
+        for h in headers:
+            response = await client.get("/api/chat/sessions", headers=h)
+            response.raise_for_status()
+            session_ids.append([s["id"] for s in response.json()])
+
+        ctx = {"headers": headers, "session_ids": session_ids, "max_tokens": args.completion_tokens}
+        results = {}
+        for name in args.scenarios:
+            print(f"running {name} ...", file=sys.stderr)
+            count = args.chat_requests if name == "chat" else args.requests
+            if name == "auth":
+                count = args.auth_requests
+            results[name] = await run_scenario(client, ctx, name, args.concurrency, count)
+        return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+
+    failures = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if current["errors"] > previous["errors"]:
+            failures.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+        for metric in ("latency_ms", "ttft_ms"):
+            before = (previous.get(metric) or {}).get("p95")
+            after = (current.get(metric) or {}).get("p95")
+            if before and after and after > before * (1 + tolerance):
+                failures.append(f"{name}: {metric} p95 {before:.1f} -> {after:.1f}")
+        before = previous.get("throughput_rps")
+        after = current.get("throughput_rps")
+        if before and after is not None and after < before * (1 - tolerance):
+            failures.append(f"{name}: throughput {before:.2f} -> {after:.2f} req/s")
+
+    before = (baseline.get("event_loop_lag_ms") or {}).get("p99")
+    after = results["event_loop_lag_ms"]["p99"]
+    if before and after and after > max(before * (1 + tolerance), before + 5.0):
+        failures.append(f"event loop lag p99 {before:.1f} -> {after:.1f} ms")
+    return failures
+
+def print_report(results: dict):
+
+    print(f"{'scenario':<10} {'reqs':>5} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttft p95':>9}")
+    for name, r in results["scenarios"].items():
+        lat = r["latency_ms"]
+        ttft = (r.get("ttft_ms") or {}).get("p95")
+        print(
+            f"{name:<10} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps'] or 0:>8.2f} "
+            f"{lat['p50'] or 0:>9.1f} {lat['p95'] or 0:>9.1f} {lat['p99'] or 0:>9.1f} "
+            f"{ttft if ttft is not None else '-':>9}"
+        )
+    lag = results["event_loop_lag_ms"]
+    print(f"event loop lag ms: p50={lag['p50']} p95={lag['p95']} p99={lag['p99']} max={lag['max']}")
+    db = results["db"]
+    print(
+        f"db: {db['statements']} statements, {db['lock_errors']} lock errors, "
+        f"write p95={db['write_ms']['p95']} ms, commit p95={db['commit_ms']['p95']} ms"
+    )
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Offline load test against a stub llama-server")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per read scenario")
+    parser.add_argument("--auth-requests", type=int, default=20)
+    parser.add_argument("--chat-requests", type=int, default=40)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--sessions-per-user", type=int, default=30)
+    parser.add_argument("--messages-per-session", type=int, default=20)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--completion-tokens", type=int, default=32)
+    parser.add_argument("--parallel", type=int, default=4, help="stub llama-server slots")
+    parser.add_argument("--base-url", default=None, help="benchmark an already running backend instead")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--baseline", default=None, help="fail if results regress against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    random.seed(1234)
+    workdir = tempfile.mkdtemp(prefix="pocketllm-bench-")
+    stub_port = free_port()
+    app_port = free_port()
+
+    # Settings are read at import time, so point the app at the stub and a scratch
+    # database before importing anything from it.
+    if args.base_url is None:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["LLAMA_SERVER_URL"] = f"http://127.0.0.1:{stub_port}"
+        os.environ.setdefault("SUMMARY_ENABLED", "false")
+
+    from benchmarks.stub_llama_server import create_app as create_stub
+
+    stub = ServerThread(
+        create_stub(
+            tokens_per_second=args.tokens_per_second,
+            first_token_latency=args.first_token_latency,
+            completion_tokens=args.completion_tokens,
+            parallel=args.parallel
+        ),
+        stub_port
+    )
+    probe = LoopLagProbe()
+    app_server = None
+    db_recorder = None
+
+    if args.base_url is None:
+        stub.start()
+        stub.wait_started()
+
+        from app.main import app
+        from app.db.database import engine, init_db
+
+        init_db()
+        db_recorder = DBWaitRecorder(engine)
+        accounts = seed_database(args.users, args.sessions_per_user, args.messages_per_session)
+        app_server = ServerThread(app, app_port, probe)
+        app_server.start()
+        app_server.wait_started()
+        base_url = f"http://127.0.0.1:{app_port}"
+    else:
+        base_url = args.base_url
+        accounts = [f"bench{u}" for u in range(args.users)]
+
+    try:
+        scenarios = asyncio.run(drive(args, base_url, accounts))
+    finally:
+        if app_server:
+            app_server.stop()
+        if args.base_url is None:
+            stub.stop()
+
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "scenarios": scenarios,
+        "event_loop_lag_ms": percentiles(probe.samples),
+        "db": db_recorder.report() if db_recorder else None,
+    }
+
+    if results["db"] is None:
+        results["db"] = {"statements": 0, "lock_errors": 0, "write_ms": percentiles([]), "commit_ms": percentiles([])}
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.tolerance)
+        if failures:
+            print("REGRESSION:", file=sys.stderr)
+            for failure in failures:
+                print(f"  {failure}", file=sys.stderr)
+            sys.exit(1)
+        print("no regressions against baseline", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
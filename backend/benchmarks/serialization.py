@@ -0,0 +1,76 @@
+"""Micro-benchmark of message-list serialization, before and after FastJSONResponse.
+
+"before" repeats what GET /chat/sessions/{id}/messages used to do per request:
+build a ChatMessageResponse per ORM row, let FastAPI validate and serialize the
+list against response_model, then render with the stdlib json module. "after"
+selects plain row dicts and renders them once with app.core.serialization.dumps
+(orjson when installed). Run from the backend directory:
+
+    python -m benchmarks.serialization --sizes 1000 10000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.api.models.schemas import ChatMessageResponse
+from app.core.serialization import dumps, orjson
+from app.db.models import ChatMessage
+
+def make_rows(count: int):
+
+    started = datetime(2025, 1, 1)
+    content = "Here is some example output with `code` and a few sentences of text. " * 8
+    orm_rows = []
+    dict_rows = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        created_at = started + timedelta(seconds=i)
+        orm_rows.append(ChatMessage(id=i + 1, session_id=1, role=role, content=content, created_at=created_at))
+        dict_rows.append({"id": i + 1, "role": role, "content": content, "created_at": created_at})
+    return orm_rows, dict_rows
+
+def before(orm_rows, field) -> bytes:
+
+    models = [ChatMessageResponse.model_validate(row) for row in orm_rows]
+    content = asyncio.run(serialize_response(field=field, response_content=models))
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def after(dict_rows) -> bytes:
+
+    return dumps(dict_rows)
+
+def best_of(fn, repeat: int) -> float:
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000.0
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Message list serialization micro-benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    field = create_response_field(name="Response", type_=List[ChatMessageResponse], mode="serialization")
+    print(f"json backend for 'after': {'orjson ' + orjson.__version__ if orjson else 'stdlib json'}")
+    print(f"{'messages':>9} {'before ms':>10} {'after ms':>9} {'speedup':>8} {'bytes':>10}")
+    for size in args.sizes:
+        orm_rows, dict_rows = make_rows(size)
+        assert json.loads(before(orm_rows, field)) == jsonable_encoder(dict_rows)
+        before_ms = best_of(lambda: before(orm_rows, field), args.repeat)
+        after_ms = best_of(lambda: after(dict_rows), args.repeat)
+        print(f"{size:>9} {before_ms:>10.2f} {after_ms:>9.2f} {before_ms / after_ms:>7.1f}x {len(after(dict_rows)):>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Compare baseline and speculative decoding throughput against llama-server.
+
+Run from the backend directory:
+
+    python -m benchmarks.speculative_decoding --url http://localhost:8080
+
+The speculative pass only differs from the baseline when llama-server was started
+with a draft model (``-md``). If the two configurations live on separate servers,
+pass ``--baseline-url`` for the one without a draft model.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from app.services.inference_service import InferenceService
+
+PROMPTS = [
+    "Explain the difference between a process and a thread in three sentences.",
+    "Write a Python function that returns the n-th Fibonacci number iteratively.",
+    "List five tips for writing clear commit messages.",
+    "Summarize how HTTPS protects data in transit.",
+    "Convert this to JSON: name Alice, age 30, languages Python and Go.",
+    "Write a SQL query that returns the ten most recent orders per customer.",
+    "What are the main causes of the seasons on Earth?",
+    "Give a short docker-compose file that runs nginx on port 8080.",
+]
+
+def run_pass(service: InferenceService, label: str, speculative: dict, runs: int, max_tokens: int) -> dict:
+
+    samples = []
+    for _ in range(runs):
+        for prompt in PROMPTS:
+            stats = {}
+            started = time.perf_counter()
+            service.generate_response(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=0.0,
+                top_p=1.0,
+                speculative=speculative,
+                stats=stats
+            )
+            wall = time.perf_counter() - started
+            timings = stats.get("timings") or {}
+            samples.append({
+                "wall_s": wall,
+                "completion_tokens": timings.get("completion_tokens", 0),
+                "tokens_per_second": timings.get("tokens_per_second") or 0.0,
+                "draft_tokens": timings.get("draft_tokens", 0),
+                "draft_accepted": timings.get("draft_accepted", 0),
+            })
+
+    total_tokens = sum(s["completion_tokens"] for s in samples)
+    total_wall = sum(s["wall_s"] for s in samples)
+    draft_tokens = sum(s["draft_tokens"] for s in samples)
+    draft_accepted = sum(s["draft_accepted"] for s in samples)
+
+    return {
+        "label": label,
+        "requests": len(samples),
+        "completion_tokens": total_tokens,
+        "mean_tokens_per_second": statistics.mean(s["tokens_per_second"] for s in samples),
+        "median_tokens_per_second": statistics.median(s["tokens_per_second"] for s in samples),
+        "end_to_end_tokens_per_second": total_tokens / total_wall if total_wall else 0.0,
+        "acceptance_rate": draft_accepted / draft_tokens if draft_tokens else None,
+    }
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8080", help="llama-server with a draft model")
+    parser.add_argument("--baseline-url", default=None, help="separate llama-server without a draft model")
+    parser.add_argument("--runs", type=int, default=3, help="passes over the prompt set")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--draft-max", type=int, default=16)
+    parser.add_argument("--draft-min", type=int, default=0)
+    parser.add_argument("--draft-p-min", type=float, default=0.75)
+    parser.add_argument("--output", default=None, help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    speculative_service = InferenceService()
+    speculative_service.server_url = args.url
+    baseline_service = InferenceService()
+    baseline_service.server_url = args.baseline_url or args.url
+
+    # Warm both servers so the first measured prompt does not pay for a cold cache.
+    for service in (baseline_service, speculative_service):
+        service.generate_response(PROMPTS[0], max_tokens=8, temperature=0.0)
+
+    results = [
+        run_pass(baseline_service, "baseline", {"n_max": 0}, args.runs, args.max_tokens),
+        run_pass(
+            speculative_service,
+            "speculative",
+            {"n_max": args.draft_max, "n_min": args.draft_min, "p_min": args.draft_p_min},
+            args.runs,
+            args.max_tokens
+        ),
+    ]
+
+    print(f"{'mode':<12} {'reqs':>5} {'tokens':>7} {'mean t/s':>9} {'p50 t/s':>8} {'e2e t/s':>8} {'accept':>7}")
+    for r in results:
+        accept = f"{r['acceptance_rate']:.2f}" if r["acceptance_rate"] is not None else "-"
+        print(
+            f"{r['label']:<12} {r['requests']:>5} {r['completion_tokens']:>7} "
+            f"{r['mean_tokens_per_second']:>9.2f} {r['median_tokens_per_second']:>8.2f} "
+            f"{r['end_to_end_tokens_per_second']:>8.2f} {accept:>7}"
+        )
+
+    baseline, speculative = results
+    if baseline["mean_tokens_per_second"]:
+        speedup = speculative["mean_tokens_per_second"] / baseline["mean_tokens_per_second"]
+        print(f"speedup: {speedup:.2f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Fake OpenAI-compatible llama-server for offline benchmarks.
+
+Streams tokens at a fixed rate after a configurable first-token latency and
+models llama-server's parallel slots, so concurrent requests queue the same way
+they do on the real server. Run standalone from the backend directory:
+
+    python -m benchmarks.stub_llama_server --port 8080 --tokens-per-second 20
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "the quick brown fox jumps over the lazy dog while a container restarts "
+    "and the scheduler drains its queue before the next request arrives"
+).split()
+
+def create_app(
+    tokens_per_second: float = 20.0,
+    first_token_latency: float = 0.3,
+    completion_tokens: int = 64,
+    parallel: int = 2,
+    embedding_dim: int = 384
+) -> FastAPI:
+
+    app = FastAPI(title="stub llama-server")
+    slots = asyncio.Semaphore(parallel)
+    state = {"busy": 0, "requests": 0}
+
+    def timings(prompt_n: int, predicted_n: int, prompt_ms: float, predicted_ms: float) -> dict:
+
+        return {
+            "prompt_n": prompt_n,
+            "prompt_ms": prompt_ms,
+            "prompt_per_second": prompt_n / (prompt_ms / 1000.0) if prompt_ms else None,
+            "predicted_n": predicted_n,
+            "predicted_ms": predicted_ms,
+            "predicted_per_second": predicted_n / (predicted_ms / 1000.0) if predicted_ms else None,
+            "cache_n": 0,
+        }
+
+    def prompt_tokens(body: dict) -> int:
+
+        text = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        return len(text) // 4 + 1
+
+    def token_budget(body: dict) -> int:
+
+        max_tokens = body.get("max_tokens") or -1
+        return completion_tokens if max_tokens < 0 else min(completion_tokens, max_tokens)
+
+    @app.get("/health")
+    async def health():
+
+        return {"status": "ok"}
+
+    @app.get("/props")
+    async def props():
+
+        return {
+            "total_slots": parallel,
+            "default_generation_settings": {"n_ctx": 4096},
+            "model_path": "/models/stub.gguf",
+        }
+
+    @app.get("/slots")
+    async def get_slots():
+
+        return [
+            {"id": i, "is_processing": i < state["busy"]}
+            for i in range(parallel)
+        ]
+
+    @app.post("/tokenize")
+    async def tokenize(request: Request):
+
+        body = await request.json()
+        return {"tokens": list(range(len(body.get("content", "")) // 4 + 1))}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        data = []
+        for index, text in enumerate(inputs):
+            # Deterministic pseudo-embedding built from hashed words, so texts sharing
+            # words land close together.
+            vector = [0.0] * embedding_dim
+            for word in str(text).lower().split():
+                digest = hashlib.md5(word.encode()).digest()
+                vector[int.from_bytes(digest[:4], "little") % embedding_dim] += 1.0
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            data.append({"object": "embedding", "index": index, "embedding": [v / norm for v in vector]})
+
+        return {"object": "list", "data": data, "model": "stub"}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+
+        body = await request.json()
+        n_prompt = prompt_tokens(body)
+        n_predict = token_budget(body)
+        interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+        state["requests"] += 1
+
+        if not body.get("stream"):
+            async with slots:
+                state["busy"] += 1
+                try:
+                    started = time.perf_counter()
+                    await asyncio.sleep(first_token_latency + interval * n_predict)
+                    elapsed_ms = (time.perf_counter() - started) * 1000.0
+                finally:
+                    state["busy"] -= 1
+
+            content = " ".join(WORDS[i % len(WORDS)] for i in range(n_predict))
+            return JSONResponse({
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": n_prompt, "completion_tokens": n_predict, "total_tokens": n_prompt + n_predict},
+                "timings": timings(n_prompt, n_predict, first_token_latency * 1000.0, elapsed_ms - first_token_latency * 1000.0),
+            })
+
+        async def event_stream():
+
+            async with slots:
+                state["busy"] += 1
+                try:
+                    await asyncio.sleep(first_token_latency)
+                    started = time.perf_counter()
+                    for i in range(n_predict):
+                        chunk = {
+                            "object": "chat.completion.chunk",
+                            "choices": [{"index": 0, "delta": {"content": WORDS[i % len(WORDS)] + " "}}],
+                        }
+                        yield f"data: {json.dumps(chunk)}\n\n"
+                        await asyncio.sleep(interval)
+                    predicted_ms = (time.perf_counter() - started) * 1000.0
+                finally:
+                    state["busy"] -= 1
+
+            final = {
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": n_prompt, "completion_tokens": n_predict, "total_tokens": n_prompt + n_predict},
+                "timings": timings(n_prompt, n_predict, first_token_latency * 1000.0, predicted_ms),
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+def main():
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible llama-server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tokens-per-second", type=float, default=20.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--parallel", type=int, default=2)
+    args = parser.parse_args()
+
+    app = create_app(
+        tokens_per_second=args.tokens_per_second,
+        first_token_latency=args.first_token_latency,
+        completion_tokens=args.completion_tokens,
+        parallel=args.parallel
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
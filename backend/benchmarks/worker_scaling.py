@@ -0,0 +1,120 @@
+"""Measure how throughput scales with the number of gunicorn workers.
+
+Seeds one SQLite database, starts the stub llama-server, then for each worker
+count launches ``gunicorn -c gunicorn.conf.py app.main:app`` and runs the same
+load as ``benchmarks.load_test`` against it. Run from the backend directory:
+
+    python -m benchmarks.worker_scaling --workers 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load_test import SCENARIOS, ServerThread, drive, free_port
+
+def wait_healthy(url: str, timeout: float = 60.0):
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"backend at {url} did not become healthy")
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Throughput vs. gunicorn worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--auth-requests", type=int, default=32)
+    parser.add_argument("--chat-requests", type=int, default=48)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--sessions-per-user", type=int, default=30)
+    parser.add_argument("--messages-per-session", type=int, default=20)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--completion-tokens", type=int, default=32)
+    parser.add_argument("--parallel", type=int, default=8, help="stub llama-server slots")
+    parser.add_argument("--state-backend", default="sqlite", choices=["sqlite", "redis"])
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pocketllm-scaling-")
+    stub_port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        LLAMA_SERVER_URL=f"http://127.0.0.1:{stub_port}",
+        STATE_BACKEND=args.state_backend,
+        STATE_SQLITE_PATH=os.path.join(workdir, "state.db"),
+        SUMMARY_ENABLED="false",
+        PYTHONUNBUFFERED="1",
+    )
+    os.environ.update({k: env[k] for k in ("DATABASE_URL", "LLAMA_SERVER_URL", "STATE_BACKEND", "STATE_SQLITE_PATH")})
+
+    from benchmarks.load_test import seed_database
+    from benchmarks.stub_llama_server import create_app as create_stub
+    from app.db.database import init_db
+
+    stub = ServerThread(
+        create_stub(
+            tokens_per_second=args.tokens_per_second,
+            first_token_latency=args.first_token_latency,
+            completion_tokens=args.completion_tokens,
+            parallel=args.parallel
+        ),
+        stub_port
+    )
+    stub.start()
+    stub.wait_started()
+
+    init_db()
+    accounts = seed_database(args.users, args.sessions_per_user, args.messages_per_session)
+
+    results = {}
+    try:
+        for workers in args.workers:
+            port = free_port()
+            process = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+                env=dict(env, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}"),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                wait_healthy(base_url)
+                print(f"workers={workers}", file=sys.stderr)
+                results[workers] = asyncio.run(drive(args, base_url, accounts))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        stub.stop()
+
+    print(f"{'scenario':<10} " + " ".join(f"{f'{w}w rps':>9} {f'{w}w p95':>9}" for w in args.workers))
+    for name in args.scenarios:
+        cells = []
+        for workers in args.workers:
+            r = results[workers][name]
+            cells.append(f"{r['throughput_rps'] or 0:>9.2f} {r['latency_ms']['p95'] or 0:>9.1f}")
+        print(f"{name:<10} " + " ".join(cells))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({str(k): v for k, v in results.items()}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Sustained chat turns per second on SQLite, per-statement commits vs write-behind.
+
+Every turn does the database work of one streamed chat turn: the user
+message, the assistant reply with its inference metrics and, on the first
+turn of a session, the title. "sync" commits each step on the event loop the
+way the endpoints used to; "write-behind" submits the two steps to
+app.services.persistence_service.write_behind, which commits the writes of all
+concurrent turns together on a worker thread. Run from the backend directory:
+
+    python -m benchmarks.write_behind --turns 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+def configure(path: str):
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["WRITE_BEHIND_ENABLED"] = "true"
+
+def seed(sessions: int):
+
+    from app.db.database import SessionLocal, init_db
+    from app.db.models import User, ChatSession
+
+    init_db()
+    db = SessionLocal()
+    user = User(username="bench", email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    ids = []
+    for i in range(sessions):
+        session = ChatSession(user_id=user.id, title="New Chat")
+        db.add(session)
+        db.flush()
+        ids.append(session.id)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id, ids
+
+STATS = {"timings": {"prompt_tokens": 40, "completion_tokens": 120, "tokens_per_second": 12.0}, "params": {"max_tokens": 512}}
+REPLY = "Here is an answer with a few sentences of text and some `code`. " * 6
+
+def sync_turn(session_id: int, user_id: int):
+
+    from app.db.database import SessionLocal
+    from app.services.chat_service import ChatService
+    from app.services.metrics_service import MetricsService
+
+    db = SessionLocal()
+    try:
+        user_message = ChatService.add_message(db, session_id, "user", "Explain the write path.")
+        assistant = ChatService.add_message(db, session_id, "assistant", REPLY, parent_id=user_message.id)
+        MetricsService.record_inference(db, assistant.id, user_id, session_id, STATS, "normal", streamed=True)
+        if ChatService.is_first_message_in_session(db, session_id):
+            ChatService.update_session_title(db, session_id, "Explain the write path.")
+    finally:
+        db.close()
+
+async def write_behind_turn(session_id: int, user_id: int):
+
+    from app.services.chat_service import ChatService
+    from app.services.metrics_service import MetricsService
+    from app.services.persistence_service import write_behind
+
+    user_message = await write_behind.submit(
+        lambda db: ChatService.add_message(db, session_id, "user", "Explain the write path.", commit=False)
+    )
+
+    def finish(db):
+        assistant = ChatService.add_message(db, session_id, "assistant", REPLY, parent_id=user_message.id, commit=False)
+        MetricsService.record_inference(db, assistant.id, user_id, session_id, STATS, "normal", streamed=True, commit=False)
+        if ChatService.is_first_message_in_session(db, session_id):
+            ChatService.update_session_title(db, session_id, "Explain the write path.", commit=False)
+        return assistant
+
+    await write_behind.submit(finish)
+
+async def run(mode: str, turns: int, concurrency: int, session_ids, user_id: int) -> float:
+
+    from app.services.persistence_service import write_behind
+
+    if mode == "write-behind":
+        write_behind.start()
+    remaining = iter(range(turns))
+
+    async def client(n: int):
+        for i in remaining:
+            session_id = session_ids[(n + i) % len(session_ids)]
+            if mode == "sync":
+                sync_turn(session_id, user_id)
+                # Yield like the real handler does between its awaits.
+                await asyncio.sleep(0)
+            else:
+                await write_behind_turn(session_id, user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(n) for n in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    if mode == "write-behind":
+        stats = write_behind.stats()
+        await write_behind.stop()
+        print(f"    batches={stats['batches']} avg_batch={stats['avg_batch']} max_batch={stats['max_batch']}")
+    return elapsed
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Write-behind group commit benchmark")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--sessions", type=int, default=64)
+    parser.add_argument("--mode", choices=["sync", "write-behind"], default=None,
+                        help="run one mode (each mode runs in its own process by default)")
+    args = parser.parse_args()
+
+    if args.mode is None:
+        # Settings and the engine are bound at import, so each mode gets a
+        # fresh interpreter and database.
+        import subprocess
+        for mode in ("sync", "write-behind"):
+            subprocess.run([sys.executable, "-m", "benchmarks.write_behind", "--mode", mode,
+                            "--turns", str(args.turns), "--concurrency", str(args.concurrency),
+                            "--sessions", str(args.sessions)], check=True)
+        return
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure(os.path.join(scratch, "bench.db"))
+        user_id, session_ids = seed(args.sessions)
+        elapsed = asyncio.run(run(args.mode, args.turns, args.concurrency, session_ids, user_id))
+        print(f"{args.mode:>13}: {args.turns} turns in {elapsed:.2f}s = {args.turns / elapsed:.1f} turns/s")
+
+if __name__ == "__main__":
+    main()
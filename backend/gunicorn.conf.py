@@ -0,0 +1,29 @@
+# Gunicorn settings for running the API with several uvicorn worker processes.
+# Each worker has its own event loop, httpx clients and in-process caches; state that
+# must agree across workers (health, locks, counters) goes through app.core.state,
+# which uses Redis when REDIS_URL is set and a shared SQLite file otherwise.
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# SSE responses can stay open for minutes while the model generates.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Recycle workers occasionally to bound memory growth from long-lived processes.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = "-"
+errorlog = "-"
+
+def on_starting(server):
+
+    # Create and migrate the schema once in the master before workers start, so
+    # workers never race on CREATE TABLE / ALTER TABLE.
+    from app.db.database import init_db
+
+    init_db()
@@ -78,30 +78,40 @@ export const ChatPage: React.FC = () => {
     try {
       if (!currentSession) return;
 
-      // Find the index of the message being edited
       const messageIndex = currentSession.messages.findIndex(m => m.id === messageId);
       if (messageIndex === -1) return;
+      const edited = currentSession.messages[messageIndex];
 
-      // Delete messages from the backend first
-      await chatService.deleteMessagesFrom(currentSession.id, messageId);
-
-      // Update UI - remove the edited message and all messages after it
-      const updatedMessages = currentSession.messages.slice(0, messageIndex);
+      // The edit becomes a sibling branch of the original message; the old
+      // turns stay on the server and can be switched back to.
       setCurrentSession({
         ...currentSession,
-        messages: updatedMessages,
+        messages: currentSession.messages.slice(0, messageIndex),
       });
 
-      // Send the edited message as a new message
       await sendMessage({
         prompt: newContent,
         session_id: currentSession.id,
+        parent_message_id: edited.parent_id ?? 0,
       });
+
+      // Reload to pick up the new branch counts.
+      await loadSession(currentSession.id);
     } catch (error) {
       console.error('Error editing message:', error);
     }
   };
 
+  const handleSwitchBranch = async (messageId: number) => {
+    try {
+      if (!currentSession) return;
+      const session = await chatService.switchBranch(currentSession.id, messageId);
+      setCurrentSession(session);
+    } catch (error) {
+      console.error('Error switching branch:', error);
+    }
+  };
+
   const handleRenameSession = async (sessionId: number, newTitle: string) => {
     try {
       await renameSession(sessionId, newTitle);
@@ -173,6 +183,7 @@ export const ChatPage: React.FC = () => {
           hasSession={!!currentSession}
           onNewChat={handleNewChat}
           onEditMessage={handleEditMessage}
+          onSwitchBranch={handleSwitchBranch}
         />
 
         {currentSession && (
@@ -10,10 +10,24 @@ interface MessageProps {
   createdAt?: string;
   onEdit?: (newContent: string) => void;
   isGenerating?: boolean;
+  messageId?: number;
+  siblingIds?: number[];
+  onSwitchBranch?: (messageId: number) => void;
 }
 
-export const Message: React.FC<MessageProps> = ({ role, content, createdAt, onEdit, isGenerating }) => {
+export const Message: React.FC<MessageProps> = ({
+  role,
+  content,
+  createdAt,
+  onEdit,
+  isGenerating,
+  messageId,
+  siblingIds,
+  onSwitchBranch,
+}) => {
   const isUser = role === 'user';
+  const branchIndex = siblingIds && messageId !== undefined ? siblingIds.indexOf(messageId) : -1;
+  const hasBranches = !!siblingIds && siblingIds.length > 1 && branchIndex !== -1 && !!onSwitchBranch;
   const [isEditing, setIsEditing] = useState(false);
   const [editedContent, setEditedContent] = useState(content);
   const [copied, setCopied] = useState(false);
@@ -108,6 +122,34 @@ export const Message: React.FC<MessageProps> = ({ role, content, createdAt, onEd
 
           {}
           <div className="flex gap-2">
+            {}
+            {hasBranches && (
+              <div
+                className={cn(
+                  "flex items-center gap-1 text-xs",
+                  isUser ? "text-white/80" : "text-gray-500 dark:text-gray-400"
+                )}
+              >
+                <button
+                  onClick={() => onSwitchBranch!(siblingIds![branchIndex - 1])}
+                  disabled={branchIndex === 0 || isGenerating}
+                  className="px-1 disabled:opacity-40"
+                  title="Previous version"
+                >
+                  ‹
+                </button>
+                <span>{branchIndex + 1}/{siblingIds!.length}</span>
+                <button
+                  onClick={() => onSwitchBranch!(siblingIds![branchIndex + 1])}
+                  disabled={branchIndex === siblingIds!.length - 1 || isGenerating}
+                  className="px-1 disabled:opacity-40"
+                  title="Next version"
+                >
+                  ›
+                </button>
+              </div>
+            )}
+
             {}
             {!isUser && !isEditing && !isGenerating && (
               <button
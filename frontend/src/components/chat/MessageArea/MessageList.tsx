@@ -8,6 +8,7 @@ interface ChatMessage {
   role: 'user' | 'assistant';
   content: string;
   created_at: string;
+  sibling_ids?: number[];
 }
 
 interface MessageListProps {
@@ -18,6 +19,7 @@ interface MessageListProps {
   hasSession: boolean;
   onNewChat?: () => void;
   onEditMessage?: (messageId: number, messageContent: string) => void;
+  onSwitchBranch?: (messageId: number) => void;
 }
 
 export const MessageList: React.FC<MessageListProps> = ({
@@ -28,6 +30,7 @@ export const MessageList: React.FC<MessageListProps> = ({
   hasSession,
   onNewChat,
   onEditMessage,
+  onSwitchBranch,
 }) => {
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
@@ -60,6 +63,9 @@ export const MessageList: React.FC<MessageListProps> = ({
             ? (newContent: string) => onEditMessage(message.id, newContent)
             : undefined}
           isGenerating={isGenerating}
+          siblingIds={message.sibling_ids}
+          messageId={message.id}
+          onSwitchBranch={onSwitchBranch}
         />
       ))}
 
@@ -1,6 +1,7 @@
-import React, { createContext, useState, useRef, ReactNode } from 'react';
+import React, { createContext, useState, useRef, useEffect, ReactNode } from 'react';
 import { ChatSession, ChatSessionList, ChatMessage, InferenceRequest } from '../types/api';
 import { chatService } from '../services/chatService';
+import { chatSocket } from '../services/chatSocket';
 
 interface ChatContextType {
   currentSession: ChatSession | null;
@@ -35,6 +36,8 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
   const [generatingSessionId, setGeneratingSessionId] = useState<number | null>(null);
   const [error, setError] = useState<string | null>(null);
   const abortControllerRef = useRef<AbortController | null>(null);
+  const cancelStreamRef = useRef<(() => void) | null>(null);
+  const sidebarTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
   const partialDataRef = useRef<{ sessionId: number | null; userMessageId: number | null; partialResponse: string }>({
     sessionId: null,
     userMessageId: null,
@@ -45,6 +48,8 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
     try {
       setIsLoading(true);
       setError(null);
+      // Opens the push channel once logged in; plain HTTP keeps working without it.
+      chatSocket.connect().catch(() => undefined);
       const data = await chatService.getSessions();
       setSessions(data);
     } catch (err: any) {
@@ -69,6 +74,25 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
     }
   };
 
+  // The server says when the sidebar changed (in this tab or any other), so
+  // the list is refetched once per burst of changes instead of after every turn.
+  useEffect(() => {
+    const unsubscribeSidebar = chatSocket.onSidebarChange(() => {
+      if (sidebarTimerRef.current) clearTimeout(sidebarTimerRef.current);
+      sidebarTimerRef.current = setTimeout(() => {
+        chatService.getSessions().then(setSessions).catch(() => undefined);
+      }, 300);
+    });
+    const unsubscribeTitle = chatSocket.onTitle((sessionId, title) => {
+      setCurrentSession((prev) => (prev && prev.id === sessionId ? { ...prev, title } : prev));
+    });
+    return () => {
+      unsubscribeSidebar();
+      unsubscribeTitle();
+      if (sidebarTimerRef.current) clearTimeout(sidebarTimerRef.current);
+    };
+  }, []);
+
   const createNewSession = async (title?: string) => {
     try {
       setIsLoading(true);
@@ -137,6 +161,13 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
   };
 
   const stopGeneration = async () => {
+    if (cancelStreamRef.current) {
+      // The server stops the generation and saves the partial reply; its done
+      // frame carries the new message id.
+      cancelStreamRef.current();
+      cancelStreamRef.current = null;
+      return;
+    }
     if (abortControllerRef.current) {
       abortControllerRef.current.abort();
       abortControllerRef.current = null;
@@ -191,6 +222,8 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
       abortControllerRef.current.abort();
       abortControllerRef.current = null;
     }
+    cancelStreamRef.current = null;
+    chatSocket.close();
     partialDataRef.current = { sessionId: null, userMessageId: null, partialResponse: '' };
   };
 
@@ -236,65 +269,65 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
         };
       });
 
-      await chatService.inferenceStream(
-        request,
+      const onToken = (token: string) => {
+        streamingContent += token;
 
-        (token: string) => {
-          streamingContent += token;
+        partialDataRef.current.partialResponse = streamingContent;
 
-          partialDataRef.current.partialResponse = streamingContent;
+        setCurrentSession((prev) => {
+          if (!prev) return prev;
+          const messages = [...prev.messages];
 
-          setCurrentSession((prev) => {
-            if (!prev) return prev;
-            const messages = [...prev.messages];
+          const lastMsg = messages[messages.length - 1];
+          const isStreamingMessage = lastMsg && lastMsg.id === streamingMessageId;
 
-            const lastMsg = messages[messages.length - 1];
-            const isStreamingMessage = lastMsg && lastMsg.id === streamingMessageId;
+          if (!isStreamingMessage) {
 
-            if (!isStreamingMessage) {
+            messages.push({
+              id: streamingMessageId,
+              role: "assistant",
+              content: streamingContent,
+              created_at: new Date().toISOString()
+            });
+          } else {
 
-              messages.push({
-                id: streamingMessageId,
-                role: "assistant",
-                content: streamingContent,
-                created_at: new Date().toISOString()
-              });
-            } else {
+            messages[messages.length - 1] = {
+              ...lastMsg,
+              content: streamingContent
+            };
+          }
 
-              messages[messages.length - 1] = {
-                ...lastMsg,
-                content: streamingContent
-              };
-            }
+          return { ...prev, messages };
+        });
+      };
 
-            return { ...prev, messages };
-          });
-        },
-
-        (data) => {
-          sessionId = data.session_id;
-
-          partialDataRef.current.sessionId = sessionId;
-          partialDataRef.current.userMessageId = data.user_message_id;
-
-          // Update temp user message ID with real ID from backend
-          setCurrentSession((prev) => {
-            if (!prev) return prev;
-            const messages = prev.messages.map(msg =>
-              msg.id === tempUserMessageId
-                ? { ...msg, id: data.user_message_id }
-                : msg
-            );
-            return { ...prev, messages };
-          });
-        },
+      const onStart = (data: { session_id: number; user_message_id: number }) => {
+        sessionId = data.session_id;
+
+        partialDataRef.current.sessionId = sessionId;
+        partialDataRef.current.userMessageId = data.user_message_id;
+
+        // Update temp user message ID with real ID from backend
+        setCurrentSession((prev) => {
+          if (!prev) return prev;
+          const messages = prev.messages.map(msg =>
+            msg.id === tempUserMessageId
+              ? { ...msg, id: data.user_message_id }
+              : msg
+          );
+          return { ...prev, messages };
+        });
+      };
 
-        (data) => {
-          if (sessionId) {
+      const onDone = (data: { assistant_message_id: number | null; full_response: string }) => {
+        if (sessionId) {
 
-            setIsGenerating(false);
-            setGeneratingSessionId(null);
+          setIsGenerating(false);
+          setGeneratingSessionId(null);
 
+          // A generation cancelled before its first token stores no reply.
+          if (data.assistant_message_id !== null) {
+            const assistantMessageId = data.assistant_message_id;
             setCurrentSession((prev) => {
               if (!prev) return prev;
               const messages = [...prev.messages];
@@ -302,26 +335,48 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
               // Only update assistant message ID (user message ID already updated in onStart)
               messages[messages.length - 1] = {
                 ...messages[messages.length - 1],
-                id: data.assistant_message_id,
+                id: assistantMessageId,
                 content: data.full_response
               };
               return { ...prev, messages };
             });
+          }
 
-            partialDataRef.current = { sessionId: null, userMessageId: null, partialResponse: '' };
+          partialDataRef.current = { sessionId: null, userMessageId: null, partialResponse: '' };
 
+          // Over the WebSocket the server pushes sidebar changes itself.
+          if (!chatSocket.isConnected()) {
             setTimeout(() => {
               loadSessions();
             }, 1000);
           }
-        },
+        }
+      };
 
-        (errorMsg) => {
-          setError(errorMsg);
-        },
+      const onError = (errorMsg: string) => {
+        setError(errorMsg);
+      };
 
-        abortControllerRef.current.signal
-      );
+      let socketStream: { done: Promise<void>; cancel: () => void } | null = null;
+      try {
+        socketStream = await chatSocket.generate(request, { onToken, onStart, onDone, onError });
+      } catch {
+        socketStream = null;
+      }
+
+      if (socketStream) {
+        cancelStreamRef.current = socketStream.cancel;
+        await socketStream.done;
+      } else {
+        await chatService.inferenceStream(
+          request,
+          onToken,
+          onStart,
+          onDone,
+          onError,
+          abortControllerRef.current.signal
+        );
+      }
 
     } catch (err: any) {
       setError(err.message || 'Failed to send message');
@@ -331,6 +386,7 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
       setIsGenerating(false);
       setGeneratingSessionId(null);
       abortControllerRef.current = null;
+      cancelStreamRef.current = null;
     }
   };
 
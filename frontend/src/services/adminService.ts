@@ -16,6 +16,23 @@ export interface SystemStats {
   inactive_users: number;
   admin_users: number;
   total_chat_sessions: number;
+  total_messages: number;
+}
+
+export interface UsagePoint {
+  bucket: string;
+  messages: number;
+  sessions: number;
+  requests: number;
+  prompt_tokens: number;
+  completion_tokens: number;
+  active_users?: number;
+}
+
+export interface UsageTimeseries {
+  period: 'hour' | 'day';
+  user_id: number | null;
+  series: UsagePoint[];
 }
 
 export interface AdminUserUpdate {
@@ -50,5 +67,12 @@ export const adminService = {
   async getSystemStats(): Promise<SystemStats> {
     const response = await apiClient.get<SystemStats>('/admin/stats');
     return response.data;
+  },
+
+  async getStatsTimeseries(period: 'hour' | 'day' = 'hour', buckets: number = 24, userId?: number): Promise<UsageTimeseries> {
+    const response = await apiClient.get<UsageTimeseries>('/admin/stats/timeseries', {
+      params: { period, buckets, user_id: userId }
+    });
+    return response.data;
   }
 };
@@ -3,9 +3,12 @@ import {
   InferenceRequest,
   InferenceResponse,
   ChatSession,
+  ChatSessionSummary,
   ChatSessionList,
   ChatSessionCreate,
   ChatMessage,
+  InferenceTimings,
+  InferenceMode,
   MessageResponse
 } from '../types/api';
 
@@ -19,8 +22,8 @@ export const chatService = {
   async inferenceStream(
     request: InferenceRequest,
     onToken: (token: string) => void,
-    onStart?: (data: { session_id: number; user_message_id: number }) => void,
-    onDone?: (data: { assistant_message_id: number; full_response: string }) => void,
+    onStart?: (data: { session_id: number; user_message_id: number; mode: InferenceMode }) => void,
+    onDone?: (data: { assistant_message_id: number; full_response: string; timings?: InferenceTimings | null; mode: InferenceMode }) => void,
     onError?: (error: string) => void,
     abortSignal?: AbortSignal
   ): Promise<void> {
@@ -112,8 +115,8 @@ export const chatService = {
     return response.data;
   },
 
-  async renameSession(sessionId: number, title: string): Promise<ChatSession> {
-    const response = await apiClient.patch<ChatSession>(`/chat/sessions/${sessionId}`, { title });
+  async renameSession(sessionId: number, title: string): Promise<ChatSessionSummary> {
+    const response = await apiClient.patch<ChatSessionSummary>(`/chat/sessions/${sessionId}`, { title });
     return response.data;
   },
 
@@ -138,6 +141,11 @@ export const chatService = {
     return response.data;
   },
 
+  async switchBranch(sessionId: number, messageId: number): Promise<ChatSession> {
+    const response = await apiClient.put<ChatSession>(`/chat/sessions/${sessionId}/branch`, { message_id: messageId });
+    return response.data;
+  },
+
   async deleteMessagesFrom(sessionId: number, messageId: number): Promise<MessageResponse> {
     const response = await apiClient.delete<MessageResponse>(`/chat/sessions/${sessionId}/messages/${messageId}`);
     return response.data;
@@ -0,0 +1,168 @@
+import { InferenceRequest, InferenceMode, InferenceTimings } from '../types/api';
+
+// One WebSocket per tab (/api/chat/ws). Generations are multiplexed by id and
+// the server pushes title and sidebar changes. Server frames are
+// [kind, stream id, data] arrays; client frames are objects with an op.
+type Frame = [string, string | number | null, any];
+
+export interface SocketStreamHandlers {
+  onToken: (token: string) => void;
+  onStart?: (data: { session_id: number; user_message_id: number; mode: InferenceMode }) => void;
+  onDone?: (data: {
+    assistant_message_id: number | null;
+    full_response: string;
+    timings?: InferenceTimings | null;
+    mode: InferenceMode;
+    cancelled?: boolean;
+  }) => void;
+  onError?: (error: string) => void;
+}
+
+interface PendingStream extends SocketStreamHandlers {
+  text: string;
+  resolve: () => void;
+  reject: (error: Error) => void;
+}
+
+let socket: WebSocket | null = null;
+let connecting: Promise<WebSocket> | null = null;
+let retryDelay = 1000;
+let stopped = false;
+let nextId = 1;
+const streams = new Map<number, PendingStream>();
+const sidebarListeners = new Set<() => void>();
+const titleListeners = new Set<(sessionId: number, title: string) => void>();
+
+const errorMessage = (data: any): string =>
+  typeof data?.detail === 'string' ? data.detail : JSON.stringify(data?.detail ?? data);
+
+function handleFrame(kind: string, id: string | number | null, data: any) {
+  if (kind === 'v') {
+    sidebarListeners.forEach((listener) => listener());
+    return;
+  }
+  if (kind === 'n') {
+    titleListeners.forEach((listener) => listener(data.session_id, data.title));
+    return;
+  }
+
+  const stream = typeof id === 'number' ? streams.get(id) : undefined;
+  if (!stream || typeof id !== 'number') return;
+
+  switch (kind) {
+    case 's':
+      stream.onStart?.(data);
+      break;
+    case 't':
+      stream.text += data;
+      stream.onToken(data);
+      break;
+    case 'd':
+      streams.delete(id);
+      stream.onDone?.({ ...data, full_response: stream.text });
+      stream.resolve();
+      break;
+    case 'e':
+      streams.delete(id);
+      stream.onError?.(errorMessage(data));
+      stream.reject(new Error(errorMessage(data)));
+      break;
+  }
+}
+
+function connect(): Promise<WebSocket> {
+  stopped = false;
+  if (socket) return Promise.resolve(socket);
+  if (connecting) return connecting;
+
+  connecting = new Promise<WebSocket>((resolve, reject) => {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const ws = new WebSocket(`${protocol}//${window.location.host}/api/chat/ws`);
+
+    ws.onopen = () => {
+      ws.send(JSON.stringify({ op: 'auth', token: localStorage.getItem('access_token') }));
+    };
+
+    ws.onmessage = (event) => {
+      const [kind, id, data] = JSON.parse(event.data) as Frame;
+      if (kind === 'w') {
+        socket = ws;
+        connecting = null;
+        retryDelay = 1000;
+        resolve(ws);
+        return;
+      }
+      handleFrame(kind, id, data);
+    };
+
+    ws.onclose = (event) => {
+      const wasOpen = socket === ws;
+      socket = null;
+      connecting = null;
+      if (!wasOpen) reject(new Error('WebSocket unavailable'));
+
+      streams.forEach((stream) => {
+        stream.onError?.('Connection lost');
+        stream.reject(new Error('Connection lost'));
+      });
+      streams.clear();
+
+      // Keep the push channel up while someone listens, unless the token was
+      // rejected or the user logged out.
+      if (!stopped && event.code !== 4401 && sidebarListeners.size > 0) {
+        setTimeout(() => connect().catch(() => undefined), retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      }
+    };
+  });
+  return connecting;
+}
+
+export const chatSocket = {
+
+  connect(): Promise<WebSocket> {
+    return connect();
+  },
+
+  isConnected(): boolean {
+    return socket !== null && socket.readyState === WebSocket.OPEN;
+  },
+
+  // Rejects when no socket can be opened, so callers can fall back to SSE.
+  async generate(request: InferenceRequest, handlers: SocketStreamHandlers): Promise<{ done: Promise<void>; cancel: () => void }> {
+    const ws = await connect();
+    const id = nextId++;
+    const done = new Promise<void>((resolve, reject) => {
+      streams.set(id, { ...handlers, text: '', resolve, reject });
+    });
+    ws.send(JSON.stringify({ op: 'generate', id, ...request }));
+
+    return {
+      done,
+      cancel: () => {
+        if (ws.readyState === WebSocket.OPEN) {
+          ws.send(JSON.stringify({ op: 'cancel', id }));
+        }
+      }
+    };
+  },
+
+  onSidebarChange(listener: () => void): () => void {
+    sidebarListeners.add(listener);
+    return () => {
+      sidebarListeners.delete(listener);
+    };
+  },
+
+  onTitle(listener: (sessionId: number, title: string) => void): () => void {
+    titleListeners.add(listener);
+    return () => {
+      titleListeners.delete(listener);
+    };
+  },
+
+  close(): void {
+    stopped = true;
+    socket?.close();
+  }
+};
@@ -30,13 +30,18 @@ export interface ChatMessage {
   role: 'user' | 'assistant';
   content: string;
   created_at: string;
+  parent_id?: number | null;
+  sibling_ids?: number[];
 }
 
-export interface ChatSession {
+export interface ChatSessionSummary {
   id: number;
   title: string;
   created_at: string;
   updated_at: string;
+}
+
+export interface ChatSession extends ChatSessionSummary {
   messages: ChatMessage[];
 }
 
@@ -58,6 +63,30 @@ export interface InferenceRequest {
   max_tokens?: number;
   temperature?: number;
   top_p?: number;
+  n_probs?: number;
+  draft_max?: number;
+  draft_min?: number;
+  draft_p_min?: number;
+  priority?: 'interactive' | 'batch';
+  model?: string;
+  seed?: number;
+  parent_message_id?: number;
+  regenerate?: boolean;
+}
+
+export type InferenceMode = 'normal' | 'degraded' | 'critical';
+
+export interface InferenceTimings {
+  prompt_tokens: number;
+  prompt_ms: number;
+  prompt_tokens_per_second: number | null;
+  completion_tokens: number;
+  generation_ms: number;
+  tokens_per_second: number | null;
+  cached_tokens: number;
+  draft_tokens: number;
+  draft_accepted: number;
+  acceptance_rate: number | null;
 }
 
 export interface InferenceResponse {
@@ -65,6 +94,8 @@ export interface InferenceResponse {
   session_id: number;
   user_message: ChatMessage;
   assistant_message: ChatMessage;
+  timings?: InferenceTimings | null;
+  mode: InferenceMode;
 }
 
 export interface MessageResponse {